@@ -1,111 +1,518 @@
+import argparse
 import json
-import sys
 import os
 import glob
-from collections import Counter
+import gzip
+import re
+import statistics
+import time
+from collections import Counter, defaultdict
+from concurrent.futures import ProcessPoolExecutor
+
+# Motor incremental de análise dos logs JSONL do bot.
+# - Cada arquivo é dividido em trechos de até TAMANHO_TRECHO bytes, alinhados
+#   em quebras de linha, processados em paralelo por um pool de processos.
+# - Linhas sem '"action"' são descartadas sem decodificar o JSON, e eventos que
+#   o relatório só conta têm a action lida por regex; json.loads fica para os
+#   eventos com campos usados no relatório (ACOES_COM_CAMPOS).
+# - Um checkpoint guarda, por arquivo, até qual byte já foi lido e as métricas
+#   parciais até ali; na próxima execução só os bytes novos são lidos. Se o
+#   arquivo foi truncado ou substituído (outro inode), ele é relido do início.
+# - Uma última linha sem '\n' (ainda sendo escrita) fica para a próxima execução.
+# - Arquivos já comprimidos pelo pipeline de logs (.jsonl.gz) são lidos por
+#   inteiro num trecho só, continuando de onde o .jsonl original tinha parado.
+
+TAMANHO_TRECHO = 64 * 1024 * 1024
+FILTRO_ACTION = '"action"'
+ACTION_DO_EVENTO = re.compile(r'^\{.*"action": *"([^"\\]*)".*\}$')
+ACOES_COM_CAMPOS = frozenset({
+    'interview_started', 'user_feedback_received', 'feedback_delivered', 'feedback_stream_first_chunk',
+    'feedback_stream_complete', 'transcription_cache_hit', 'pro_email_collected',
+})
+NOME_CHECKPOINT = ".analisar_logs_checkpoint.json"
+VERSAO_CHECKPOINT = 1
+
+
+class Agregado:
+    """Métricas parciais de um trecho de log, somáveis entre trechos e arquivos."""
+
+    def __init__(self):
+        self.metricas = Counter()
+        self.usuarios_unicos_entrevista = set()
+        self.depoimentos = []
+        self.emails = []
+        self.latencias_feedback = defaultdict(list)
+        self.tempos_streaming = defaultdict(list)
+        self.segundos_stt_economizados = 0.0
+
+    def registrar(self, evento):
+        action = evento.get('action', '')
+        user_id = evento.get('user_id', '')
+
+        if action:
+            self.metricas[action] += 1
+
+        if action == 'interview_started' and user_id:
+            self.usuarios_unicos_entrevista.add(user_id)
+
+        if action == 'user_feedback_received':
+            depoimento = evento.get('depoimento', '')
+            if depoimento:
+                self.depoimentos.append(depoimento)
+
+        if action == 'feedback_delivered' and evento.get('perceived_latency_ms') is not None:
+            self.latencias_feedback[evento.get('feedback_mode', 'completo')].append(evento['perceived_latency_ms'])
+
+        if action == 'feedback_stream_first_chunk':
+            self.tempos_streaming['primeiro_trecho'].append(evento.get('time_to_first_chunk_ms', 0))
+        if action == 'feedback_stream_complete':
+            self.tempos_streaming['completo'].append(evento.get('time_to_complete_ms', 0))
+
+        if action == 'transcription_cache_hit':
+            self.segundos_stt_economizados += evento.get('audio_seconds_saved') or 0
+
+        if action == 'pro_email_collected':
+            email = evento.get('email', '')
+            if email:
+                self.emails.append(email)
+
+    def juntar(self, outro):
+        """Acrescenta as métricas de `outro`, que vem depois deste no log."""
+        self.metricas.update(outro.metricas)
+        self.usuarios_unicos_entrevista |= outro.usuarios_unicos_entrevista
+        self.depoimentos.extend(outro.depoimentos)
+        self.emails.extend(outro.emails)
+        for modo, latencias in outro.latencias_feedback.items():
+            self.latencias_feedback[modo].extend(latencias)
+        for etapa, tempos in outro.tempos_streaming.items():
+            self.tempos_streaming[etapa].extend(tempos)
+        self.segundos_stt_economizados += outro.segundos_stt_economizados
+        return self
+
+    def para_dict(self):
+        return {
+            "metricas": dict(self.metricas),
+            "usuarios_unicos_entrevista": sorted(self.usuarios_unicos_entrevista),
+            "depoimentos": self.depoimentos,
+            "emails": self.emails,
+            "latencias_feedback": dict(self.latencias_feedback),
+            "tempos_streaming": dict(self.tempos_streaming),
+            "segundos_stt_economizados": self.segundos_stt_economizados,
+        }
+
+    @classmethod
+    def de_dict(cls, dados):
+        agregado = cls()
+        agregado.metricas.update(dados["metricas"])
+        agregado.usuarios_unicos_entrevista.update(dados["usuarios_unicos_entrevista"])
+        agregado.depoimentos.extend(dados["depoimentos"])
+        agregado.emails.extend(dados["emails"])
+        agregado.latencias_feedback.update(dados["latencias_feedback"])
+        agregado.tempos_streaming.update(dados["tempos_streaming"])
+        agregado.segundos_stt_economizados = dados["segundos_stt_economizados"]
+        return agregado
+
+
+def ler_trecho(arquivo, inicio, fim):
+    """Texto entre os bytes `inicio` e `fim` do arquivo (descomprimido, se for .gz)."""
+    with (gzip.open if arquivo.endswith('.gz') else open)(arquivo, 'rb') as f:
+        f.seek(inicio)
+        return f.read(fim - inicio).decode('utf-8', errors='replace')
+
+
+def tamanho_descomprimido(arquivo):
+    """Tamanho do conteúdo do arquivo; para .gz, lido do rodapé (ISIZE, módulo 4 GiB)."""
+    if not arquivo.endswith('.gz'):
+        return os.path.getsize(arquivo)
+    with open(arquivo, 'rb') as f:
+        f.seek(-4, os.SEEK_END)
+        return int.from_bytes(f.read(4), 'little')
+
+
+def ordem_dos_arquivos(arquivo):
+    """bot_metrics_DIA.jsonl antes de bot_metrics_DIA.1.jsonl, comprimidos ou não."""
+    encontrado = re.match(r'^(.*?)(?:\.(\d+))?\.jsonl(?:\.gz)?$', os.path.basename(arquivo))
+    return (encontrado.group(1), int(encontrado.group(2) or 0)) if encontrado else (os.path.basename(arquivo), 0)
+
+
+def posicao_salva(checkpoint, arquivo, info):
+    """
+    Entrada do checkpoint de onde continuar a leitura do arquivo: None para
+    ler do início, False se o arquivo mudou (truncado ou substituído). Um
+    .jsonl.gz continua a entrada do .jsonl que foi comprimido nele.
+    """
+    anterior = checkpoint.get(os.path.abspath(arquivo))
+    if anterior is None and arquivo.endswith('.gz'):
+        original = checkpoint.get(os.path.abspath(arquivo[:-3]))
+        return {**original, "inode": info.st_ino} if original else None
+    if anterior is None:
+        return None
+    if anterior["inode"] != info.st_ino or anterior["offset"] > tamanho_descomprimido(arquivo):
+        return False
+    return anterior
+
+
+def processar_trecho(arquivo, inicio, fim):
+    """Agrega as linhas completas entre os bytes `inicio` e `fim` de um arquivo (roda nos processos do pool)."""
+    agregado = Agregado()
+    dados = ler_trecho(arquivo, inicio, fim)
+    for linha in dados.split('\n'):
+        if FILTRO_ACTION not in linha:
+            continue
+        somente_contar = ACTION_DO_EVENTO.match(linha)
+        if somente_contar and somente_contar.group(1) not in ACOES_COM_CAMPOS:
+            if somente_contar.group(1):
+                agregado.metricas[somente_contar.group(1)] += 1
+            continue
+        try:
+            evento = json.loads(linha)
+        except ValueError:
+            continue
+        if isinstance(evento, dict):
+            agregado.registrar(evento)
+    return agregado
+
+
+def _fim_das_linhas_completas(f, inicio, tamanho):
+    """Posição logo após a última quebra de linha depois de `inicio` (ou `inicio`, se não houver)."""
+    posicao = tamanho
+    while posicao > inicio:
+        leitura = min(64 * 1024, posicao - inicio)
+        f.seek(posicao - leitura)
+        quebra = f.read(leitura).rfind(b'\n')
+        if quebra != -1:
+            return posicao - leitura + quebra + 1
+        posicao -= leitura
+    return inicio
+
+
+def dividir_em_trechos(arquivo, inicio, tamanho_trecho=TAMANHO_TRECHO):
+    """Divide os bytes novos do arquivo, a partir de `inicio`, em trechos alinhados em quebras de linha."""
+    if arquivo.endswith('.gz'):
+        # Comprimido não permite seek barato: um trecho só, até o fim (o arquivo já foi fechado).
+        fim = tamanho_descomprimido(arquivo)
+        return [(arquivo, inicio, fim)] if fim > inicio else []
+    with open(arquivo, 'rb') as f:
+        fim = _fim_das_linhas_completas(f, inicio, os.fstat(f.fileno()).st_size)
+        limites = [inicio]
+        while limites[-1] + tamanho_trecho < fim:
+            f.seek(limites[-1] + tamanho_trecho)
+            f.readline()
+            limites.append(min(f.tell(), fim))
+        if limites[-1] < fim:
+            limites.append(fim)
+    return [(arquivo, a, b) for a, b in zip(limites, limites[1:])]
+
+
+def processar_trechos(trechos, processos, funcao=processar_trecho):
+    """Aplica `funcao(arquivo, inicio, fim)` a cada trecho no pool de processos, mantendo a ordem."""
+    if processos <= 1 or len(trechos) <= 1:
+        return [funcao(*trecho) for trecho in trechos]
+    with ProcessPoolExecutor(max_workers=min(processos, len(trechos))) as executor:
+        return list(executor.map(funcao, *zip(*trechos)))
+
+
+def carregar_checkpoint(caminho):
+    try:
+        with open(caminho, 'r', encoding='utf-8') as f:
+            checkpoint = json.load(f)
+    except (FileNotFoundError, ValueError):
+        return {}
+    if checkpoint.get("versao") != VERSAO_CHECKPOINT:
+        return {}
+    return checkpoint.get("arquivos", {})
+
+
+def salvar_checkpoint(caminho, arquivos):
+    temporario = f"{caminho}.tmp"
+    with open(temporario, 'w', encoding='utf-8') as f:
+        json.dump({"versao": VERSAO_CHECKPOINT, "arquivos": arquivos}, f, ensure_ascii=False)
+    os.replace(temporario, caminho)
+
+
+def listar_arquivos_log(arquivos_ou_pasta):
+    """Arquivos .jsonl a analisar e a pasta onde ficam checkpoint e armazém (ou None se não houver logs)."""
 
-def analisar_logs(arquivos_ou_pasta):
-    """Analisa arquivos de log e gera métricas."""
-    
     arquivos_log = []
-    
+
     if os.path.isdir(arquivos_ou_pasta):
-        arquivos_log = glob.glob(os.path.join(arquivos_ou_pasta, "*.jsonl"))
+        comprimidos = glob.glob(os.path.join(arquivos_ou_pasta, "*.jsonl.gz"))
+        # Um .jsonl que já tem o .gz completo ao lado está no meio da compressão.
+        arquivos_log = sorted([a for a in glob.glob(os.path.join(arquivos_ou_pasta, "*.jsonl")) if f"{a}.gz" not in comprimidos]
+                              + comprimidos, key=ordem_dos_arquivos)
+        pasta = arquivos_ou_pasta
         print(f"📁 Analisando pasta: {arquivos_ou_pasta}")
         print(f"📄 Arquivos encontrados: {len(arquivos_log)}")
     elif os.path.isfile(arquivos_ou_pasta):
         arquivos_log = [arquivos_ou_pasta]
+        pasta = os.path.dirname(arquivos_ou_pasta) or "."
         print(f"📄 Analisando arquivo: {arquivos_ou_pasta}")
     else:
         print(f"❌ {arquivos_ou_pasta} não encontrado!")
         return
-    
+
     if not arquivos_log:
         print("❌ Nenhum arquivo .jsonl encontrado!")
         return
-    
-    metricas = Counter()
-    usuarios_unicos_entrevista = set()
-    depoimentos = []
-    emails = []
-    
-    print("🔍 Processando logs...\n")
-    
+
+    return arquivos_log, pasta
+
+
+def analisar_logs(arquivos_ou_pasta, processos=None, usar_checkpoint=True):
+    """Analisa arquivos de log e gera métricas. Retorna o agregado total (ou None se não houver logs)."""
+    encontrados = listar_arquivos_log(arquivos_ou_pasta)
+    if not encontrados:
+        return
+    arquivos_log, pasta = encontrados
+
+    processos = processos or os.cpu_count() or 1
+    caminho_checkpoint = os.path.join(pasta, NOME_CHECKPOINT)
+    checkpoint = carregar_checkpoint(caminho_checkpoint) if usar_checkpoint else {}
+
+    print(f"🔍 Processando logs com {processos} processo(s)...\n")
+
+    parciais, offsets, trechos = {}, {}, []
     for arquivo in arquivos_log:
-        print(f"📖 Lendo: {os.path.basename(arquivo)}")
+        chave = os.path.abspath(arquivo)
         try:
-            with open(arquivo, 'r', encoding='utf-8') as f:
-                for linha in f:
-                    try:
-                        evento = json.loads(linha.strip())
-                        action = evento.get('action', '')
-                        user_id = evento.get('user_id', '')
-                        
-                        if action:
-                            metricas[action] += 1
-                        
-                        if action == 'interview_started' and user_id:
-                            usuarios_unicos_entrevista.add(user_id)
-                        
-                        if action == 'user_feedback_received':
-                            depoimento = evento.get('depoimento', '')
-                            if depoimento:
-                                depoimentos.append(depoimento)
-                        
-                        if action == 'pro_email_collected':
-                            email = evento.get('email', '')
-                            if email:
-                                emails.append(email)
-                                
-                    except json.JSONDecodeError:
-                        continue
+            info = os.stat(arquivo)
+            anterior = posicao_salva(checkpoint, arquivo, info)
+            if anterior:
+                inicio, parcial = anterior["offset"], Agregado.de_dict(anterior["agregado"])
+            else:
+                if anterior is False:
+                    print(f"♻️  {os.path.basename(arquivo)} mudou desde a última análise; relendo do início")
+                inicio, parcial = 0, Agregado()
+            novos = dividir_em_trechos(arquivo, inicio)
         except FileNotFoundError:
             print(f"⚠️  Arquivo {arquivo} não encontrado, pulando...")
-    
-    print("📊 MÉTRICAS DO BOT DE ENTREVISTAS")
+            continue
+
+        if novos:
+            print(f"📖 Lendo: {os.path.basename(arquivo)} ({(novos[-1][2] - inicio) / 1e6:.1f} MB novos)")
+        else:
+            print(f"⏭️  {os.path.basename(arquivo)}: sem dados novos")
+        parciais[chave] = parcial
+        offsets[chave] = {"inode": info.st_ino, "offset": novos[-1][2] if novos else inicio}
+        trechos.extend((chave, a, b) for _, a, b in novos)
+
+    for (chave, _, _), resultado in zip(trechos, processar_trechos(trechos, processos)):
+        parciais[chave].juntar(resultado)
+
+    if usar_checkpoint:
+        arquivos = {k: v for k, v in checkpoint.items() if k not in parciais and os.path.exists(k)}
+        for chave, parcial in parciais.items():
+            arquivos[chave] = {**offsets[chave], "agregado": parcial.para_dict()}
+        salvar_checkpoint(caminho_checkpoint, arquivos)
+
+    total = Agregado()
+    for parcial in parciais.values():
+        total.juntar(parcial)
+    imprimir_relatorio(total)
+    return total
+
+
+def imprimir_relatorio(agregado):
+    metricas = agregado.metricas
+    latencias_feedback = agregado.latencias_feedback
+    tempos_streaming = agregado.tempos_streaming
+
+    print("\n📊 MÉTRICAS DO BOT DE ENTREVISTAS")
     print("=" * 50)
-    
+
     print(f"👥 Novos usuários: {metricas['new_user_detected']}")
     print(f"🎯 Entrevistas iniciadas: {metricas['interview_started']}")
     print(f"✅ Entrevistas concluídas: {metricas['interview_completed']}")
     print(f"📝 Feedbacks da IA enviados: {metricas['feedback_generation_success']}")
     print(f"💬 Usuários que deram depoimento: {metricas['user_feedback_received']}")
     print(f"🏁 Ciclos completos: {metricas['user_cycle_completed']}")
-    
+
     print("\n🚀 MÉTRICAS DA VERSÃO PRO")
     print("=" * 30)
     print(f"📢 Ofertas da versão PRO: {metricas['pro_version_offer']}")
     print(f"📧 Emails coletados: {metricas['pro_email_collected']}")
     print(f"❌ Recusas da versão PRO: {metricas['pro_version_declined']}")
-    
+
     if metricas['new_user_detected'] > 0:
         taxa_inicio = (metricas['interview_started'] / metricas['new_user_detected']) * 100
         print(f"\n📈 Taxa de conversão (usuário → entrevista): {taxa_inicio:.1f}%")
-    
+
     if metricas['interview_started'] > 0:
         taxa_conclusao = (metricas['interview_completed'] / metricas['interview_started']) * 100
         print(f"📈 Taxa de conclusão (entrevista → feedback): {taxa_conclusao:.1f}%")
-    
+
     if metricas['pro_version_offer'] > 0:
         taxa_pro = (metricas['pro_email_collected'] / metricas['pro_version_offer']) * 100
         print(f"📈 Taxa de interesse na versão PRO: {taxa_pro:.1f}%")
-    
-    print(f"\n👤 Usuários únicos que fizeram entrevistas: {len(usuarios_unicos_entrevista)}")
-    
-    if depoimentos:
+
+    consultas_cache = metricas['question_cache_hit'] + metricas['question_cache_miss']
+    if consultas_cache > 0:
+        print("\n🗃️  CACHE DE PERGUNTAS")
+        print("=" * 30)
+        print(f"✅ Hits: {metricas['question_cache_hit']} | ❌ Misses: {metricas['question_cache_miss']}")
+        print(f"📈 Taxa de acerto: {metricas['question_cache_hit'] / consultas_cache * 100:.1f}%")
+        if metricas['question_semantic_hit'] or metricas['question_semantic_miss']:
+            print(f"🧭 Hits semânticos (paráfrases): {metricas['question_semantic_hit']} | Misses: {metricas['question_semantic_miss']}")
+        print(f"💰 Chamadas ao LLM economizadas: {metricas['question_cache_hit'] + metricas['question_semantic_hit']}")
+
+    consultas_transcricao = metricas['transcription_cache_hit'] + metricas['transcription_cache_miss']
+    if consultas_transcricao > 0:
+        print("\n🎙️  CACHE DE TRANSCRIÇÕES")
+        print("=" * 30)
+        print(f"✅ Hits: {metricas['transcription_cache_hit']} | ❌ Misses: {metricas['transcription_cache_miss']}")
+        print(f"📈 Taxa de acerto: {metricas['transcription_cache_hit'] / consultas_transcricao * 100:.1f}%")
+        print(f"💰 Áudio não enviado ao Speech-to-Text: {agregado.segundos_stt_economizados / 60:.1f} min")
+
+    print("\n📨 MÉTRICAS DE ENTREGA")
+    print("=" * 30)
+    print(f"📥 Requisições de webhook: {metricas['webhook_received']}")
+    print(f"📤 Conteúdos enviados proativamente: {metricas['content_pushed']}")
+    fora_de_ordem = metricas['ordering_wait_timeout'] + metricas['ordering_stale_ticket']
+    if metricas['ordering_waited'] or fora_de_ordem:
+        print(f"🔀 Mensagens que esperaram a anterior do usuário: {metricas['ordering_waited']} | Gravadas fora de ordem: {fora_de_ordem}")
+    if metricas['interview_completed'] > 0:
+        webhooks_por_entrevista = metricas['webhook_received'] / metricas['interview_completed']
+        print(f"📈 Webhooks por entrevista concluída: {webhooks_por_entrevista:.1f}")
+    if latencias_feedback:
+        print("\n⏱️  LATÊNCIA PERCEBIDA DO FEEDBACK")
+        print("=" * 30)
+        for modo, latencias in sorted(latencias_feedback.items()):
+            print(f"⏱️  {modo}: média {statistics.mean(latencias) / 1000:.1f}s | "
+                  f"mediana {statistics.median(latencias) / 1000:.1f}s | entregas: {len(latencias)}")
+    if tempos_streaming['primeiro_trecho'] and tempos_streaming['completo']:
+        print("\n🌊 FEEDBACK EM STREAMING")
+        print("=" * 30)
+        print(f"⚡ Até o primeiro trecho: mediana {statistics.median(tempos_streaming['primeiro_trecho']) / 1000:.1f}s")
+        print(f"🏁 Até o feedback completo: mediana {statistics.median(tempos_streaming['completo']) / 1000:.1f}s")
+
+    print(f"\n👤 Usuários únicos que fizeram entrevistas: {len(agregado.usuarios_unicos_entrevista)}")
+
+    if agregado.depoimentos:
         print("\n💭 DEPOIMENTOS DOS USUÁRIOS:")
         print("=" * 35)
-        for i, depoimento in enumerate(depoimentos, 1):
+        for i, depoimento in enumerate(agregado.depoimentos, 1):
             print(f"{i}. {depoimento}\n")
-    
-    if emails:
+
+    if agregado.emails:
         print("📧 EMAILS COLETADOS PARA VERSÃO PRO:")
         print("=" * 40)
-        for i, email in enumerate(emails, 1):
+        for i, email in enumerate(agregado.emails, 1):
             print(f"{i}. {email}")
-    
+
     print(f"\n✅ Análise concluída! Total de eventos processados: {sum(metricas.values())}")
 
+
+def funil_dos_contadores(de=None, ate=None):
+    """
+    Funil do período (padrão: hoje) lido dos contadores diários do Redis
+    (`app.services.funil_service`), sem ler os logs. Retorna a lista de
+    `(evento, ocorrências, usuários distintos estimados)`.
+    """
+    from app.services.funil_service import consultar_funil
+    from app.services.redis_service import get_redis_client
+
+    r = get_redis_client()
+    if not r:
+        print("❌ Redis indisponível: não é possível ler os contadores do funil.")
+        return None
+    ate = ate or time.strftime('%Y-%m-%d')
+    de = de or ate
+    inicio = time.perf_counter()
+    funil = consultar_funil(r, de, ate)
+    duracao = time.perf_counter() - inicio
+
+    print(f"\n📡 FUNIL DOS CONTADORES DO REDIS DE {de} ATÉ {ate} ({duracao * 1000:.1f} ms)")
+    print("=" * 50)
+    anterior = None
+    for evento, ocorrencias, usuarios in funil:
+        taxa = f" ({usuarios / anterior * 100:.1f}% do passo anterior)" if anterior else ""
+        print(f"➡️  {evento}: ~{usuarios} usuários{taxa} | {ocorrencias} eventos")
+        anterior = usuarios
+    return funil
+
+
+def conferir_contadores(armazem, de, ate):
+    """
+    Compara, evento a evento, os contadores do Redis com os eventos dos logs
+    no armazém colunar. Os usuários distintos do Redis vêm de HyperLogLogs
+    (erro padrão de 0,81%); diferenças acima de 2% são destacadas.
+    """
+    from armazem_eventos import FUNIL
+
+    contadores = funil_dos_contadores(de, ate)
+    if contadores is None:
+        return
+    usuarios_logs = armazem.usuarios_por_acao(FUNIL, de, ate)
+    ocorrencias_logs = armazem.ocorrencias_por_acao(FUNIL, de, ate)
+
+    print(f"\n🔍 CONTADORES DO REDIS x LOGS DE {de} ATÉ {ate}")
+    print("=" * 50)
+    for evento, ocorrencias, usuarios in contadores:
+        nos_logs = len(usuarios_logs[evento])
+        diferenca = (usuarios - nos_logs) / nos_logs * 100 if nos_logs else (100.0 if usuarios else 0.0)
+        marca = "✅" if abs(diferenca) <= 2 else "⚠️ "
+        print(f"{marca} {evento}: usuários {usuarios} no Redis x {nos_logs} nos logs ({diferenca:+.1f}%) | "
+              f"eventos {ocorrencias} x {ocorrencias_logs[evento]}")
+
+
+def consultar_periodo(arquivos_ou_pasta, de=None, ate=None, coorte=None, usuario=None, processos=None, conferir=False):
+    """
+    Funil e coortes de um período a partir do armazém colunar (`armazem_eventos`),
+    ingerindo antes os eventos novos dos logs. Com `conferir`, compara também
+    com os contadores do funil no Redis. Retorna o armazém.
+    """
+    from armazem_eventos import FUNIL, ArmazemEventos
+
+    encontrados = listar_arquivos_log(arquivos_ou_pasta)
+    if not encontrados:
+        return
+    arquivos_log, pasta = encontrados
+
+    armazem = ArmazemEventos(pasta)
+    ingeridos = armazem.ingerir(arquivos_log, processos or os.cpu_count() or 1)
+    particoes = armazem.particoes(de, ate)
+    print(f"🗄️  Armazém colunar: {ingeridos} eventos novos ingeridos | {len(particoes)} dia(s) no período")
+
+    print(f"\n📊 FUNIL DE {de or 'início'} ATÉ {ate or 'hoje'}" + (f" (coorte: {', '.join(coorte)})" if coorte else ""))
+    print("=" * 50)
+    anterior = None
+    for passo, no_passo, seguiram in armazem.funil(de, ate, FUNIL, coorte):
+        taxa = f" ({seguiram / anterior * 100:.1f}% do passo anterior)" if anterior else ""
+        print(f"➡️  {passo}: {seguiram} seguiram o funil{taxa} | {no_passo} no período")
+        anterior = seguiram
+
+    print("\n📅 COORTES POR DIA DA PRIMEIRA ENTREVISTA")
+    print("=" * 50)
+    for dia, iniciaram, concluiram in armazem.coortes(de, ate):
+        print(f"{dia}: {iniciaram} iniciaram | {concluiram} concluíram ({concluiram / iniciaram * 100 if iniciaram else 0:.1f}%)")
+
+    if usuario:
+        print(f"\n👤 EVENTOS DE {usuario}")
+        print("=" * 50)
+        for instante, acao in armazem.eventos_do_usuario(usuario, de, ate):
+            print(f"{instante}  {acao}")
+
+    if conferir and particoes:
+        conferir_contadores(armazem, de or particoes[0], ate or particoes[-1])
+    return armazem
+
 if __name__ == "__main__":
-    caminho = "logs" if len(sys.argv) == 1 else sys.argv[1]
-    analisar_logs(caminho)
+    parser = argparse.ArgumentParser(description="Métricas do bot a partir dos logs JSONL.")
+    parser.add_argument("caminho", nargs="?", default="logs", help="Pasta de logs ou um arquivo .jsonl")
+    parser.add_argument("--processos", type=int, default=None, help="Processos do pool (padrão: número de CPUs)")
+    parser.add_argument("--sem-checkpoint", action="store_true", help="Relê tudo, sem ler nem gravar o checkpoint")
+    parser.add_argument("--de", help="Início do período (AAAA-MM-DD); consulta o armazém colunar")
+    parser.add_argument("--ate", help="Fim do período (AAAA-MM-DD), inclusive; consulta o armazém colunar")
+    parser.add_argument("--coorte", nargs="+", metavar="ACTION",
+                        help="Restringe o funil a usuários com uma destas actions no período (ex.: transcription_cache_miss)")
+    parser.add_argument("--usuario", help="Mostra também os eventos deste user_id no período")
+    parser.add_argument("--contadores", action="store_true",
+                        help="Mostra só o funil dos contadores do Redis no período (padrão: hoje), sem ler os logs")
+    parser.add_argument("--conferir", action="store_true", help="Compara o funil dos logs com os contadores do Redis no período")
+    args = parser.parse_args()
+    if args.contadores:
+        funil_dos_contadores(args.de, args.ate)
+    elif args.de or args.ate or args.coorte or args.usuario or args.conferir:
+        consultar_periodo(args.caminho, args.de, args.ate, args.coorte, args.usuario, processos=args.processos, conferir=args.conferir)
+    else:
+        analisar_logs(args.caminho, processos=args.processos, usar_checkpoint=not args.sem_checkpoint)
@@ -1,4 +1,5 @@
 import logging
+from typing import Dict, Optional
 from pydantic_settings import BaseSettings, SettingsConfigDict
 
 log = logging.getLogger(__name__)
@@ -15,8 +16,86 @@ class Settings(BaseSettings):
     TWILIO_AUTH_TOKEN: str
     TWILIO_WHATSAPP_NUMBER: str
 
+    VERTEX_LOCATION: str = "us-central1"
+    GEMINI_MODELO: str = "gemini-2.5-flash-lite"
+    GEMINI_TEMPERATURA: Optional[float] = None
+    GEMINI_MAX_OUTPUT_TOKENS: Optional[int] = None
+    GCP_PRAZO_MINIMO: float = 5.0
+    GCP_PRAZO_MAXIMO: float = 60.0
+    GCP_PRAZO_FATOR: float = 2.0
+    GCP_HEDGE_ATIVO: bool = True
+    GCP_HEDGE_PERCENTIL: float = 95.0
+    GCP_AMOSTRAS_MINIMAS: int = 20
+    GCP_THREADPOOL_SIZE: int = 32
+    DISJUNTOR_JANELA: float = 60.0
+    DISJUNTOR_MIN_CHAMADAS: int = 10
+    DISJUNTOR_TAXA_ERRO: float = 0.5
+    DISJUNTOR_PAUSA: float = 30.0
+
+    TWILIO_TIMEOUT: float = 10.0
+    TWILIO_TENTATIVAS_ENVIO: int = 3
+    TWILIO_BACKOFF_INICIAL: float = 0.5
+    TWILIO_MAX_REENVIOS: int = 8
+    TWILIO_LIMITE_ENVIOS_POR_SEGUNDO: float = 10.0
+    TWILIO_RAJADA_ENVIOS: int = 10
+    TWILIO_ESPERA_MAXIMA_TOKEN: float = 1.0
+
     REDIS_HOST: str = "localhost"
     REDIS_PORT: int = 6379
+
+    WEBHOOK_THREADPOOL_SIZE: int = 40
+    WEBHOOK_DEDUP_TTL: int = 24 * 3600
+    WEBHOOK_ESPERA_DUPLICADA: float = 10.0
+    ORDEM_ATIVA: bool = True
+    ORDEM_ESPERA_MAXIMA: float = 10.0
+    ORDEM_TTL: int = 300
+    STT_THREADPOOL_SIZE: int = 16
+
+    TRANSCRICAO_ASSINCRONA: bool = False
+    AUDIO_DURACAO_MAX_TRECHO: float = 50.0
+    AUDIO_MARGEM_SILENCIO: float = 0.3
+    AUDIO_FRACAO_SILENCIO: float = 0.25
+    FEEDBACK_INCREMENTAL: bool = False
+    FEEDBACK_STREAMING: bool = False
+    FEEDBACK_STREAMING_MIN_CARACTERES: int = 200
+
+    STATE_TTL_PADRAO: int = 7 * 24 * 3600
+    STATE_TTL_POR_ETAPA: Dict[str, int] = {
+        "inicio": 24 * 3600,
+        "aguardando_contexto": 24 * 3600,
+        "preparando_perguntas": 2 * 24 * 3600,
+        "aguardando_resposta_1": 3 * 24 * 3600,
+        "aguardando_resposta_2": 3 * 24 * 3600,
+        "aguardando_resposta_3": 3 * 24 * 3600,
+        "gerando_feedback": 3 * 24 * 3600,
+        "aguardando_feedback_usuario": 2 * 24 * 3600,
+        "aguardando_email_pro": 2 * 24 * 3600,
+    }
+
+    CACHE_PERGUNTAS_ATIVO: bool = True
+    CACHE_PERGUNTAS_VARIANTES: int = 3
+    CACHE_PERGUNTAS_TTL: int = 7 * 24 * 3600
+    CACHE_PERGUNTAS_MAX_CHAVES: int = 10000
+
+    CACHE_SEMANTICO_ATIVO: bool = False
+    CACHE_SEMANTICO_LIMIAR: float = 0.8
+    CACHE_SEMANTICO_DIMENSAO: int = 256
+    CACHE_SEMANTICO_TABELAS: int = 16
+    CACHE_SEMANTICO_BITS: int = 12
+
+    CACHE_TRANSCRICAO_ATIVO: bool = True
+    CACHE_TRANSCRICAO_TTL: int = 3 * 24 * 3600
+
+    LOGS_DIR: str = "logs"
+    LOGS_TAMANHO_MAXIMO: int = 256 * 1024 * 1024
+    LOGS_COMPRIMIR: bool = True
+
+    FUNIL_CONTADORES_TTL: int = 400 * 24 * 3600
+
+    ARQUIVAMENTO_ATIVO: bool = False
+    ARQUIVAMENTO_DIR: str = "arquivo_sessoes"
+    ARQUIVAMENTO_ANTECEDENCIA: int = 3600
+    ARQUIVAMENTO_INTERVALO: int = 900
     
     @property
     def CELERY_BROKER_URL(self) -> str:
@@ -0,0 +1,68 @@
+import re
+from typing import Iterable
+
+# Reconhecimento das intenções simples do usuário (pronto, reiniciar, recusar
+# a oferta PRO). As expressões são escritas sem acentos e os padrões aceitam
+# qualquer acentuação ("comecar" casa com "começar"), com limites de palavra:
+# "ok" não casa com "book" nem "manda" com "demanda". Os padrões são compilados
+# uma única vez, na importação; a mensagem só é passada para minúsculas.
+
+EXPRESSOES_PRONTO = (
+    "pronto", "pronta", "ready", "vamos", "pode enviar", "pode mandar",
+    "manda", "envia", "envie", "bora", "ok", "sim", "yes", "go",
+    "comecar", "comeca", "start", "iniciar", "inicia", "inicio",
+    "let's", "let us",
+)
+
+EXPRESSOES_REINICIAR = ("reiniciar", "recomecar", "restart")
+
+EXPRESSOES_RECUSAR_PRO = ("finalizar", "nao", "no", "skip", "pular")
+
+_VARIANTES = {
+    "a": "[aáàâãä]", "e": "[eéèêë]", "i": "[iíìîï]", "o": "[oóòôõö]",
+    "u": "[uúùûü]", "c": "[cç]", "n": "[nñ]", "'": "['’]", " ": r"\s+",
+}
+
+
+def _alternativas(expressoes: Iterable[str]) -> str:
+    # Alternativas fatoradas em árvore de prefixos ("pront(?:a|o)" em vez de
+    # "pronta|pronto"), cada letra aceitando suas variantes acentuadas: o motor
+    # testa cada letra uma vez por posição, e não uma vez por expressão.
+    arvore = {}
+    for expressao in set(expressoes):
+        no = arvore
+        for c in expressao:
+            no = no.setdefault(c, {})
+        no[""] = {}
+
+    def ramos(no: dict) -> str:
+        filhos = [_VARIANTES.get(c, re.escape(c)) + ramos(resto) for c, resto in sorted(no.items()) if c]
+        if not filhos:
+            return ""
+        corpo = filhos[0] if len(filhos) == 1 else f"(?:{'|'.join(filhos)})"
+        # Uma expressão que termina aqui torna o resto opcional (guloso: a mais longa vence).
+        return f"(?:{corpo})?" if "" in no else corpo
+
+    return ramos(arvore)
+
+
+def compilar_busca(expressoes: Iterable[str]) -> re.Pattern:
+    """Padrão que encontra qualquer uma das expressões como palavra inteira dentro da mensagem."""
+    return re.compile(rf"(?<!\w)(?:{_alternativas(expressoes)})(?!\w)")
+
+
+def compilar_mensagem_inteira(expressoes: Iterable[str]) -> re.Pattern:
+    """Padrão que só aceita a mensagem inteira igual a uma das expressões (pontuação em volta é ignorada)."""
+    return re.compile(rf"^\W*(?:{_alternativas(expressoes)})\W*$")
+
+
+PRONTO = compilar_busca(EXPRESSOES_PRONTO)
+# Comandos que valem em qualquer etapa exigem a mensagem inteira, para que uma
+# resposta de entrevista como "precisei reiniciar o servidor" não reinicie a conversa.
+REINICIAR = compilar_mensagem_inteira(EXPRESSOES_REINICIAR)
+RECUSAR_PRO = compilar_mensagem_inteira(EXPRESSOES_RECUSAR_PRO)
+
+
+def detectar(intencao: re.Pattern, texto: str) -> bool:
+    """Indica se a mensagem do usuário expressa a intenção (um dos padrões deste módulo)."""
+    return bool(texto) and intencao.search(texto.lower()) is not None
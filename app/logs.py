@@ -0,0 +1,209 @@
+import atexit
+import copy
+import gzip
+import logging
+import os
+import queue
+import re
+import shutil
+import sys
+import threading
+import time
+from logging.handlers import QueueHandler, QueueListener
+
+from pythonjsonlogger import jsonlogger
+
+from app.config import settings
+
+# Pipeline de logs do webhook e dos workers. Quem loga só coloca o registro
+# numa fila (QueueHandler); uma thread (QueueListener) formata em JSON e
+# escreve no console e nos arquivos de métricas, fora do caminho da requisição.
+#
+# Os arquivos `bot_metrics_AAAA-MM-DD[.N].jsonl` nunca são renomeados: cada
+# processo (workers do uvicorn, processos do Celery) abre o arquivo do dia em
+# modo append e passa para o próximo índice quando ele atinge
+# LOGS_TAMANHO_MAXIMO, então todos convergem para o mesmo arquivo. Com
+# LOGS_COMPRIMIR, arquivos que nenhum processo vai mais escrever (dias
+# anteriores ou índices já ultrapassados) são comprimidos em .jsonl.gz.
+
+FORMATO = '%(asctime)s %(name)s %(levelname)s %(message)s'
+PREFIXO_ARQUIVO = "bot_metrics_"
+ARQUIVO_METRICAS = re.compile(rf"^{PREFIXO_ARQUIVO}(\d{{4}}-\d{{2}}-\d{{2}})(?:\.(\d+))?\.jsonl$")
+# Folga para escritas em andamento de outros processos antes de comprimir um arquivo fechado.
+ESPERA_COMPRESSAO = 60.0
+
+_listener: QueueListener | None = None
+_pid_configurado: int | None = None
+
+
+def comprimir_arquivo(caminho: str) -> bool:
+    """Comprime `caminho` em `caminho.gz` e apaga o original. Seguro com vários processos tentando ao mesmo tempo."""
+    temporario = f"{caminho}.gz.tmp"
+    try:
+        fd = os.open(temporario, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+    except FileExistsError:
+        return False  # outro processo está comprimindo
+    try:
+        with os.fdopen(fd, 'wb') as bruto, open(caminho, 'rb') as origem:
+            with gzip.GzipFile(filename=os.path.basename(caminho), mode='wb', fileobj=bruto) as destino:
+                shutil.copyfileobj(origem, destino, 1024 * 1024)
+        os.replace(temporario, f"{caminho}.gz")
+        os.remove(caminho)
+        return True
+    except FileNotFoundError:
+        # Outro processo terminou a compressão antes.
+        os.remove(temporario)
+        return False
+
+
+class ArquivoMetricasHandler(logging.Handler):
+    """
+    Grava os registros em `<pasta>/bot_metrics_AAAA-MM-DD[.N].jsonl`, trocando
+    de arquivo na virada do dia e quando o arquivo passa de `tamanho_maximo`
+    bytes (0 = sem limite). Roda na thread do listener.
+    """
+
+    def __init__(self, pasta: str, tamanho_maximo: int = 0, comprimir: bool = False):
+        super().__init__()
+        self.pasta = pasta
+        self.tamanho_maximo = tamanho_maximo
+        self.comprimir = comprimir
+        self.dia = None
+        self.indice = 0
+        self.caminho = None
+        self.stream = None
+        self._temporizador = None
+        os.makedirs(pasta, exist_ok=True)
+
+    def _caminho(self, dia: str, indice: int) -> str:
+        return os.path.join(self.pasta, f"{PREFIXO_ARQUIVO}{dia}{f'.{indice}' if indice else ''}.jsonl")
+
+    def _precisa_trocar(self, dia: str) -> bool:
+        if self.stream is None or dia > self.dia:
+            return True
+        # fstat e não tell(): outro processo pode ter enchido (ou comprimido) o arquivo.
+        info = os.fstat(self.stream.fileno())
+        return info.st_nlink == 0 or (self.tamanho_maximo and info.st_size >= self.tamanho_maximo)
+
+    def _trocar_arquivo(self, dia: str):
+        if self.stream:
+            self.stream.close()
+        indice = self.indice if dia == self.dia else 0
+        while True:
+            caminho = self._caminho(dia, indice)
+            if not os.path.exists(f"{caminho}.gz") and (
+                    not self.tamanho_maximo or not os.path.exists(caminho)
+                    or os.path.getsize(caminho) < self.tamanho_maximo):
+                break
+            indice += 1
+        self.dia, self.indice, self.caminho = dia, indice, caminho
+        self.stream = open(caminho, 'a', encoding='utf-8')
+        if self.comprimir:
+            if self._temporizador:
+                self._temporizador.cancel()
+            self._temporizador = threading.Timer(ESPERA_COMPRESSAO, self.comprimir_fechados)
+            self._temporizador.daemon = True
+            self._temporizador.start()
+
+    def comprimir_fechados(self):
+        """Comprime os arquivos de métricas de dias anteriores ou de índices anteriores ao atual."""
+        dia_atual, indice_atual = self.dia, self.indice
+        if dia_atual is None or not os.path.isdir(self.pasta):
+            return
+        for nome in os.listdir(self.pasta):
+            encontrado = ARQUIVO_METRICAS.match(nome)
+            if not encontrado:
+                continue
+            dia, indice = encontrado.group(1), int(encontrado.group(2) or 0)
+            if dia < dia_atual or (dia == dia_atual and indice < indice_atual):
+                try:
+                    comprimir_arquivo(os.path.join(self.pasta, nome))
+                except OSError:
+                    logging.getLogger(__name__).exception("Falha ao comprimir arquivo de log", extra={"arquivo": nome})
+
+    def emit(self, record):
+        try:
+            dia = time.strftime('%Y-%m-%d', time.localtime(record.created))
+            if self._precisa_trocar(dia):
+                self._trocar_arquivo(dia)
+            self.stream.write(self.format(record) + '\n')
+            self.stream.flush()
+        except Exception:
+            self.handleError(record)
+
+    def close(self):
+        self.acquire()
+        try:
+            if self._temporizador:
+                self._temporizador.cancel()
+            if self.stream:
+                self.stream.close()
+                self.stream = None
+        finally:
+            self.release()
+        super().close()
+
+
+class FilaHandler(QueueHandler):
+    """QueueHandler que preserva os campos `extra` e deixa a exceção para o JsonFormatter do listener."""
+
+    def prepare(self, record):
+        record = copy.copy(record)
+        record.message = record.getMessage()
+        record.msg, record.args = record.message, None
+        if record.exc_info:
+            # O traceback é formatado aqui, enquanto os frames ainda existem.
+            record.exc_text = record.exc_text or logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+
+def configurar_logs(pasta: str | None = None, stream=None) -> QueueListener:
+    """
+    Liga o root logger ao pipeline (fila + listener com console e arquivos de
+    métricas). Idempotente por processo; depois de um fork, chamar de novo no
+    filho recria a fila e a thread do listener, que não sobrevivem ao fork.
+    """
+    global _listener, _pid_configurado
+    if _pid_configurado == os.getpid():
+        return _listener
+
+    root = logging.getLogger()
+    root.setLevel(logging.INFO)
+    for handler in [h for h in root.handlers if isinstance(h, FilaHandler)]:
+        root.removeHandler(handler)
+    if _listener:
+        # Herdados do processo pai: a thread não existe mais neste processo.
+        for handler in _listener.handlers:
+            handler.close()
+
+    console_handler = logging.StreamHandler(stream or sys.stdout)
+    console_handler.setFormatter(jsonlogger.JsonFormatter(FORMATO))
+    file_handler = ArquivoMetricasHandler(
+        pasta or settings.LOGS_DIR,
+        tamanho_maximo=settings.LOGS_TAMANHO_MAXIMO,
+        comprimir=settings.LOGS_COMPRIMIR,
+    )
+    file_handler.setFormatter(jsonlogger.JsonFormatter(FORMATO))
+
+    fila = queue.SimpleQueue()
+    _listener = QueueListener(fila, console_handler, file_handler, respect_handler_level=True)
+    _listener.start()
+    root.addHandler(FilaHandler(fila))
+    _pid_configurado = os.getpid()
+    return _listener
+
+
+def encerrar_logs():
+    """Esvazia a fila, para o listener e fecha os arquivos. Chamado na saída do processo."""
+    global _listener, _pid_configurado
+    if _listener and _pid_configurado == os.getpid():
+        _listener.stop()
+        for handler in _listener.handlers:
+            handler.close()
+        for handler in [h for h in logging.getLogger().handlers if isinstance(h, FilaHandler)]:
+            logging.getLogger().removeHandler(handler)
+        _listener, _pid_configurado = None, None
+
+
+atexit.register(encerrar_logs)
@@ -1,34 +1,22 @@
 import logging
-import sys
-import os
-from datetime import datetime
-from fastapi import FastAPI
-from pythonjsonlogger import jsonlogger
+from datetime import date
+import anyio.to_thread
+from fastapi import Depends, FastAPI, HTTPException, Response
 
+from app.logs import configurar_logs
+from app.metricas import CONTENT_TYPE_LATEST, gerar_metricas
 from app.webhook import router as webhook_router
 from app.services.gcp_service import initialize_vertexai
+from app.services.funil_service import consultar_funil_async
+from app.services.redis_service import get_async_redis_client
+from app.services.twilio_service import get_media_http_client
+from app.config import settings
 
 log = logging.getLogger()
-log.setLevel(logging.INFO)
 
 if not log.handlers:
-    console_handler = logging.StreamHandler(sys.stdout)
-    console_formatter = jsonlogger.JsonFormatter('%(asctime)s %(name)s %(levelname)s %(message)s')
-    console_handler.setFormatter(console_formatter)
-    log.addHandler(console_handler)
-    
-    logs_dir = "logs"
-    os.makedirs(logs_dir, exist_ok=True)
-    
-    today = datetime.now().strftime("%Y-%m-%d")
-    log_file = os.path.join(logs_dir, f"bot_metrics_{today}.jsonl")
-    
-    file_handler = logging.FileHandler(log_file, encoding='utf-8')
-    file_formatter = jsonlogger.JsonFormatter('%(asctime)s %(name)s %(levelname)s %(message)s')
-    file_handler.setFormatter(file_formatter)
-    log.addHandler(file_handler)
-    
-    print(f"📁 Logs sendo salvos em: {log_file}")
+    configurar_logs()
+    print(f"📁 Logs sendo salvos em: {settings.LOGS_DIR}/")
 
 app = FastAPI(
     title="Darwin Interview Bot",
@@ -43,15 +31,57 @@ def on_startup():
     Aqui, garantimos que o SDK do Vertex AI seja inicializado.
     """
     log.info("Aplicação iniciando...")
+    anyio.to_thread.current_default_thread_limiter().total_tokens = settings.WEBHOOK_THREADPOOL_SIZE
     if not initialize_vertexai():
         log.critical("A APLICAÇÃO NÃO PODE INICIAR: Falha ao inicializar o Vertex AI.")
     else:
         log.info("Inicialização completa. Aplicação pronta.")
 
 
+@app.on_event("shutdown")
+async def on_shutdown():
+    """Fecha os pools de conexão assíncronos (Redis e HTTP de mídia)."""
+    r = get_async_redis_client()
+    if r:
+        await r.aclose()
+    await get_media_http_client().aclose()
+
+
 app.include_router(webhook_router, prefix="/webhook", tags=["Twilio Webhook"])
 
 @app.get("/", tags=["Health Check"])
 def read_root():
     """Endpoint raiz para verificar se a aplicação está no ar."""
     return {"status": "ok", "message": "Darwin Interview Bot is running"}
+
+
+@app.get("/metrics", tags=["Métricas"])
+def metrics():
+    """
+    Métricas no formato de texto do Prometheus: duração e erros por etapa da
+    máquina de estados, por chamada externa e por task do Celery, e o tamanho
+    das filas do Celery. Com PROMETHEUS_MULTIPROC_DIR, soma todos os processos.
+    """
+    return Response(content=gerar_metricas(), media_type=CONTENT_TYPE_LATEST)
+
+
+@app.get("/funil", tags=["Métricas"])
+async def funil(de: date | None = None, ate: date | None = None, r: object = Depends(get_async_redis_client)):
+    """
+    Funil de conversão de `de` até `ate` (padrão: hoje) a partir dos contadores
+    diários do Redis: ocorrências e usuários distintos (estimados) por evento.
+    O período é limitado à retenção dos contadores (FUNIL_CONTADORES_TTL);
+    dias além dela já expiraram e só aumentariam a leitura.
+    """
+    ate = ate or date.today()
+    de = de or ate
+    if de > ate:
+        raise HTTPException(status_code=422, detail="'de' deve ser anterior ou igual a 'ate'.")
+    dias_maximos = settings.FUNIL_CONTADORES_TTL // 86400
+    if (ate - de).days + 1 > dias_maximos:
+        raise HTTPException(status_code=400, detail=f"Período máximo de {dias_maximos} dias.")
+    eventos = await consultar_funil_async(r, str(de), str(ate))
+    return {
+        "de": str(de), "ate": str(ate),
+        "funil": [{"evento": evento, "ocorrencias": ocorrencias, "usuarios": usuarios} for evento, ocorrencias, usuarios in eventos],
+    }
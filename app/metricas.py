@@ -0,0 +1,141 @@
+import logging
+import os
+import time
+from functools import lru_cache
+
+from prometheus_client import CollectorRegistry, CONTENT_TYPE_LATEST, Counter, Histogram, REGISTRY, generate_latest, multiprocess
+from prometheus_client.core import GaugeMetricFamily
+
+log = logging.getLogger(__name__)
+
+# Métricas Prometheus do webhook e dos workers, expostas em /metrics.
+#
+# Com a variável de ambiente PROMETHEUS_MULTIPROC_DIR definida antes de o
+# processo subir (necessário com vários workers do uvicorn ou com o Celery),
+# cada processo grava seus valores em arquivos mmap nessa pasta e o /metrics
+# soma todos eles; a pasta deve ser esvaziada a cada deploy. Sem a variável,
+# vale o registro em memória do próprio processo.
+#
+# Os buckets são fixos e os filhos de cada combinação de rótulos são
+# resolvidos uma única vez, então medir uma chamada custa um perf_counter e
+# um observe.
+
+MULTIPROCESSO = bool(os.environ.get("PROMETHEUS_MULTIPROC_DIR"))
+
+# De 5 ms (Redis, handlers sem IA) a 2 min (feedback e transcrições longas).
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+
+# Filas do Celery e as sub-filas de prioridade que o transporte Redis do kombu cria para cada uma.
+FILAS_CELERY = ("celery", "stt", "envios")
+
+ETAPA_SEGUNDOS = Histogram(
+    "bot_etapa_segundos", "Duração do handler de cada etapa da máquina de estados",
+    ["etapa"], buckets=BUCKETS,
+)
+ETAPA_ERROS = Counter("bot_etapa_erros", "Exceções nos handlers de etapa", ["etapa"])
+DEPENDENCIA_SEGUNDOS = Histogram(
+    "bot_dependencia_segundos", "Duração das chamadas a serviços externos",
+    ["dependencia", "operacao"], buckets=BUCKETS,
+)
+DEPENDENCIA_ERROS = Counter("bot_dependencia_erros", "Chamadas a serviços externos que falharam", ["dependencia", "operacao"])
+TAREFA_SEGUNDOS = Histogram(
+    "bot_tarefa_segundos", "Duração das tasks do Celery",
+    ["tarefa", "estado"], buckets=BUCKETS,
+)
+
+_inicio_tarefas: dict[str, float] = {}
+
+
+class _Medicao:
+    """Context manager que observa a duração do bloco e conta as exceções que saem dele."""
+
+    __slots__ = ("histograma", "erros", "inicio")
+
+    def __init__(self, histograma, erros):
+        self.histograma = histograma
+        self.erros = erros
+
+    def __enter__(self):
+        self.inicio = time.perf_counter()
+        return self
+
+    def __exit__(self, tipo, erro, traceback):
+        self.histograma.observe(time.perf_counter() - self.inicio)
+        # GeneratorExit e KeyboardInterrupt não são falhas da chamada.
+        if tipo is not None and issubclass(tipo, Exception):
+            self.erros.inc()
+        return False
+
+
+@lru_cache(maxsize=None)
+def _filhos_etapa(etapa: str):
+    return ETAPA_SEGUNDOS.labels(etapa), ETAPA_ERROS.labels(etapa)
+
+
+@lru_cache(maxsize=None)
+def _filhos_dependencia(dependencia: str, operacao: str):
+    return DEPENDENCIA_SEGUNDOS.labels(dependencia, operacao), DEPENDENCIA_ERROS.labels(dependencia, operacao)
+
+
+def medir_etapa(etapa: str) -> _Medicao:
+    """Mede o handler de `etapa`: `with medir_etapa(etapa): handler(...)`."""
+    return _Medicao(*_filhos_etapa(etapa))
+
+
+def medir_dependencia(dependencia: str, operacao: str) -> _Medicao:
+    """Mede uma chamada externa (twilio, twilio_midia, stt, gemini, redis). Funciona em código síncrono e assíncrono."""
+    return _Medicao(*_filhos_dependencia(dependencia, operacao))
+
+
+def iniciar_tarefa(task_id: str):
+    """Marca o início de uma task do Celery (sinal task_prerun)."""
+    _inicio_tarefas[task_id] = time.perf_counter()
+
+
+def finalizar_tarefa(task_id: str, nome: str, estado: str | None):
+    """Observa a duração de uma task do Celery (sinal task_postrun)."""
+    inicio = _inicio_tarefas.pop(task_id, None)
+    if inicio is not None:
+        TAREFA_SEGUNDOS.labels(nome.rsplit('.', 1)[-1], estado or "DESCONHECIDO").observe(time.perf_counter() - inicio)
+
+
+class ProfundidadeFilas:
+    """Coletor que lê, a cada scrape, quantas mensagens esperam em cada fila do Celery no broker."""
+
+    def describe(self):
+        return []
+
+    def collect(self):
+        # Import tardio: o redis_service usa este módulo para medir as próprias chamadas.
+        from kombu.transport.redis import PRIORITY_STEPS, Channel
+        from app.services.redis_service import get_redis_client
+
+        familia = GaugeMetricFamily("bot_celery_fila_tamanho", "Mensagens aguardando em cada fila do Celery", labels=["fila"])
+        r = get_redis_client()
+        if r:
+            pipe = r.pipeline(transaction=False)
+            for fila in FILAS_CELERY:
+                for passo in PRIORITY_STEPS:
+                    pipe.llen(f"{fila}{Channel.sep}{passo}" if passo else fila)
+            try:
+                tamanhos = pipe.execute()
+            except Exception as e:
+                log.warning("Não foi possível ler o tamanho das filas do Celery", extra={"error": str(e)})
+                return
+            for i, fila in enumerate(FILAS_CELERY):
+                familia.add_metric([fila], sum(tamanhos[i * len(PRIORITY_STEPS):(i + 1) * len(PRIORITY_STEPS)]))
+        yield familia
+
+
+_registro_filas = CollectorRegistry(auto_describe=False)
+_registro_filas.register(ProfundidadeFilas())
+
+
+def gerar_metricas() -> bytes:
+    """Texto no formato Prometheus com as métricas de todos os processos e o tamanho das filas."""
+    if MULTIPROCESSO:
+        registro = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registro)
+    else:
+        registro = REGISTRY
+    return generate_latest(registro) + generate_latest(_registro_filas)
@@ -1,5 +1,6 @@
-from pydantic import BaseModel, Field
-from typing import List, Optional
+import json
+from pydantic import BaseModel, Field, PrivateAttr
+from typing import Any, Dict, List, Optional
 
 class UserState(BaseModel):
     """
@@ -18,10 +19,14 @@ class UserState(BaseModel):
 
     respostas: List[str] = Field(default_factory=list, description="Lista de respostas fornecidas pelo usuário.")
 
-    perguntas_prontas: bool = Field(default=False, description="Flag que indica se as perguntas estão prontas para serem enviadas.")
+    aguardando_entrega: Optional[str] = Field(default=None, description="Conteúdo ('pergunta_1' ou 'feedback') já pedido pelo usuário, a ser enviado pelo worker assim que ficar pronto.")
 
     erro_geracao: Optional[str] = Field(default=None, description="Mensagem de erro da geração de perguntas.")
 
+    avaliacoes: Dict[str, str] = Field(default_factory=dict, description="Avaliações parciais por resposta (índice -> texto) no modo de feedback incremental.")
+
+    fim_entrevista_ts: Optional[float] = Field(default=None, description="Timestamp (epoch) em que a última resposta da entrevista foi recebida.")
+
     feedback_gerado: Optional[str] = Field(default=None, description="O texto do feedback gerado pela IA.")
     
     erro_feedback: Optional[str] = Field(default=None, description="Mensagem de erro da geração de feedback.")
@@ -30,5 +35,72 @@ class UserState(BaseModel):
 
     last_user_ts: Optional[int] = Field(default=None, description="Timestamp (epoch) da última mensagem do usuário.")
 
+    version: int = Field(default=0, description="Versão do estado no Redis, usada no compare-and-set otimista.")
+
+    _snapshot: Dict[str, Any] = PrivateAttr(default_factory=dict)
+
+    _eventos_funil: List[str] = PrivateAttr(default_factory=list)
+
+    _eventos_log: List[tuple] = PrivateAttr(default_factory=list)
+
     class Config:
         exclude_none = True
+
+    @classmethod
+    def de_hash(cls, dados: Dict[str, str]) -> "UserState":
+        """
+        Reconstrói o estado a partir de um hash do Redis (um campo por atributo,
+        cada valor codificado em JSON) e guarda um snapshot dos valores lidos
+        para o rastreamento de campos alterados.
+        """
+        user_state = cls.model_validate({campo: json.loads(valor) for campo, valor in dados.items()})
+        user_state._snapshot = user_state.model_dump(exclude={"version"})
+        return user_state
+
+    def campos_alterados(self, origem: Optional["UserState"] = None) -> Dict[str, Any]:
+        """
+        Retorna os campos cujo valor difere do snapshot lido do Redis.
+        `origem` permite comparar com o snapshot de outra instância (ex.: quando
+        o estado foi recriado em um reinício); sem snapshot, compara com os
+        valores padrão do modelo. Listas alteradas in-place também são detectadas.
+        """
+        snapshot = (origem or self)._snapshot or _VALORES_PADRAO
+        atuais = self.model_dump(exclude={"version"})
+        return {campo: valor for campo, valor in atuais.items() if snapshot.get(campo) != valor}
+
+    def registrar_evento_funil(self, evento: str):
+        """
+        Marca um evento do funil (ex.: 'interview_completed') para ser contado
+        nos contadores diários do Redis na mesma operação que grava este estado.
+        Não é serializado: vale só para a gravação desta instância.
+        """
+        self._eventos_funil.append(evento)
+
+    def eventos_funil(self) -> List[str]:
+        """Eventos do funil registrados desde que o estado foi lido."""
+        return self._eventos_funil
+
+    def registrar_evento_log(self, mensagem: str, extra: Dict[str, Any]):
+        """
+        Guarda um log de negócio (com `action`) para ser emitido só depois que
+        a gravação deste estado for confirmada. Dentro de um mutador de CAS o
+        log seria repetido a cada conflito de versão.
+        """
+        self._eventos_log.append((mensagem, extra))
+
+    def eventos_log(self) -> List[tuple]:
+        """Logs de negócio `(mensagem, extra)` registrados desde que o estado foi lido."""
+        return self._eventos_log
+
+    @staticmethod
+    def para_hash(campos: Dict[str, Any]) -> tuple[Dict[str, str], List[str]]:
+        """
+        Converte campos alterados em `(valores_para_hset, campos_para_hdel)`.
+        Campos com valor None são removidos do hash em vez de gravados.
+        """
+        gravar = {campo: json.dumps(valor, ensure_ascii=False) for campo, valor in campos.items() if valor is not None}
+        remover = [campo for campo, valor in campos.items() if valor is None]
+        return gravar, remover
+
+
+_VALORES_PADRAO = UserState().model_dump(exclude={"version"})
@@ -0,0 +1,80 @@
+import gzip
+import json
+import logging
+import os
+import time
+from datetime import datetime
+
+from app.config import settings
+from app.models import UserState
+from app.services.redis_service import remover_estado_se_versao
+
+log = logging.getLogger(__name__)
+
+PREFIXO_ESTADO = "estado:"
+
+
+def _lotes(iteravel, tamanho: int):
+    lote = []
+    for item in iteravel:
+        lote.append(item)
+        if len(lote) >= tamanho:
+            yield lote
+            lote = []
+    if lote:
+        yield lote
+
+
+def arquivar_sessoes_expirando(r, antecedencia: int | None = None, diretorio: str | None = None, tamanho_lote: int = 500) -> int:
+    """
+    Move para um arquivo .jsonl.gz em disco as sessões cujo TTL expira em até
+    `antecedencia` segundos, removendo-as do Redis antes da expiração.
+
+    A remoção usa compare-and-set na versão lida, então uma sessão retomada
+    pelo usuário durante a varredura não é arquivada. Retorna o número de
+    sessões arquivadas.
+    """
+    antecedencia = settings.ARQUIVAMENTO_ANTECEDENCIA if antecedencia is None else antecedencia
+    diretorio = diretorio or settings.ARQUIVAMENTO_DIR
+    os.makedirs(diretorio, exist_ok=True)
+    caminho = os.path.join(diretorio, f"sessoes_{datetime.now().strftime('%Y-%m-%d')}.jsonl.gz")
+
+    arquivadas = 0
+    with gzip.open(caminho, "at", encoding="utf-8") as arquivo:
+        for chaves in _lotes(r.scan_iter(match=f"{PREFIXO_ESTADO}*", count=tamanho_lote), tamanho_lote):
+            pipe = r.pipeline(transaction=False)
+            for chave in chaves:
+                pipe.ttl(chave)
+            ttls = pipe.execute()
+
+            candidatas = [(chave, ttl) for chave, ttl in zip(chaves, ttls) if 0 <= ttl <= antecedencia]
+            if not candidatas:
+                continue
+
+            pipe = r.pipeline(transaction=False)
+            for chave, _ in candidatas:
+                pipe.hgetall(chave)
+            dados = pipe.execute()
+
+            for (chave, ttl), hash_estado in zip(candidatas, dados):
+                if not hash_estado:
+                    continue
+                user_key = chave[len(PREFIXO_ESTADO):]
+                try:
+                    user_state = UserState.de_hash(hash_estado)
+                except Exception as e:
+                    log.error("Erro ao deserializar sessão para arquivamento", extra={"user_id": user_key, "error": str(e)})
+                    continue
+
+                if not remover_estado_se_versao(r, user_key, user_state.version):
+                    continue
+
+                registro = user_state.model_dump()
+                registro["user_key"] = user_key
+                registro["arquivado_em"] = int(time.time())
+                registro["ttl_restante"] = ttl
+                arquivo.write(json.dumps(registro, ensure_ascii=False) + "\n")
+                arquivadas += 1
+
+    log.info("Arquivamento de sessões concluído", extra={"sessions_archived": arquivadas, "archive_file": caminho})
+    return arquivadas
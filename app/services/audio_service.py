@@ -0,0 +1,217 @@
+import logging
+import statistics
+import struct
+from dataclasses import dataclass
+from typing import List, Optional
+
+from app.config import settings
+
+log = logging.getLogger(__name__)
+
+# O Opus sempre decodifica a 48 kHz; posições de granule e durações usam essa base.
+AMOSTRAS_POR_SEGUNDO = 48000
+TAXAS_ACEITAS_STT = (8000, 12000, 16000, 24000, 48000)
+
+
+def _tabela_crc_ogg():
+    tabela = []
+    for i in range(256):
+        crc = i << 24
+        for _ in range(8):
+            crc = ((crc << 1) ^ 0x04C11DB7) if crc & 0x80000000 else (crc << 1)
+        tabela.append(crc & 0xFFFFFFFF)
+    return tabela
+
+
+_CRC_OGG = _tabela_crc_ogg()
+
+
+def _crc_ogg(dados: bytes) -> int:
+    crc = 0
+    for byte in dados:
+        crc = ((crc << 8) & 0xFFFFFFFF) ^ _CRC_OGG[(crc >> 24) ^ byte]
+    return crc
+
+
+@dataclass
+class AudioOpus:
+    """Áudio Ogg Opus já separado em pacotes, sem decodificar o som."""
+    cabecalho: bytes
+    tags: bytes
+    pacotes: List[bytes]
+    amostras: List[int]
+    canais: int
+    taxa_original: int
+
+    @property
+    def duracao(self) -> float:
+        return sum(self.amostras) / AMOSTRAS_POR_SEGUNDO
+
+    @property
+    def taxa_stt(self) -> int:
+        """Taxa a informar ao Speech-to-Text: a original, se aceita, ou 48 kHz."""
+        return self.taxa_original if self.taxa_original in TAXAS_ACEITAS_STT else AMOSTRAS_POR_SEGUNDO
+
+
+def _amostras_do_pacote(pacote: bytes) -> int:
+    """Duração de um pacote Opus (em amostras a 48 kHz) a partir do byte TOC (RFC 6716, 3.1)."""
+    if not pacote:
+        return 0
+    config = pacote[0] >> 3
+    if config < 12:
+        duracao_ms = (10, 20, 40, 60)[config % 4]
+    elif config < 16:
+        duracao_ms = (10, 20)[config % 2]
+    else:
+        duracao_ms = (2.5, 5, 10, 20)[config % 4]
+    codigo = pacote[0] & 0x03
+    if codigo == 0:
+        quadros = 1
+    elif codigo in (1, 2):
+        quadros = 2
+    else:
+        quadros = pacote[1] & 0x3F if len(pacote) > 1 else 0
+    return int(duracao_ms * 48 * quadros)
+
+
+def _ler_pacotes_ogg(dados: bytes) -> List[bytes]:
+    """Remonta os pacotes de um fluxo Ogg (um único stream lógico)."""
+    pacotes, atual, posicao = [], [], 0
+    while posicao + 27 <= len(dados):
+        if dados[posicao:posicao + 4] != b"OggS":
+            raise ValueError("Página Ogg inválida.")
+        n_segmentos = dados[posicao + 26]
+        tabela = dados[posicao + 27:posicao + 27 + n_segmentos]
+        posicao += 27 + n_segmentos
+        for tamanho in tabela:
+            atual.append(dados[posicao:posicao + tamanho])
+            posicao += tamanho
+            if tamanho < 255:
+                pacotes.append(b"".join(atual))
+                atual = []
+    if posicao != len(dados):
+        raise ValueError("Fluxo Ogg truncado.")
+    return pacotes
+
+
+def inspecionar_audio(dados: bytes) -> Optional[AudioOpus]:
+    """
+    Reconhece um áudio Ogg Opus (formato das notas de voz do WhatsApp) e o
+    separa em pacotes. Retorna None para qualquer outro formato ou arquivo
+    corrompido, caso em que o áudio deve seguir sem pré-processamento.
+    """
+    if not dados.startswith(b"OggS"):
+        return None
+    try:
+        pacotes = _ler_pacotes_ogg(dados)
+    except ValueError as e:
+        log.warning("Áudio Ogg inválido; seguindo sem pré-processamento", extra={"error": str(e)})
+        return None
+    if len(pacotes) < 2 or not pacotes[0].startswith(b"OpusHead") or not pacotes[1].startswith(b"OpusTags"):
+        return None
+
+    canais = pacotes[0][9]
+    taxa_original = struct.unpack_from("<I", pacotes[0], 12)[0]
+    audio = pacotes[2:]
+    return AudioOpus(pacotes[0], pacotes[1], audio, [_amostras_do_pacote(p) for p in audio], canais, taxa_original)
+
+
+def _escrever_pagina(serial: int, sequencia: int, granule: int, tipo: int, pacotes: List[bytes]) -> bytes:
+    tabela, corpo = bytearray(), []
+    for pacote in pacotes:
+        tabela.extend([255] * (len(pacote) // 255) + [len(pacote) % 255])
+        corpo.append(pacote)
+    cabecalho = struct.pack("<4sBBqIIIB", b"OggS", 0, tipo, granule, serial, sequencia, 0, len(tabela))
+    pagina = bytearray(cabecalho + bytes(tabela) + b"".join(corpo))
+    struct.pack_into("<I", pagina, 22, _crc_ogg(bytes(pagina)))
+    return bytes(pagina)
+
+
+def escrever_ogg_opus(cabecalho: bytes, tags: bytes, pacotes: List[bytes], serial: int = 1) -> bytes:
+    """
+    Monta um fluxo Ogg Opus válido com os pacotes dados, recalculando as
+    posições de granule e os CRCs. Usado para gerar os trechos do áudio.
+    """
+    paginas = [
+        _escrever_pagina(serial, 0, 0, 0x02, [cabecalho]),
+        _escrever_pagina(serial, 1, 0, 0x00, [tags]),
+    ]
+    granule, sequencia, pagina, segmentos = 0, 2, [], 0
+    for i, pacote in enumerate(pacotes):
+        necessarios = len(pacote) // 255 + 1
+        if pagina and segmentos + necessarios > 255:
+            paginas.append(_escrever_pagina(serial, sequencia, granule, 0x00, pagina))
+            sequencia, pagina, segmentos = sequencia + 1, [], 0
+        pagina.append(pacote)
+        segmentos += necessarios
+        granule += _amostras_do_pacote(pacote)
+    paginas.append(_escrever_pagina(serial, sequencia, granule, 0x04, pagina))
+    return b"".join(paginas)
+
+
+def _pacotes_silenciosos(audio: AudioOpus) -> List[bool]:
+    """
+    Marca os pacotes de silêncio sem decodificar o som: com VBR/DTX, o Opus
+    codifica silêncio em pacotes muito menores que os de fala.
+    """
+    tamanhos = [len(p) for p in audio.pacotes]
+    if not tamanhos:
+        return []
+    limite = max(3, statistics.median(tamanhos) * settings.AUDIO_FRACAO_SILENCIO)
+    return [tamanho <= limite for tamanho in tamanhos]
+
+
+def aparar_silencio(audio: AudioOpus) -> AudioOpus:
+    """Remove o silêncio do começo e do fim, mantendo AUDIO_MARGEM_SILENCIO segundos de folga."""
+    silencio = _pacotes_silenciosos(audio)
+    if all(silencio):
+        return audio
+    margem = int(settings.AUDIO_MARGEM_SILENCIO * AMOSTRAS_POR_SEGUNDO)
+
+    inicio, folga = silencio.index(False), 0
+    while inicio > 0 and folga < margem:
+        inicio -= 1
+        folga += audio.amostras[inicio]
+    fim, folga = len(silencio) - silencio[::-1].index(False), 0
+    while fim < len(silencio) and folga < margem:
+        folga += audio.amostras[fim]
+        fim += 1
+
+    return AudioOpus(audio.cabecalho, audio.tags, audio.pacotes[inicio:fim], audio.amostras[inicio:fim],
+                     audio.canais, audio.taxa_original)
+
+
+def dividir_audio(audio: AudioOpus, duracao_maxima: float | None = None) -> List[bytes]:
+    """
+    Divide o áudio em trechos Ogg Opus de até `duracao_maxima` segundos
+    (AUDIO_DURACAO_MAX_TRECHO), cortando preferencialmente no meio da pausa
+    mais longa dos últimos segundos de cada trecho, para não partir palavras.
+    """
+    duracao_maxima = duracao_maxima or settings.AUDIO_DURACAO_MAX_TRECHO
+    limite = int(duracao_maxima * AMOSTRAS_POR_SEGUNDO)
+    busca = int(min(10.0, duracao_maxima / 4) * AMOSTRAS_POR_SEGUNDO)
+    silencio = _pacotes_silenciosos(audio)
+
+    trechos, inicio = [], 0
+    while inicio < len(audio.pacotes):
+        acumulado, fim = 0, inicio
+        while fim < len(audio.pacotes) and acumulado + audio.amostras[fim] <= limite:
+            acumulado += audio.amostras[fim]
+            fim += 1
+        fim = max(fim, inicio + 1)
+
+        if fim < len(audio.pacotes):
+            melhor, melhor_tamanho, corrida, tempo = None, 0, 0, acumulado
+            for i in range(fim - 1, inicio, -1):
+                tempo -= audio.amostras[i]
+                if acumulado - tempo > busca:
+                    break
+                corrida = corrida + 1 if silencio[i] else 0
+                if corrida > melhor_tamanho:
+                    melhor, melhor_tamanho = i + corrida // 2, corrida
+            if melhor is not None:
+                fim = melhor
+
+        trechos.append(escrever_ogg_opus(audio.cabecalho, audio.tags, audio.pacotes[inicio:fim]))
+        inicio = fim
+    return trechos
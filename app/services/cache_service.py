@@ -0,0 +1,216 @@
+import hashlib
+import json
+import logging
+import random
+import time
+from typing import List, Optional
+
+from app.config import settings
+from app.services.audio_service import inspecionar_audio
+from app.utils import hash_contexto
+
+log = logging.getLogger(__name__)
+
+PREFIXO_CACHE_PERGUNTAS = "cache_perguntas:"
+INDICE_LRU_PERGUNTAS = "cache_perguntas:lru"
+PREFIXO_CACHE_TRANSCRICAO = "cache_transcricao:"
+
+
+def chave_perguntas(hash_ctx: str) -> str:
+    """Chave da lista de variantes de perguntas de um contexto normalizado."""
+    return f"{PREFIXO_CACHE_PERGUNTAS}{hash_ctx}"
+
+
+def buscar_perguntas_em_cache(r, contexto: str, user_key: str | None = None) -> Optional[List[str]]:
+    """
+    Procura perguntas já geradas para um contexto equivalente.
+
+    Cada contexto normalizado guarda um conjunto de até CACHE_PERGUNTAS_VARIANTES
+    variantes. Enquanto o conjunto não estiver completo, a busca é tratada como
+    miss para que uma nova variante seja gerada; depois disso, uma variante é
+    sorteada, para que usuários com o mesmo contexto não recebam sempre as
+    mesmas perguntas. Retorna None em caso de miss ou erro.
+    """
+    if not settings.CACHE_PERGUNTAS_ATIVO:
+        return None
+
+    hash_ctx = hash_contexto(contexto)
+    chave = chave_perguntas(hash_ctx)
+    try:
+        variantes = r.lrange(chave, 0, -1)
+        if len(variantes) < settings.CACHE_PERGUNTAS_VARIANTES:
+            log.info("Cache de perguntas: miss", extra={
+                "action": "question_cache_miss",
+                "user_id": user_key,
+                "cache_key": hash_ctx[:16],
+                "variants": len(variantes)
+            })
+            return None
+
+        pipe = r.pipeline(transaction=False)
+        pipe.expire(chave, settings.CACHE_PERGUNTAS_TTL)
+        pipe.zadd(INDICE_LRU_PERGUNTAS, {hash_ctx: time.time()})
+        pipe.execute()
+
+        log.info("Cache de perguntas: hit", extra={
+            "action": "question_cache_hit",
+            "user_id": user_key,
+            "cache_key": hash_ctx[:16],
+            "variants": len(variantes)
+        })
+        return json.loads(random.choice(variantes))
+    except Exception as e:
+        log.error("Erro ao consultar cache de perguntas", extra={"user_id": user_key, "error": str(e)})
+        return None
+
+
+def salvar_perguntas_em_cache(r, contexto: str, perguntas: List[str]) -> List[str]:
+    """
+    Adiciona uma variante de perguntas ao cache do contexto, renovando o TTL
+    e removendo as chaves menos usadas quando o limite é excedido.
+    Retorna os hashes de contexto removidos, para o cache semântico descartá-los.
+    """
+    if not settings.CACHE_PERGUNTAS_ATIVO:
+        return []
+
+    hash_ctx = hash_contexto(contexto)
+    chave = chave_perguntas(hash_ctx)
+    try:
+        pipe = r.pipeline(transaction=False)
+        pipe.rpush(chave, json.dumps(perguntas, ensure_ascii=False))
+        pipe.ltrim(chave, -settings.CACHE_PERGUNTAS_VARIANTES, -1)
+        pipe.expire(chave, settings.CACHE_PERGUNTAS_TTL)
+        pipe.zadd(INDICE_LRU_PERGUNTAS, {hash_ctx: time.time()})
+        pipe.zcard(INDICE_LRU_PERGUNTAS)
+        total_chaves = pipe.execute()[-1]
+
+        excesso = total_chaves - settings.CACHE_PERGUNTAS_MAX_CHAVES
+        if excesso > 0:
+            menos_usadas = r.zpopmin(INDICE_LRU_PERGUNTAS, excesso)
+            r.delete(*[chave_perguntas(h) for h, _ in menos_usadas])
+            log.info("Cache de perguntas: chaves removidas por LRU", extra={"evicted": len(menos_usadas)})
+            return [h for h, _ in menos_usadas]
+    except Exception as e:
+        log.error("Erro ao salvar perguntas no cache", extra={"error": str(e)})
+    return []
+
+
+def chave_transcricao_midia(media_url: str) -> str:
+    """
+    Chave da transcrição de uma mídia da Twilio. A URL da mídia contém o
+    MessageSid, então identifica a mesma mensagem em retentativas do webhook.
+    """
+    return f"{PREFIXO_CACHE_TRANSCRICAO}midia:{hashlib.sha256(media_url.encode('utf-8')).hexdigest()}"
+
+
+def chave_transcricao_conteudo(conteudo: bytes) -> str:
+    """Chave da transcrição pelo SHA-256 dos bytes do áudio (pega notas de voz encaminhadas)."""
+    return f"{PREFIXO_CACHE_TRANSCRICAO}conteudo:{hashlib.sha256(conteudo).hexdigest()}"
+
+
+def _registrar_consulta_transcricao(valor: Optional[str], origem: str, user_key: str | None) -> Optional[str]:
+    """Desserializa o valor em cache e registra o hit/miss com os segundos de STT economizados."""
+    if valor is None:
+        log.info("Cache de transcrição: miss", extra={"action": "transcription_cache_miss", "user_id": user_key})
+        return None
+    dados = json.loads(valor)
+    log.info("Cache de transcrição: hit", extra={
+        "action": "transcription_cache_hit",
+        "user_id": user_key,
+        "cache_source": origem,
+        "audio_seconds_saved": dados.get("segundos"),
+    })
+    return dados["texto"]
+
+
+def _valor_transcricao(conteudo: bytes, texto: str) -> str:
+    audio = inspecionar_audio(conteudo)
+    return json.dumps({"texto": texto, "segundos": round(audio.duracao, 1) if audio else None}, ensure_ascii=False)
+
+
+def buscar_transcricao_por_midia(r, media_url: str, user_key: str | None = None) -> Optional[str]:
+    """
+    Procura a transcrição de uma mídia já processada, antes mesmo de baixá-la.
+    Só registra hits: um miss aqui ainda pode virar hit por conteúdo.
+    """
+    if not settings.CACHE_TRANSCRICAO_ATIVO or not media_url:
+        return None
+    try:
+        valor = r.get(chave_transcricao_midia(media_url))
+        return _registrar_consulta_transcricao(valor, "media_url", user_key) if valor else None
+    except Exception as e:
+        log.error("Erro ao consultar cache de transcrição", extra={"user_id": user_key, "error": str(e)})
+        return None
+
+
+def buscar_transcricao_por_conteudo(r, media_url: str, conteudo: bytes, user_key: str | None = None) -> Optional[str]:
+    """
+    Procura a transcrição pelos bytes do áudio já baixado. Em caso de hit,
+    associa também a URL da mídia, para que retentativas nem baixem o áudio.
+    """
+    if not settings.CACHE_TRANSCRICAO_ATIVO:
+        return None
+    try:
+        valor = r.get(chave_transcricao_conteudo(conteudo))
+        if valor and media_url:
+            r.set(chave_transcricao_midia(media_url), valor, ex=settings.CACHE_TRANSCRICAO_TTL)
+        return _registrar_consulta_transcricao(valor, "content_hash", user_key)
+    except Exception as e:
+        log.error("Erro ao consultar cache de transcrição", extra={"user_id": user_key, "error": str(e)})
+        return None
+
+
+def salvar_transcricao_em_cache(r, media_url: str, conteudo: bytes, texto: str):
+    """Guarda a transcrição pela URL da mídia e pelo hash do conteúdo, com CACHE_TRANSCRICAO_TTL."""
+    if not settings.CACHE_TRANSCRICAO_ATIVO or not texto:
+        return
+    try:
+        valor = _valor_transcricao(conteudo, texto)
+        pipe = r.pipeline(transaction=False)
+        pipe.set(chave_transcricao_conteudo(conteudo), valor, ex=settings.CACHE_TRANSCRICAO_TTL)
+        if media_url:
+            pipe.set(chave_transcricao_midia(media_url), valor, ex=settings.CACHE_TRANSCRICAO_TTL)
+        pipe.execute()
+    except Exception as e:
+        log.error("Erro ao salvar transcrição no cache", extra={"error": str(e)})
+
+
+async def buscar_transcricao_por_midia_async(r, media_url: str, user_key: str | None = None) -> Optional[str]:
+    """Versão assíncrona de `buscar_transcricao_por_midia`, usada pelo webhook."""
+    if not settings.CACHE_TRANSCRICAO_ATIVO or not media_url:
+        return None
+    try:
+        valor = await r.get(chave_transcricao_midia(media_url))
+        return _registrar_consulta_transcricao(valor, "media_url", user_key) if valor else None
+    except Exception as e:
+        log.error("Erro ao consultar cache de transcrição", extra={"user_id": user_key, "error": str(e)})
+        return None
+
+
+async def buscar_transcricao_por_conteudo_async(r, media_url: str, conteudo: bytes, user_key: str | None = None) -> Optional[str]:
+    """Versão assíncrona de `buscar_transcricao_por_conteudo`."""
+    if not settings.CACHE_TRANSCRICAO_ATIVO:
+        return None
+    try:
+        valor = await r.get(chave_transcricao_conteudo(conteudo))
+        if valor and media_url:
+            await r.set(chave_transcricao_midia(media_url), valor, ex=settings.CACHE_TRANSCRICAO_TTL)
+        return _registrar_consulta_transcricao(valor, "content_hash", user_key)
+    except Exception as e:
+        log.error("Erro ao consultar cache de transcrição", extra={"user_id": user_key, "error": str(e)})
+        return None
+
+
+async def salvar_transcricao_em_cache_async(r, media_url: str, conteudo: bytes, texto: str):
+    """Versão assíncrona de `salvar_transcricao_em_cache`."""
+    if not settings.CACHE_TRANSCRICAO_ATIVO or not texto:
+        return
+    try:
+        valor = _valor_transcricao(conteudo, texto)
+        pipe = r.pipeline(transaction=False)
+        pipe.set(chave_transcricao_conteudo(conteudo), valor, ex=settings.CACHE_TRANSCRICAO_TTL)
+        if media_url:
+            pipe.set(chave_transcricao_midia(media_url), valor, ex=settings.CACHE_TRANSCRICAO_TTL)
+        await pipe.execute()
+    except Exception as e:
+        log.error("Erro ao salvar transcrição no cache", extra={"error": str(e)})
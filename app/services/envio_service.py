@@ -0,0 +1,138 @@
+import logging
+import random
+import time
+from functools import lru_cache
+
+from twilio.base.exceptions import TwilioRestException
+
+from app.config import settings
+from app.metricas import medir_dependencia
+from app.services.twilio_service import erro_transitorio
+
+log = logging.getLogger(__name__)
+
+# Prioridades do transporte Redis do Celery: quanto menor, antes sai da fila.
+PRIORIDADE_ALTA = 0
+PRIORIDADE_BAIXA = 9
+
+# Token bucket: repõe `taxa` tokens por segundo até `capacidade` e consome um
+# por envio. Usa o relógio do Redis para que todos os workers concordem.
+# Retorna "0" se o token foi concedido ou, caso contrário, os segundos até o próximo.
+LUA_TOKEN_BUCKET = """
+local capacidade = tonumber(ARGV[1])
+local taxa = tonumber(ARGV[2])
+local relogio = redis.call('TIME')
+local agora = tonumber(relogio[1]) + tonumber(relogio[2]) / 1000000
+
+local dados = redis.call('HMGET', KEYS[1], 'tokens', 'ts')
+local tokens = tonumber(dados[1]) or capacidade
+local ts = tonumber(dados[2]) or agora
+tokens = math.min(capacidade, tokens + math.max(0, agora - ts) * taxa)
+
+local espera = 0
+if tokens >= 1 then
+    tokens = tokens - 1
+else
+    espera = (1 - tokens) / taxa
+end
+
+redis.call('HSET', KEYS[1], 'tokens', tostring(tokens), 'ts', tostring(agora))
+redis.call('EXPIRE', KEYS[1], math.ceil(capacidade / taxa) + 1)
+return tostring(espera)
+"""
+
+
+@lru_cache()
+def _script_token_bucket(r):
+    """Registra o script do token bucket uma vez por cliente Redis."""
+    return r.register_script(LUA_TOKEN_BUCKET)
+
+
+class EnvioRecusadoError(RuntimeError):
+    """A Twilio recusou a parte de forma definitiva; tentar de novo não adianta."""
+
+
+def chave_limite_envio(remetente: str) -> str:
+    """Chave do token bucket de envios de um número remetente."""
+    return f"limite_envio:{remetente}"
+
+
+def consumir_token_envio(r, remetente: str | None = None) -> float:
+    """
+    Tenta consumir um token do bucket do remetente (por padrão,
+    TWILIO_WHATSAPP_NUMBER). Retorna 0 se o envio está liberado ou quantos
+    segundos faltam para o próximo token.
+    """
+    remetente = remetente or settings.TWILIO_WHATSAPP_NUMBER
+    espera = _script_token_bucket(r)(
+        keys=[chave_limite_envio(remetente)],
+        args=[settings.TWILIO_RAJADA_ENVIOS, settings.TWILIO_LIMITE_ENVIOS_POR_SEGUNDO],
+    )
+    return float(espera)
+
+
+def despachar_parte(r, twilio_client, destinatario: str, corpo: str, tentativa: int = 0) -> float | None:
+    """
+    Envia uma parte de mensagem respeitando o limite de envios do remetente.
+
+    Esperas curtas por token (até TWILIO_ESPERA_MAXIMA_TOKEN) são feitas aqui
+    mesmo. Retorna None quando a parte foi aceita pela Twilio e, quando ela
+    deve ser tentada de novo, os segundos até a nova tentativa: falta de
+    token, throttling (429) ou falha transitória. Levanta EnvioRecusadoError
+    (já registrado em log) se a falha for definitiva.
+    """
+    espera = consumir_token_envio(r)
+    while espera:
+        if espera > settings.TWILIO_ESPERA_MAXIMA_TOKEN:
+            return espera
+        time.sleep(espera)
+        espera = consumir_token_envio(r)
+
+    try:
+        with medir_dependencia("twilio", "enviar_mensagem"):
+            twilio_client.messages.create(from_=settings.TWILIO_WHATSAPP_NUMBER, body=corpo, to=destinatario)
+        return None
+    except Exception as e:
+        backoff = settings.TWILIO_BACKOFF_INICIAL * 2 ** min(tentativa, 6) * random.uniform(0.5, 1.5)
+        if isinstance(e, TwilioRestException) and e.status == 429:
+            log.warning("Twilio limitou o envio (429); nova tentativa agendada", extra={
+                "action": "outbound_throttled", "recipient": destinatario, "retry_in": round(backoff, 2)
+            })
+            return backoff
+        if erro_transitorio(e) and tentativa + 1 < settings.TWILIO_TENTATIVAS_ENVIO:
+            log.warning("Falha transitória ao enviar parte da mensagem; nova tentativa agendada", extra={
+                "error": str(e), "recipient": destinatario, "attempt": tentativa + 1
+            })
+            return backoff
+        log.error("Erro ao enviar parte da mensagem via Twilio", extra={
+            "error": str(e), "recipient": destinatario, "attempts": tentativa + 1
+        })
+        raise EnvioRecusadoError(str(e)) from e
+
+
+def enviar_em_ordem(r, twilio_client, destinatario: str, corpo: str) -> bool:
+    """
+    Envia uma parte pelo limitador de envios, esperando aqui mesmo pelo token
+    e pelas novas tentativas, para que partes enviadas em sequência pelo
+    chamador cheguem na ordem. Usado pelo feedback em streaming, que não tem
+    como devolver a espera ao broker no meio da geração; o despachante de
+    mensagens reagenda a própria task (`tarefa_enviar_mensagem`).
+
+    Retorna True se a parte foi aceita e False se ela falhou de forma
+    definitiva ou se o throttling persistiu por TWILIO_MAX_REENVIOS esperas.
+    """
+    try:
+        espera = despachar_parte(r, twilio_client, destinatario, corpo, 0)
+        for tentativa in range(1, settings.TWILIO_MAX_REENVIOS + 1):
+            if espera is None:
+                return True
+            time.sleep(espera)
+            espera = despachar_parte(r, twilio_client, destinatario, corpo, tentativa)
+    except EnvioRecusadoError:
+        return False
+    if espera is None:
+        return True
+    log.error("Envio da parte abandonado após o limite de novas tentativas", extra={
+        "recipient": destinatario, "attempts": settings.TWILIO_MAX_REENVIOS + 1
+    })
+    return False
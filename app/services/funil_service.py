@@ -0,0 +1,59 @@
+from datetime import date, timedelta
+
+from app.services.redis_service import chave_contador_funil, chave_usuarios_funil
+
+# Funil de conversão mantido em tempo real no Redis. Os handlers da máquina de
+# estados registram no UserState os eventos do funil de cada transição, e o
+# CAS que grava o estado (`redis_service.atualizar_estado`) incrementa, no
+# mesmo script, para cada evento do dia:
+# - `funil:AAAA-MM-DD:<evento>`: contador de ocorrências (INCR);
+# - `funil:AAAA-MM-DD:<evento>:usuarios`: HyperLogLog dos usuários (PFADD).
+# As chaves expiram em FUNIL_CONTADORES_TTL. O funil de um período é lido com
+# um MGET dos contadores e um PFCOUNT (que une os HyperLogLogs dos dias) por
+# evento, num único pipeline. Os usuários distintos são estimados, com erro
+# padrão de 0,81%.
+
+EVENTOS_FUNIL = ("new_user_detected", "interview_started", "interview_completed", "user_feedback_received", "pro_email_collected")
+
+
+def dias_do_periodo(de: str, ate: str) -> list[str]:
+    """Dias (AAAA-MM-DD) de `de` até `ate`, inclusive."""
+    inicio, fim = date.fromisoformat(de), date.fromisoformat(ate)
+    return [str(inicio + timedelta(days=i)) for i in range((fim - inicio).days + 1)]
+
+
+def _enfileirar_consultas(pipe, dias: list[str], eventos) -> None:
+    for evento in eventos:
+        pipe.mget([chave_contador_funil(dia, evento) for dia in dias])
+        pipe.pfcount(*[chave_usuarios_funil(dia, evento) for dia in dias])
+
+
+def _montar_funil(eventos, respostas: list) -> list[tuple[str, int, int]]:
+    return [
+        (evento, sum(int(c) for c in respostas[2 * i] if c), respostas[2 * i + 1])
+        for i, evento in enumerate(eventos)
+    ]
+
+
+def consultar_funil(r, de: str, ate: str, eventos=EVENTOS_FUNIL) -> list[tuple[str, int, int]]:
+    """
+    Funil de `de` até `ate` (AAAA-MM-DD, inclusive) a partir dos contadores
+    diários: lista de `(evento, ocorrências, usuários distintos estimados)`
+    na ordem de `eventos`. Uma única ida ao Redis.
+    """
+    dias = dias_do_periodo(de, ate)
+    if not dias:
+        return [(evento, 0, 0) for evento in eventos]
+    pipe = r.pipeline(transaction=False)
+    _enfileirar_consultas(pipe, dias, eventos)
+    return _montar_funil(eventos, pipe.execute())
+
+
+async def consultar_funil_async(r, de: str, ate: str, eventos=EVENTOS_FUNIL) -> list[tuple[str, int, int]]:
+    """Versão assíncrona de `consultar_funil`."""
+    dias = dias_do_periodo(de, ate)
+    if not dias:
+        return [(evento, 0, 0) for evento in eventos]
+    pipe = r.pipeline(transaction=False)
+    _enfileirar_consultas(pipe, dias, eventos)
+    return _montar_funil(eventos, await pipe.execute())
@@ -1,14 +1,27 @@
 import logging
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from concurrent.futures import TimeoutError as FuturoTimeoutError
 from functools import lru_cache
+from typing import Any, Callable, Iterator
 from google.oauth2 import service_account
 from google.cloud import speech
 import vertexai
-from vertexai.generative_models import GenerativeModel
+from vertexai.generative_models import GenerativeModel, GenerationConfig
 
 from app.config import settings
+from app.metricas import medir_dependencia
+from app.services.audio_service import aparar_silencio, dividir_audio, inspecionar_audio
+from app.services.redis_service import get_redis_client
 
 log = logging.getLogger(__name__)
 
+_vertexai_inicializado = False
+_modelos = {}
+_lock_modelos = threading.Lock()
+
 
 @lru_cache()
 def get_gcp_credentials():
@@ -47,18 +60,204 @@ def get_speech_client():
         return None
 
 
+@lru_cache()
+def get_stt_executor() -> ThreadPoolExecutor:
+    """
+    Retorna o pool de threads dedicado às chamadas síncronas de Speech-to-Text.
+    Separado do thread pool padrão para que áudios lentos não esgotem as
+    threads usadas pelas demais operações do webhook.
+    """
+    return ThreadPoolExecutor(max_workers=settings.STT_THREADPOOL_SIZE, thread_name_prefix="stt")
+
+
+class CircuitoAbertoError(RuntimeError):
+    """Chamada recusada na hora porque o disjuntor do serviço está aberto."""
+
+
+@lru_cache()
+def get_resiliencia_executor() -> ThreadPoolExecutor:
+    """
+    Pool de threads das chamadas protegidas por `ResilienciaServico`. Chamadas
+    que estouram o prazo continuam aqui até terminar, sem prender a task.
+    """
+    return ThreadPoolExecutor(max_workers=settings.GCP_THREADPOOL_SIZE, thread_name_prefix="gcp")
+
+
+class ResilienciaServico:
+    """
+    Prazos adaptativos, hedging e disjuntor para as chamadas a um serviço do GCP.
+
+    - O prazo de cada chamada é o p99 das latências recentes vezes
+      GCP_PRAZO_FATOR, limitado a [GCP_PRAZO_MINIMO, GCP_PRAZO_MAXIMO].
+    - Se a chamada passa do percentil GCP_HEDGE_PERCENTIL (ou falha), uma
+      segunda requisição é disparada e vale a primeira que responder.
+    - Se a taxa de erro na janela DISJUNTOR_JANELA passa de DISJUNTOR_TAXA_ERRO,
+      o disjuntor abre por DISJUNTOR_PAUSA segundos: as chamadas falham na hora
+      com CircuitoAbertoError. A abertura é publicada no Redis para que os
+      outros processos também parem de chamar o serviço.
+    """
+
+    def __init__(self, nome: str):
+        self.nome = nome
+        self.latencias = deque(maxlen=500)
+        self.resultados = deque()
+        self.aberto_ate = 0.0
+        self._redis_verificado_em = 0.0
+        self.lock = threading.Lock()
+
+    def percentil(self, p: float) -> float | None:
+        with self.lock:
+            amostras = sorted(self.latencias)
+        if len(amostras) < settings.GCP_AMOSTRAS_MINIMAS:
+            return None
+        return amostras[min(len(amostras) - 1, int(len(amostras) * p / 100))]
+
+    def prazo(self) -> float:
+        p99 = self.percentil(99)
+        if p99 is None:
+            return settings.GCP_PRAZO_MAXIMO
+        return min(settings.GCP_PRAZO_MAXIMO, max(settings.GCP_PRAZO_MINIMO, p99 * settings.GCP_PRAZO_FATOR))
+
+    def circuito_aberto(self) -> bool:
+        agora = time.monotonic()
+        if agora < self.aberto_ate:
+            return True
+        if agora - self._redis_verificado_em < 1.0:
+            return False
+        self._redis_verificado_em = agora
+        try:
+            r = get_redis_client()
+            ttl = r.pttl(f"disjuntor:{self.nome}") if r else -2
+        except Exception:
+            return False
+        if ttl > 0:
+            self.aberto_ate = agora + ttl / 1000
+            return True
+        return False
+
+    def registrar(self, sucesso: bool, latencia: float | None = None):
+        with self.lock:
+            agora = time.monotonic()
+            if latencia is not None:
+                self.latencias.append(latencia)
+            self.resultados.append((agora, sucesso))
+            while self.resultados and self.resultados[0][0] < agora - settings.DISJUNTOR_JANELA:
+                self.resultados.popleft()
+            erros = sum(1 for _, ok in self.resultados if not ok)
+            abrir = (len(self.resultados) >= settings.DISJUNTOR_MIN_CHAMADAS
+                     and erros / len(self.resultados) >= settings.DISJUNTOR_TAXA_ERRO)
+            if abrir:
+                self.aberto_ate = agora + settings.DISJUNTOR_PAUSA
+                self.resultados.clear()
+
+        if abrir:
+            log.error("Disjuntor aberto: taxa de erro alta no serviço", extra={
+                "action": "circuit_opened", "service": self.nome, "pause_s": settings.DISJUNTOR_PAUSA
+            })
+            try:
+                r = get_redis_client()
+                if r:
+                    r.set(f"disjuntor:{self.nome}", "1", px=int(settings.DISJUNTOR_PAUSA * 1000))
+            except Exception as e:
+                log.warning("Não foi possível publicar o disjuntor no Redis", extra={"service": self.nome, "error": str(e)})
+
+    def verificar_circuito(self):
+        """Levanta CircuitoAbertoError se o disjuntor do serviço estiver aberto."""
+        if self.circuito_aberto():
+            log.warning("Chamada recusada pelo disjuntor", extra={"action": "circuit_rejected", "service": self.nome})
+            raise CircuitoAbertoError(f"Serviço {self.nome} instável; chamada recusada pelo disjuntor.")
+
+    def executar(self, funcao: Callable[[float], Any], hedge: bool = True) -> Any:
+        """
+        Executa `funcao(prazo_restante)` com prazo, segunda tentativa e
+        disjuntor. Levanta CircuitoAbertoError, TimeoutError ou o último erro
+        da chamada. Com `hedge=False`, faz uma única tentativa na própria
+        thread, e `funcao` é responsável por respeitar o prazo recebido.
+        """
+        self.verificar_circuito()
+        prazo = self.prazo()
+        if not hedge:
+            inicio = time.monotonic()
+            try:
+                resultado = funcao(prazo)
+            except Exception:
+                self.registrar(False)
+                raise
+            self.registrar(True, time.monotonic() - inicio)
+            return resultado
+
+        atraso_hedge = self.percentil(settings.GCP_HEDGE_PERCENTIL) if settings.GCP_HEDGE_ATIVO else None
+        executor = get_resiliencia_executor()
+        inicio = time.monotonic()
+
+        def tentativa():
+            comeco = time.monotonic()
+            return funcao(max(0.1, prazo - (comeco - inicio))), time.monotonic() - comeco
+
+        pendentes = {executor.submit(tentativa)}
+        segunda_disparada = False
+        erro = None
+        while True:
+            decorrido = time.monotonic() - inicio
+            restante = prazo - decorrido
+            if restante <= 0:
+                break
+            espera = restante
+            if not segunda_disparada and atraso_hedge is not None:
+                espera = min(restante, max(0.0, atraso_hedge - decorrido))
+
+            feitos, pendentes = wait(pendentes, timeout=espera, return_when=FIRST_COMPLETED)
+            for futuro in feitos:
+                try:
+                    resultado, latencia = futuro.result()
+                except Exception as e:
+                    erro = e
+                    continue
+                self.registrar(True, latencia)
+                return resultado
+
+            passou_do_hedge = atraso_hedge is not None and time.monotonic() - inicio >= atraso_hedge
+            if not segunda_disparada and (not pendentes or passou_do_hedge):
+                segunda_disparada = True
+                pendentes.add(executor.submit(tentativa))
+                log.info("Segunda requisição disparada", extra={
+                    "action": "hedged_request", "service": self.nome,
+                    "reason": "erro" if erro and not passou_do_hedge else "lentidao"
+                })
+                continue
+            if not pendentes:
+                break
+
+        self.registrar(False)
+        if erro is None or pendentes:
+            erro = TimeoutError(f"Prazo de {prazo:.1f}s excedido em {self.nome}.")
+        raise erro
+
+
+@lru_cache(maxsize=None)
+def get_resiliencia(nome: str) -> ResilienciaServico:
+    """Estado de resiliência (latências e disjuntor) de um serviço, um por processo."""
+    return ResilienciaServico(nome)
+
+
 def initialize_vertexai():
     """
     Inicializa o SDK do Vertex AI com as credenciais e projeto corretos.
-    Deve ser chamada uma vez durante o startup da aplicação.
+    Deve ser chamada uma vez durante o startup da aplicação; chamadas
+    seguintes no mesmo processo retornam imediatamente.
     """
+    global _vertexai_inicializado
+    if _vertexai_inicializado:
+        return True
+
     credentials = get_gcp_credentials()
     if not credentials or not settings.ID_PROJETO:
         log.critical("Não foi possível inicializar o Vertex AI. Credenciais ou ID do projeto ausentes.")
         return False
     
     try:
-        vertexai.init(project=settings.ID_PROJETO, credentials=credentials, location="us-central1")
+        vertexai.init(project=settings.ID_PROJETO, credentials=credentials, location=settings.VERTEX_LOCATION)
+        _vertexai_inicializado = True
         log.info("Vertex AI SDK inicializado com sucesso.")
         return True
     except Exception as e:
@@ -66,9 +265,133 @@ def initialize_vertexai():
         return False
 
 
+def get_generative_model(nome: str | None = None) -> GenerativeModel | None:
+    """
+    Retorna o handle do modelo generativo, criado uma única vez por processo.
+    O nome e a configuração de geração vêm de `Settings`. Retorna None se o
+    Vertex AI não puder ser inicializado.
+    """
+    nome = nome or settings.GEMINI_MODELO
+    modelo = _modelos.get(nome)
+    if modelo is not None:
+        return modelo
+
+    with _lock_modelos:
+        modelo = _modelos.get(nome)
+        if modelo is None:
+            if not initialize_vertexai():
+                return None
+            generation_config = GenerationConfig(
+                temperature=settings.GEMINI_TEMPERATURA,
+                max_output_tokens=settings.GEMINI_MAX_OUTPUT_TOKENS,
+            )
+            modelo = GenerativeModel(nome, generation_config=generation_config)
+            _modelos[nome] = modelo
+            log.info("Modelo generativo carregado", extra={"model": nome})
+    return modelo
+
+
+def aquecer_modelos() -> bool:
+    """
+    Inicializa o Vertex AI e o modelo padrão antes da primeira task.
+    Chamada pelo sinal `worker_process_init` em cada processo do Celery.
+    """
+    return get_generative_model() is not None
+
+
+def gerar_texto(prompt: str) -> str:
+    """
+    Gera texto com o modelo padrão, com prazo, hedging e disjuntor de
+    `ResilienciaServico`. Levanta RuntimeError se o modelo não estiver
+    disponível (CircuitoAbertoError se o disjuntor estiver aberto).
+
+    O `generate_content` do SDK não aceita timeout: o prazo é garantido pela
+    espera de `executar` no pool de threads, que abandona a chamada atrasada.
+    """
+    resiliencia = get_resiliencia("gemini")
+    model = get_generative_model()
+    if model is None:
+        raise RuntimeError("Modelo generativo indisponível.")
+    with medir_dependencia("gemini", "gerar_texto"):
+        return resiliencia.executar(lambda prazo: model.generate_content(prompt).text)
+
+
+def gerar_texto_em_stream(prompt: str) -> Iterator[str]:
+    """
+    Versão em streaming de `gerar_texto`: produz os trechos de texto à medida
+    que o modelo os gera. Levanta RuntimeError se o modelo não estiver disponível.
+
+    O stream tem o mesmo prazo e alimenta o mesmo disjuntor de `gerar_texto`,
+    mas sem hedging: trechos já entregues não podem ser refeitos. Cada trecho
+    é aguardado no pool de `ResilienciaServico` e o prazo conta só o tempo
+    esperando o modelo, não o do consumidor; estourado, levanta TimeoutError.
+    """
+    resiliencia = get_resiliencia("gemini")
+    resiliencia.verificar_circuito()
+    model = get_generative_model()
+    if model is None:
+        raise RuntimeError("Modelo generativo indisponível.")
+    prazo, esperando_modelo = resiliencia.prazo(), 0.0
+    executor = get_resiliencia_executor()
+    # Mede do pedido ao último trecho, incluindo o tempo em que o consumidor processa cada um.
+    with medir_dependencia("gemini", "gerar_texto_em_stream"):
+        try:
+            respostas = iter(model.generate_content(prompt, stream=True))
+            while True:
+                comeco = time.monotonic()
+                try:
+                    resposta = executor.submit(next, respostas, None).result(timeout=max(0.1, prazo - esperando_modelo))
+                except FuturoTimeoutError:
+                    raise TimeoutError(f"Prazo de {prazo:.1f}s excedido em gemini.") from None
+                esperando_modelo += time.monotonic() - comeco
+                if resposta is None:
+                    break
+                try:
+                    trecho = resposta.text
+                except ValueError:
+                    # Trechos sem texto (ex.: apenas metadados de segurança) são ignorados.
+                    continue
+                if trecho:
+                    yield trecho
+        except Exception:
+            resiliencia.registrar(False)
+            raise
+    resiliencia.registrar(True, esperando_modelo)
+
+
+@lru_cache()
+def get_stt_trechos_executor() -> ThreadPoolExecutor:
+    """
+    Pool de threads que transcreve em paralelo os trechos de um áudio longo.
+    Separado de `get_stt_executor`, que já está ocupado esperando o áudio inteiro.
+    """
+    return ThreadPoolExecutor(max_workers=settings.STT_THREADPOOL_SIZE, thread_name_prefix="stt-trecho")
+
+
+def _reconhecer_trecho(speech_client, conteudo: bytes, taxa: int) -> str:
+    """Transcreve um trecho de até um minuto, juntando todos os resultados reconhecidos."""
+    audio_para_api = speech.RecognitionAudio(content=conteudo)
+    config_api = speech.RecognitionConfig(
+        encoding=speech.RecognitionConfig.AudioEncoding.OGG_OPUS,
+        sample_rate_hertz=taxa,
+        language_code="pt-BR",
+        model="default"
+    )
+    with medir_dependencia("stt", "reconhecer"):
+        response = get_resiliencia("stt").executar(
+            lambda prazo: speech_client.recognize(config=config_api, audio=audio_para_api, timeout=prazo)
+        )
+    return " ".join(r.alternatives[0].transcript.strip() for r in response.results if r.alternatives)
+
+
 def transcrever_audio_gcp(audio_content: bytes) -> str:
     """
     Transcreve um conteúdo de áudio em bytes usando a API do Google Speech-to-Text.
+
+    Notas de voz Ogg Opus passam antes pelo `audio_service`: o silêncio do
+    começo e do fim é removido e áudios acima de AUDIO_DURACAO_MAX_TRECHO são
+    divididos em trechos (o `recognize` síncrono aceita cerca de um minuto),
+    transcritos em paralelo e concatenados na ordem.
     
     Args:
         audio_content: O conteúdo do áudio no formato de bytes.
@@ -82,18 +405,27 @@ def transcrever_audio_gcp(audio_content: bytes) -> str:
         return ""
 
     try:
-        audio_para_api = speech.RecognitionAudio(content=audio_content)
-        config_api = speech.RecognitionConfig(
-            encoding=speech.RecognitionConfig.AudioEncoding.OGG_OPUS,
-            sample_rate_hertz=16000,
-            language_code="pt-BR",
-            model="default"
-        )
+        audio = inspecionar_audio(audio_content)
+        if audio is None:
+            trechos, taxa = [audio_content], 16000
+        else:
+            duracao_original = audio.duracao
+            audio = aparar_silencio(audio)
+            trechos, taxa = dividir_audio(audio), audio.taxa_stt
+            log.info("Áudio pré-processado", extra={
+                "action": "audio_preprocessed",
+                "duration_s": round(duracao_original, 1),
+                "trimmed_s": round(duracao_original - audio.duracao, 1),
+                "chunks": len(trechos)
+            })
 
-        response = speech_client.recognize(config=config_api, audio=audio_para_api)
+        if len(trechos) == 1:
+            textos = [_reconhecer_trecho(speech_client, trechos[0], taxa)]
+        else:
+            textos = list(get_stt_trechos_executor().map(lambda trecho: _reconhecer_trecho(speech_client, trecho, taxa), trechos))
 
-        if response.results and response.results[0].alternatives:
-            transcricao = response.results[0].alternatives[0].transcript
+        transcricao = " ".join(texto for texto in textos if texto)
+        if transcricao:
             log.info("Áudio transcrito com sucesso", extra={"transcription_length": len(transcricao)})
             return transcricao
         else:
@@ -0,0 +1,173 @@
+import asyncio
+import logging
+import time
+from functools import lru_cache
+
+from app.config import settings
+
+log = logging.getLogger(__name__)
+
+# Ordem de processamento por usuário, no estilo "pegue uma senha": cada
+# mensagem recebe, na chegada, um número sequencial (HINCRBY 'senha') e só
+# grava o estado quando todas as anteriores terminaram ('vez' >= senha - 1).
+# Usuários diferentes usam chaves diferentes e nunca esperam uns pelos outros.
+# Uma mensagem que termina antes da sua vez (ex.: falhou logo no começo) só
+# fica marcada como concluída ('c:<senha>'); 'vez' avança apenas pelas senhas
+# concluídas em sequência, para não liberar as seguintes antes das anteriores.
+# A senha também serve de fencing token: quem perdeu a vez (por travar além de
+# ORDEM_ESPERA_MAXIMA) ainda grava, mas é registrado como fora de ordem; e quem
+# desiste de esperar dá as senhas anteriores como perdidas, para que uma
+# mensagem que nunca termina não faça todas as seguintes esperarem.
+# Quem espera consulta o Redis com backoff (a mensagem anterior pode estar em
+# outro processo) e, no webhook, também é acordado na hora quando a anterior
+# termina no mesmo processo.
+
+# KEYS[1] = chave da ordem; ARGV[1] = senha concluída (0 para nenhuma);
+# ARGV[2] = TTL; ARGV[3] = senha até a qual 'vez' deve pular (0 para nenhuma).
+# Marca a senha como concluída, pula até o piso descartando as marcas, avança
+# 'vez' pelas concluídas em sequência, sem nunca voltar, e retorna o valor final.
+LUA_LIBERAR_VEZ = """
+local vez = tonumber(redis.call('HGET', KEYS[1], 'vez') or '0')
+local senha = tonumber(ARGV[1])
+local piso = tonumber(ARGV[3])
+if senha > vez then
+    redis.call('HSET', KEYS[1], 'c:' .. senha, 1)
+end
+while vez < piso do
+    vez = vez + 1
+    redis.call('HDEL', KEYS[1], 'c:' .. vez)
+end
+while redis.call('HDEL', KEYS[1], 'c:' .. (vez + 1)) == 1 do
+    vez = vez + 1
+end
+redis.call('HSET', KEYS[1], 'vez', vez)
+redis.call('EXPIRE', KEYS[1], ARGV[2])
+return vez
+"""
+
+ESPERA_INICIAL = 0.005
+ESPERA_MAXIMA_ENTRE_CONSULTAS = 0.1
+
+# Eventos de "vez liberada" por usuário, para acordar esperas no mesmo processo.
+_liberacoes_locais: dict[str, asyncio.Event] = {}
+
+
+@lru_cache()
+def _script_liberar_vez(r):
+    """Registra o script de liberação uma vez por cliente Redis."""
+    return r.register_script(LUA_LIBERAR_VEZ)
+
+
+def chave_ordem(user_key: str) -> str:
+    """Chave com a última senha emitida e a última atendida de um usuário."""
+    return f"ordem:{user_key}"
+
+
+def _avaliar_vez(user_key: str, senha: int, vez: int, inicio: float) -> bool | None:
+    """
+    Decide se a mensagem pode gravar o estado com a 'vez' lida: True se é a
+    vez dela, False se vai gravar fora de ordem (espera esgotada ou senha já
+    ultrapassada) e None se deve continuar esperando.
+    """
+    espera_ms = round((time.monotonic() - inicio) * 1000, 1)
+    if vez == senha - 1:
+        if espera_ms >= 1:
+            log.info("Mensagem aguardou as anteriores do usuário", extra={
+                "action": "ordering_waited",
+                "user_id": user_key,
+                "ticket": senha,
+                "wait_ms": espera_ms
+            })
+        return True
+    if vez >= senha:
+        log.warning("Mensagem chegou depois de outras mais novas do usuário; gravando fora de ordem", extra={
+            "action": "ordering_stale_ticket",
+            "user_id": user_key,
+            "ticket": senha,
+            "served": vez
+        })
+        return False
+    if espera_ms >= settings.ORDEM_ESPERA_MAXIMA * 1000:
+        log.warning("Mensagem anterior do usuário não terminou a tempo; processando fora de ordem e dando as anteriores como perdidas", extra={
+            "action": "ordering_wait_timeout",
+            "user_id": user_key,
+            "ticket": senha,
+            "served": vez,
+            "wait_ms": espera_ms
+        })
+        return False
+    return None
+
+
+async def tirar_senha_async(r, user_key: str) -> int:
+    """Emite a senha da mensagem que acabou de chegar. Chamar antes de qualquer I/O lento."""
+    if not settings.ORDEM_ATIVA:
+        return 0
+    pipe = r.pipeline(transaction=True)
+    pipe.hincrby(chave_ordem(user_key), "senha", 1)
+    pipe.expire(chave_ordem(user_key), settings.ORDEM_TTL)
+    return (await pipe.execute())[0]
+
+
+async def aguardar_vez_async(r, user_key: str, senha: int) -> bool:
+    """
+    Espera as mensagens anteriores do usuário serem aplicadas ao estado, por
+    até ORDEM_ESPERA_MAXIMA segundos. Retorna False se a mensagem vai gravar
+    fora de ordem; se foi por esgotar a espera, as anteriores pendentes são
+    dadas como perdidas e deixam de segurar as seguintes.
+    """
+    if not senha:
+        return True
+    inicio, espera = time.monotonic(), ESPERA_INICIAL
+    while True:
+        liberacao = _liberacoes_locais.setdefault(user_key, asyncio.Event())
+        vez = int(await r.hget(chave_ordem(user_key), "vez") or 0)
+        em_ordem = _avaliar_vez(user_key, senha, vez, inicio)
+        if em_ordem is False and vez < senha - 1:
+            await _script_liberar_vez(r)(keys=[chave_ordem(user_key)], args=[0, settings.ORDEM_TTL, senha - 1])
+            _acordar_locais(user_key)
+        if em_ordem is not None:
+            return em_ordem
+        try:
+            await asyncio.wait_for(liberacao.wait(), espera)
+        except asyncio.TimeoutError:
+            espera = min(espera * 2, ESPERA_MAXIMA_ENTRE_CONSULTAS)
+
+
+async def liberar_vez_async(r, user_key: str, senha: int):
+    """
+    Marca a mensagem como concluída. A próxima do usuário só é liberada quando
+    todas as anteriores também tiverem terminado.
+    """
+    if senha:
+        await _script_liberar_vez(r)(keys=[chave_ordem(user_key)], args=[senha, settings.ORDEM_TTL, 0])
+        _acordar_locais(user_key)
+
+
+def _acordar_locais(user_key: str):
+    """Acorda as esperas do usuário neste processo para que releiam a 'vez'."""
+    liberacao = _liberacoes_locais.pop(user_key, None)
+    if liberacao:
+        liberacao.set()
+
+
+def aguardar_vez(r, user_key: str, senha: int) -> bool:
+    """Versão síncrona de `aguardar_vez_async`, usada pelos workers."""
+    if not senha:
+        return True
+    inicio, espera = time.monotonic(), ESPERA_INICIAL
+    while True:
+        vez = int(r.hget(chave_ordem(user_key), "vez") or 0)
+        em_ordem = _avaliar_vez(user_key, senha, vez, inicio)
+        if em_ordem is False and vez < senha - 1:
+            _script_liberar_vez(r)(keys=[chave_ordem(user_key)], args=[0, settings.ORDEM_TTL, senha - 1])
+        if em_ordem is not None:
+            return em_ordem
+        time.sleep(espera)
+        espera = min(espera * 2, ESPERA_MAXIMA_ENTRE_CONSULTAS)
+
+
+def liberar_vez(r, user_key: str, senha: int):
+    """Versão síncrona de `liberar_vez_async`."""
+    if senha:
+        _script_liberar_vez(r)(keys=[chave_ordem(user_key)], args=[senha, settings.ORDEM_TTL, 0])
@@ -1,8 +1,15 @@
+import asyncio
 import logging
+import random
+import time
 import redis
+import redis.asyncio as aioredis
 from functools import lru_cache
+from typing import Any, Callable, Optional
 
 from app.config import settings
+from app.metricas import medir_dependencia
+from app.models import UserState
 
 log = logging.getLogger(__name__)
 
@@ -43,3 +50,378 @@ def get_redis_client():
             extra={"error": str(e)}
         )
         return None
+
+
+@lru_cache()
+def get_async_redis_client():
+    """
+    Cria e retorna um cliente Redis assíncrono (redis.asyncio) para o webhook.
+
+    O cliente mantém um pool de conexões próprio e conecta de forma preguiçosa,
+    então nenhuma chamada bloqueante é feita aqui; falhas de conexão aparecem
+    na primeira operação. Também é um singleton via @lru_cache.
+    """
+    if not settings or not settings.REDIS_HOST:
+        log.critical("Configurações do Redis não foram carregadas. Não é possível conectar.")
+        return None
+
+    try:
+        r = aioredis.Redis(
+            host=settings.REDIS_HOST,
+            port=settings.REDIS_PORT,
+            db=0,
+            decode_responses=True
+        )
+        log.info(f"Cliente Redis assíncrono configurado para {settings.REDIS_HOST}:{settings.REDIS_PORT}")
+        return r
+    except Exception as e:
+        log.critical(
+            "Ocorreu um erro inesperado ao configurar o cliente Redis assíncrono.",
+            extra={"error": str(e)}
+        )
+        return None
+
+
+# Compare-and-set do estado do usuário, armazenado como hash (um campo por
+# atributo do UserState). Só grava os campos alterados se a versão armazenada
+# ainda for a versão lida pelo chamador. Na mesma operação, e só se a gravação
+# acontecer, incrementa os contadores diários do funil dos eventos registrados
+# no estado (ver `funil_service`), então uma nova tentativa do CAS não conta
+# duas vezes.
+# KEYS[1] = chave do estado; KEYS[2..] = pares contador/HyperLogLog do funil;
+# ARGV[1] = versão esperada; ARGV[2] = 'set' ou 'del';
+# ARGV[3] = TTL em segundos (0 = sem expiração);
+# ARGV[4] = usuário adicionado aos HyperLogLogs; ARGV[5] = TTL dos contadores do funil;
+# ARGV[6] = número N de pares a gravar; ARGV[7..6+2N] = pares campo/valor;
+# ARGV restantes = campos a remover do hash.
+LUA_CAS_ESTADO = """
+local versao_atual = tonumber(redis.call('HGET', KEYS[1], 'version') or '0')
+if versao_atual ~= tonumber(ARGV[1]) then
+    return 0
+end
+for i = 2, #KEYS, 2 do
+    redis.call('INCR', KEYS[i])
+    redis.call('EXPIRE', KEYS[i], ARGV[5])
+    redis.call('PFADD', KEYS[i + 1], ARGV[4])
+    redis.call('EXPIRE', KEYS[i + 1], ARGV[5])
+end
+if ARGV[2] == 'del' then
+    redis.call('DEL', KEYS[1])
+    return 1
+end
+local n_pares = tonumber(ARGV[6])
+local fim_pares = 6 + 2 * n_pares
+if n_pares > 0 then
+    redis.call('HSET', KEYS[1], unpack(ARGV, 7, fim_pares))
+end
+if #ARGV > fim_pares then
+    redis.call('HDEL', KEYS[1], unpack(ARGV, fim_pares + 1, #ARGV))
+end
+redis.call('HSET', KEYS[1], 'version', versao_atual + 1)
+local ttl = tonumber(ARGV[3])
+if ttl > 0 then
+    redis.call('EXPIRE', KEYS[1], ttl)
+else
+    redis.call('PERSIST', KEYS[1])
+end
+return 1
+"""
+
+# Migração do formato anterior, em que o estado era um JSON na chave
+# `user_key`: cria o hash só se ele ainda não existir e apaga a chave antiga
+# na mesma operação, para que a migração aconteça uma única vez.
+# KEYS[1] = chave do hash do estado; KEYS[2] = chave antiga;
+# ARGV[1] = TTL em segundos; ARGV[2..] = pares campo/valor (inclui 'version').
+LUA_MIGRAR_ESTADO = """
+if redis.call('EXISTS', KEYS[1]) == 0 then
+    redis.call('HSET', KEYS[1], unpack(ARGV, 2, #ARGV))
+    redis.call('EXPIRE', KEYS[1], ARGV[1])
+end
+redis.call('DEL', KEYS[2])
+return 1
+"""
+
+MAX_TENTATIVAS_CAS = 20
+
+
+class ConflitoDeVersaoError(Exception):
+    """O estado foi alterado por outro escritor em todas as tentativas de gravação."""
+
+
+@lru_cache()
+def _script_cas(r):
+    """Registra o script de compare-and-set uma vez por cliente Redis (sync ou async)."""
+    return r.register_script(LUA_CAS_ESTADO)
+
+
+@lru_cache()
+def _script_migracao(r):
+    """Registra o script de migração do estado no formato antigo uma vez por cliente Redis."""
+    return r.register_script(LUA_MIGRAR_ESTADO)
+
+
+def chave_estado(user_key: str) -> str:
+    """Chave do hash que guarda o estado do usuário."""
+    return f"estado:{user_key}"
+
+
+def chave_contador_funil(dia: str, evento: str) -> str:
+    """Contador de ocorrências de um evento do funil no dia (AAAA-MM-DD)."""
+    return f"funil:{dia}:{evento}"
+
+
+def chave_usuarios_funil(dia: str, evento: str) -> str:
+    """HyperLogLog dos usuários distintos com um evento do funil no dia (AAAA-MM-DD)."""
+    return f"funil:{dia}:{evento}:usuarios"
+
+
+def ttl_estado(etapa: str) -> int:
+    """TTL (em segundos) do estado de um usuário parado na `etapa` informada."""
+    return settings.STATE_TTL_POR_ETAPA.get(etapa, settings.STATE_TTL_PADRAO)
+
+
+def _desserializar_estado(user_key: str, dados: dict) -> Optional[UserState]:
+    if not dados:
+        return None
+    try:
+        return UserState.de_hash(dados)
+    except Exception as e:
+        log.error("Erro ao deserializar estado do usuário", extra={"user_id": user_key, "error": str(e)})
+        return None
+
+
+def _argumentos_migracao(user_key: str, legado: str) -> Optional[list]:
+    """
+    Converte o JSON do formato antigo nos argumentos de `LUA_MIGRAR_ESTADO`.
+    Retorna None se o JSON não puder ser lido; a chave antiga é descartada.
+    """
+    try:
+        user_state = UserState.model_validate_json(legado)
+    except Exception as e:
+        log.error("Estado no formato antigo ilegível; descartando", extra={"user_id": user_key, "error": str(e)})
+        return None
+    gravar, _ = UserState.para_hash(user_state.model_dump(exclude={"version"}))
+    args = [ttl_estado(user_state.etapa), 'version', user_state.version]
+    for campo, valor in gravar.items():
+        args.extend((campo, valor))
+    return args
+
+
+def _versao_bruta(dados: dict) -> Optional[int]:
+    """Versão de um hash que não pôde ser desserializado, ou None se ela também estiver corrompida."""
+    try:
+        return int(dados.get('version', 0))
+    except (TypeError, ValueError):
+        return None
+
+
+def _chaves_gravacao(user_key: str, novo_estado: Optional[UserState]) -> list:
+    """Chave do estado seguida dos pares contador/HyperLogLog do dia para os eventos do funil do novo estado."""
+    chaves = [chave_estado(user_key)]
+    if novo_estado is not None and novo_estado.eventos_funil():
+        # Mesmo dia (hora local) que o `asctime` dos logs, para bater com o analisador.
+        dia = time.strftime('%Y-%m-%d')
+        for evento in novo_estado.eventos_funil():
+            chaves.extend((chave_contador_funil(dia, evento), chave_usuarios_funil(dia, evento)))
+    return chaves
+
+
+def _argumentos_gravacao(user_key: str, atual: Optional[UserState], novo_estado: Optional[UserState], versao_lida: int) -> list:
+    """
+    Monta os argumentos do script de CAS com apenas os campos alterados e o
+    TTL da nova etapa. Estados None ou 'finalizado' são removidos.
+    """
+    if novo_estado is None or novo_estado.etapa == 'finalizado':
+        return [versao_lida, 'del', 0, user_key, settings.FUNIL_CONTADORES_TTL, 0]
+
+    gravar, remover = UserState.para_hash(novo_estado.campos_alterados(origem=atual))
+    novo_estado.version = versao_lida + 1
+    args = [versao_lida, 'set', ttl_estado(novo_estado.etapa), user_key, settings.FUNIL_CONTADORES_TTL, len(gravar)]
+    for campo, valor in gravar.items():
+        args.extend((campo, valor))
+    args.extend(remover)
+    return args
+
+
+def _espera_conflito(tentativa: int) -> float:
+    """Backoff curto com jitter para desfazer colisões entre escritores."""
+    return random.uniform(0, 0.002 * (tentativa + 1))
+
+
+def carregar_estado(r, user_key: str) -> Optional[UserState]:
+    """
+    Lê o estado do usuário do Redis. Retorna None se não existir.
+
+    Um estado ainda no formato antigo (JSON em `user_key`) é migrado para o
+    hash na primeira leitura. Um hash corrompido ou incompleto é removido,
+    já que sua versão faria todo compare-and-set seguinte falhar.
+    """
+    with medir_dependencia("redis", "carregar_estado"):
+        dados = r.hgetall(chave_estado(user_key))
+        if not dados:
+            legado = r.get(user_key)
+            if legado:
+                args = _argumentos_migracao(user_key, legado)
+                if args:
+                    _script_migracao(r)(keys=[chave_estado(user_key), user_key], args=args)
+                    log.info("Estado migrado do formato antigo", extra={"user_id": user_key})
+                    dados = r.hgetall(chave_estado(user_key))
+                else:
+                    r.delete(user_key)
+    user_state = _desserializar_estado(user_key, dados)
+    if dados and user_state is None:
+        versao = _versao_bruta(dados)
+        if versao is None:
+            r.delete(chave_estado(user_key))
+        else:
+            remover_estado_se_versao(r, user_key, versao)
+        log.warning("Estado corrompido removido", extra={"user_id": user_key})
+    return user_state
+
+
+def atualizar_estado(
+    r,
+    user_key: str,
+    mutador: Callable[[Optional[UserState]], tuple[Optional[UserState], Any]],
+    max_tentativas: int = MAX_TENTATIVAS_CAS,
+) -> tuple[Optional[UserState], Any]:
+    """
+    Lê, altera e grava o estado do usuário com controle de concorrência otimista.
+
+    `mutador` recebe o estado atual (ou None) e devolve `(novo_estado, resultado)`.
+    Apenas os campos alterados são enviados ao Redis, e o TTL da chave é
+    renovado conforme a etapa na mesma operação. Se outro escritor gravar
+    no meio do caminho, o estado é relido e o mutador executado novamente, então
+    ele não deve ter efeitos colaterais externos.
+    Retornar None (ou um estado 'finalizado') remove a chave.
+    """
+    script = _script_cas(r)
+    for tentativa in range(max_tentativas):
+        atual = carregar_estado(r, user_key)
+        versao_lida = atual.version if atual else 0
+        novo_estado, resultado = mutador(atual)
+        with medir_dependencia("redis", "gravar_estado"):
+            gravado = script(keys=_chaves_gravacao(user_key, novo_estado), args=_argumentos_gravacao(user_key, atual, novo_estado, versao_lida))
+        if gravado:
+            return novo_estado, resultado
+        log.info("Conflito de versão no estado do usuário, tentando novamente", extra={"user_id": user_key, "tentativa": tentativa + 1})
+        time.sleep(_espera_conflito(tentativa))
+    raise ConflitoDeVersaoError(f"Não foi possível gravar o estado de {user_key} após {max_tentativas} tentativas.")
+
+
+def atualizar_campos(r, user_key: str, **campos) -> Optional[UserState]:
+    """Atualiza atomicamente campos de um estado existente. Não cria estados novos."""
+    def mutador(atual):
+        if atual is None:
+            return None, None
+        for campo, valor in campos.items():
+            setattr(atual, campo, valor)
+        return atual, None
+
+    return atualizar_estado(r, user_key, mutador)[0]
+
+
+async def carregar_estado_async(r, user_key: str) -> Optional[UserState]:
+    """Versão assíncrona de `carregar_estado`, com a mesma migração e limpeza."""
+    with medir_dependencia("redis", "carregar_estado"):
+        dados = await r.hgetall(chave_estado(user_key))
+        if not dados:
+            legado = await r.get(user_key)
+            if legado:
+                args = _argumentos_migracao(user_key, legado)
+                if args:
+                    await _script_migracao(r)(keys=[chave_estado(user_key), user_key], args=args)
+                    log.info("Estado migrado do formato antigo", extra={"user_id": user_key})
+                    dados = await r.hgetall(chave_estado(user_key))
+                else:
+                    await r.delete(user_key)
+    user_state = _desserializar_estado(user_key, dados)
+    if dados and user_state is None:
+        versao = _versao_bruta(dados)
+        if versao is None:
+            await r.delete(chave_estado(user_key))
+        else:
+            await _script_cas(r)(keys=[chave_estado(user_key)], args=[versao, 'del', 0, user_key, 0, 0])
+        log.warning("Estado corrompido removido", extra={"user_id": user_key})
+    return user_state
+
+
+async def atualizar_estado_async(
+    r,
+    user_key: str,
+    mutador: Callable[[Optional[UserState]], tuple[Optional[UserState], Any]],
+    max_tentativas: int = MAX_TENTATIVAS_CAS,
+) -> tuple[Optional[UserState], Any]:
+    """Versão assíncrona de `atualizar_estado`, usada pelo webhook."""
+    script = _script_cas(r)
+    for tentativa in range(max_tentativas):
+        atual = await carregar_estado_async(r, user_key)
+        versao_lida = atual.version if atual else 0
+        novo_estado, resultado = mutador(atual)
+        with medir_dependencia("redis", "gravar_estado"):
+            gravado = await script(keys=_chaves_gravacao(user_key, novo_estado), args=_argumentos_gravacao(user_key, atual, novo_estado, versao_lida))
+        if gravado:
+            return novo_estado, resultado
+        log.info("Conflito de versão no estado do usuário, tentando novamente", extra={"user_id": user_key, "tentativa": tentativa + 1})
+        await asyncio.sleep(_espera_conflito(tentativa))
+    raise ConflitoDeVersaoError(f"Não foi possível gravar o estado de {user_key} após {max_tentativas} tentativas.")
+
+
+async def atualizar_campos_async(r, user_key: str, **campos) -> Optional[UserState]:
+    """Versão assíncrona de `atualizar_campos`."""
+    def mutador(atual):
+        if atual is None:
+            return None, None
+        for campo, valor in campos.items():
+            setattr(atual, campo, valor)
+        return atual, None
+
+    return (await atualizar_estado_async(r, user_key, mutador))[0]
+
+
+def remover_estado_se_versao(r, user_key: str, versao: int) -> bool:
+    """Remove o estado apenas se ele ainda estiver na `versao` informada."""
+    return bool(_script_cas(r)(keys=[chave_estado(user_key)], args=[versao, 'del', 0, user_key, 0, 0]))
+
+
+# Idempotência do webhook: cada MessageSid é reservado com SET NX e, ao fim do
+# processamento, a chave passa a guardar o TwiML devolvido à Twilio.
+PREFIXO_MENSAGEM_TWILIO = "mensagem_twilio:"
+MENSAGEM_EM_PROCESSAMENTO = "__processando__"
+
+
+def chave_mensagem(message_sid: str) -> str:
+    """Chave de deduplicação de uma mensagem recebida da Twilio."""
+    return f"{PREFIXO_MENSAGEM_TWILIO}{message_sid}"
+
+
+async def reservar_mensagem_async(r, message_sid: str) -> bool:
+    """Reserva o processamento da mensagem. Retorna False se ela já foi (ou está sendo) processada."""
+    return bool(await r.set(chave_mensagem(message_sid), MENSAGEM_EM_PROCESSAMENTO, nx=True, ex=settings.WEBHOOK_DEDUP_TTL))
+
+
+async def registrar_resposta_mensagem_async(r, message_sid: str, twiml: str):
+    """Guarda o TwiML da mensagem processada, devolvido às entregas duplicadas."""
+    await r.set(chave_mensagem(message_sid), twiml, ex=settings.WEBHOOK_DEDUP_TTL)
+
+
+async def liberar_mensagem_async(r, message_sid: str):
+    """Desfaz a reserva após uma falha, para que a retentativa da Twilio processe a mensagem."""
+    await r.delete(chave_mensagem(message_sid))
+
+
+async def aguardar_resposta_mensagem_async(r, message_sid: str, timeout: float | None = None) -> Optional[str]:
+    """
+    Espera a entrega original terminar e retorna o TwiML dela, ou None se
+    ela não terminar em WEBHOOK_ESPERA_DUPLICADA segundos (ou tiver falhado).
+    """
+    limite = time.monotonic() + (settings.WEBHOOK_ESPERA_DUPLICADA if timeout is None else timeout)
+    while True:
+        valor = await r.get(chave_mensagem(message_sid))
+        if valor is None:
+            return None
+        if valor != MENSAGEM_EM_PROCESSAMENTO:
+            return valor
+        if time.monotonic() >= limite:
+            return None
+        await asyncio.sleep(0.05)
@@ -0,0 +1,276 @@
+import json
+import logging
+import random
+import threading
+import zlib
+from collections import defaultdict
+from functools import lru_cache
+from typing import List, Optional
+
+import numpy as np
+
+from app.config import settings
+from app.services.cache_service import chave_perguntas
+from app.utils import hash_contexto, normalizar_contexto
+
+log = logging.getLogger(__name__)
+
+ENTRADAS_SEMANTICAS = "cache_semantico:entradas"
+CONTEXTOS_SEMANTICOS = "cache_semantico:contextos"
+GERACAO_SEMANTICA = "cache_semantico:geracao"
+
+# Registro de um contexto no cache semântico. O hash CONTEXTOS_SEMANTICOS
+# guarda a entrada de cada contexto vivo; a lista ENTRADAS_SEMANTICAS é o log
+# que os processos leem de forma incremental, com inclusões e remoções (as
+# chaves que o LRU do cache de perguntas acabou de descartar). Quando o log
+# passa do limite, é reescrito só com os contextos vivos e a geração é
+# incrementada, para que os processos reconstruam seus índices.
+# KEYS[1] = contextos; KEYS[2] = entradas; KEYS[3] = geração;
+# ARGV[1] = hash do contexto; ARGV[2] = entrada JSON; ARGV[3] = limite do log;
+# ARGV[4] = TTL em segundos; ARGV[5..] = hashes removidos do cache de perguntas.
+LUA_REGISTRAR_CONTEXTO = """
+for i = 5, #ARGV do
+    if redis.call('HDEL', KEYS[1], ARGV[i]) == 1 then
+        redis.call('RPUSH', KEYS[2], '{"h": "' .. ARGV[i] .. '", "removido": true}')
+    end
+end
+if redis.call('HSETNX', KEYS[1], ARGV[1], ARGV[2]) == 1 then
+    redis.call('RPUSH', KEYS[2], ARGV[2])
+end
+if redis.call('LLEN', KEYS[2]) > tonumber(ARGV[3]) then
+    local vivas = redis.call('HVALS', KEYS[1])
+    redis.call('DEL', KEYS[2])
+    for i = 1, #vivas, 1000 do
+        redis.call('RPUSH', KEYS[2], unpack(vivas, i, math.min(i + 999, #vivas)))
+    end
+    redis.call('INCR', KEYS[3])
+end
+for i = 1, 3 do
+    redis.call('EXPIRE', KEYS[i], ARGV[4])
+end
+return 1
+"""
+
+# Palavras de ligação e termos que aparecem em quase todo contexto; ficam fora
+# do vetor para que cargo, nível e tecnologias decidam a similaridade.
+PALAVRAS_IGNORADAS = frozenset("""
+    a o as os um uma de da do das dos em na no nas nos e ou com para por que
+    sou eu meu minha quero busco procurando procuro tenho trabalho trabalhar atuo
+    sei usando uso vaga vagas emprego entrevista cargo area nivel dev desenvolvedor
+    desenvolvedora programador programadora experiencia anos ano
+""".split())
+
+# Abreviações e grafias comuns de senioridade, reduzidas a uma forma única.
+SINONIMOS = {
+    "jr": "junior", "pl": "pleno", "sr": "senior", "estagiario": "estagio",
+    "estagiaria": "estagio", "trainee": "estagio", "especialista": "senior",
+}
+
+
+def vetorizar_contexto(contexto: str, dimensao: int | None = None) -> np.ndarray:
+    """
+    Gera um vetor local e barato para o contexto, sem chamadas de rede:
+    palavras e n-gramas de caracteres (3 e 4) do texto normalizado, sem
+    PALAVRAS_IGNORADAS e com SINONIMOS unificados, são projetados por hashing
+    em `dimensao` posições com sinal, com TF sublinear, e o vetor é
+    normalizado (norma L2 = 1) para que o produto interno seja o cosseno.
+    """
+    dimensao = dimensao or settings.CACHE_SEMANTICO_DIMENSAO
+    features = []
+    for token in normalizar_contexto(contexto).split():
+        if token in PALAVRAS_IGNORADAS:
+            continue
+        token = SINONIMOS.get(token, token)
+        features.append(f"w:{token}")
+        marcado = f" {token} "
+        for n in (3, 4):
+            features.extend(marcado[i:i + n] for i in range(len(marcado) - n + 1))
+
+    vetor = np.zeros(dimensao, dtype=np.float32)
+    if not features:
+        return vetor
+
+    hashes = np.fromiter((zlib.crc32(f.encode("utf-8")) for f in features), dtype=np.uint64, count=len(features))
+    indices = (hashes % dimensao).astype(np.intp)
+    sinais = np.where((hashes >> 31) & 1, -1.0, 1.0).astype(np.float32)
+    np.add.at(vetor, indices, sinais)
+
+    vetor = np.sign(vetor) * np.log1p(np.abs(vetor))
+    norma = np.linalg.norm(vetor)
+    return vetor / norma if norma else vetor
+
+
+class IndiceSemantico:
+    """
+    Índice de vizinho mais próximo aproximado por LSH de hiperplanos aleatórios.
+
+    Cada vetor recebe uma assinatura de `n_bits` bits em cada uma das
+    `n_tabelas` tabelas; a busca calcula o cosseno exato apenas com os
+    candidatos que colidem em alguma tabela. Os vetores ficam em float16 num
+    array contíguo que cresce por duplicação. Chaves removidas deixam de ser
+    candidatas; o espaço é recuperado em `limpar`, quando o índice é
+    reconstruído a partir do log compactado.
+    """
+
+    def __init__(self, dimensao: int, n_tabelas: int, n_bits: int, semente: int = 42):
+        rng = np.random.default_rng(semente)
+        self.dimensao = dimensao
+        self.planos = rng.standard_normal((n_tabelas * n_bits, dimensao)).astype(np.float32)
+        self.n_tabelas = n_tabelas
+        self.n_bits = n_bits
+        self._pesos_bits = (1 << np.arange(n_bits)).astype(np.int64)
+        self.lock = threading.Lock()
+        self.limpar()
+
+    def limpar(self):
+        """Esvazia o índice (usado quando o log do Redis é compactado)."""
+        self.tabelas = [defaultdict(list) for _ in range(self.n_tabelas)]
+        self.vetores = np.empty((1024, self.dimensao), dtype=np.float16)
+        self.chaves: List[Optional[str]] = []
+        self.posicoes: dict[str, int] = {}
+        self.sincronizados = 0
+        self.geracao = None
+
+    def __len__(self):
+        return len(self.chaves)
+
+    def _assinaturas(self, vetor: np.ndarray) -> np.ndarray:
+        bits = (self.planos @ vetor > 0).reshape(self.n_tabelas, self.n_bits)
+        return bits @ self._pesos_bits
+
+    def adicionar(self, chave: str, vetor: np.ndarray):
+        posicao = len(self.chaves)
+        if posicao == len(self.vetores):
+            self.vetores = np.resize(self.vetores, (len(self.vetores) * 2, self.dimensao))
+        self.vetores[posicao] = vetor
+        self.chaves.append(chave)
+        self.posicoes[chave] = posicao
+        for tabela, assinatura in zip(self.tabelas, self._assinaturas(vetor)):
+            tabela[int(assinatura)].append(posicao)
+
+    def remover(self, chave: str):
+        """Tira a chave das buscas (o vetor continua ocupando sua posição)."""
+        posicao = self.posicoes.pop(chave, None)
+        if posicao is not None:
+            self.chaves[posicao] = None
+
+    def buscar(self, vetor: np.ndarray) -> Optional[tuple[str, float]]:
+        """Retorna `(chave, similaridade)` do vizinho mais próximo, ou None."""
+        candidatos = set()
+        for tabela, assinatura in zip(self.tabelas, self._assinaturas(vetor)):
+            candidatos.update(tabela.get(int(assinatura), ()))
+        candidatos = [c for c in candidatos if self.chaves[c] is not None]
+        if not candidatos:
+            return None
+
+        posicoes = np.fromiter(candidatos, dtype=np.intp, count=len(candidatos))
+        similaridades = self.vetores[posicoes].astype(np.float32) @ vetor
+        melhor = int(np.argmax(similaridades))
+        return self.chaves[posicoes[melhor]], float(similaridades[melhor])
+
+    def nbytes(self) -> int:
+        """Memória aproximada ocupada pelos vetores e pelas tabelas de hash."""
+        posicoes_nas_tabelas = sum(len(lista) for tabela in self.tabelas for lista in tabela.values())
+        return self.vetores.nbytes + self.planos.nbytes + posicoes_nas_tabelas * 8
+
+
+@lru_cache()
+def _script_registro(r):
+    """Registra o script de registro de contextos uma vez por cliente Redis."""
+    return r.register_script(LUA_REGISTRAR_CONTEXTO)
+
+
+@lru_cache()
+def get_indice_semantico() -> IndiceSemantico:
+    """Índice semântico do processo, criado uma única vez (singleton)."""
+    return IndiceSemantico(
+        dimensao=settings.CACHE_SEMANTICO_DIMENSAO,
+        n_tabelas=settings.CACHE_SEMANTICO_TABELAS,
+        n_bits=settings.CACHE_SEMANTICO_BITS,
+    )
+
+
+def _sincronizar_indice(r, indice: IndiceSemantico):
+    """
+    Traz para o índice local as inclusões e remoções feitas por outros
+    processos. Cada processo lê apenas o trecho do log que ainda não viu;
+    se o log foi compactado (nova geração), reconstrói o índice do início.
+    """
+    with indice.lock:
+        pipe = r.pipeline(transaction=True)
+        pipe.get(GERACAO_SEMANTICA)
+        pipe.lrange(ENTRADAS_SEMANTICAS, indice.sincronizados, -1)
+        geracao, novas = pipe.execute()
+        if geracao != indice.geracao:
+            indice.limpar()
+            indice.geracao = geracao
+            pipe = r.pipeline(transaction=True)
+            pipe.get(GERACAO_SEMANTICA)
+            pipe.lrange(ENTRADAS_SEMANTICAS, 0, -1)
+            indice.geracao, novas = pipe.execute()
+        for entrada in novas:
+            dados = json.loads(entrada)
+            if dados.get("removido"):
+                indice.remover(dados["h"])
+            elif dados["h"] not in indice.posicoes:
+                indice.adicionar(dados["h"], vetorizar_contexto(dados["c"], indice.dimensao))
+        indice.sincronizados += len(novas)
+
+
+def buscar_perguntas_semelhantes(r, contexto: str, user_key: str | None = None) -> Optional[List[str]]:
+    """
+    Procura no cache perguntas geradas para um contexto parecido (paráfrase),
+    quando a similaridade de cosseno passa de CACHE_SEMANTICO_LIMIAR.
+    Retorna None se a camada estiver desativada, em caso de miss ou de erro.
+    """
+    if not settings.CACHE_SEMANTICO_ATIVO:
+        return None
+
+    try:
+        indice = get_indice_semantico()
+        _sincronizar_indice(r, indice)
+        resultado = indice.buscar(vetorizar_contexto(contexto, indice.dimensao))
+
+        # O próprio contexto já passou pelo cache exato, que decide quando
+        # completar o conjunto de variantes.
+        if resultado and resultado[1] >= settings.CACHE_SEMANTICO_LIMIAR and resultado[0] != hash_contexto(contexto):
+            hash_vizinho, similaridade = resultado
+            variantes = r.lrange(chave_perguntas(hash_vizinho), 0, -1)
+            if variantes:
+                log.info("Cache semântico de perguntas: hit", extra={
+                    "action": "question_semantic_hit",
+                    "user_id": user_key,
+                    "cache_key": hash_vizinho[:16],
+                    "similarity": round(similaridade, 3)
+                })
+                return json.loads(random.choice(variantes))
+
+        log.info("Cache semântico de perguntas: miss", extra={
+            "action": "question_semantic_miss",
+            "user_id": user_key,
+            "similarity": round(resultado[1], 3) if resultado else None
+        })
+        return None
+    except Exception as e:
+        log.error("Erro ao consultar cache semântico de perguntas", extra={"user_id": user_key, "error": str(e)})
+        return None
+
+
+def registrar_contexto_semantico(r, contexto: str, removidos: List[str] = ()):
+    """
+    Registra um contexto recém-cacheado para que paráfrases o encontrem e
+    retira os `removidos` pelo LRU do cache de perguntas, numa única ida ao
+    Redis. O log fica limitado a 2x CACHE_PERGUNTAS_MAX_CHAVES entradas.
+    """
+    if not settings.CACHE_SEMANTICO_ATIVO:
+        return
+
+    try:
+        hash_ctx = hash_contexto(contexto)
+        entrada = json.dumps({"h": hash_ctx, "c": normalizar_contexto(contexto)}, ensure_ascii=False)
+        _script_registro(r)(
+            keys=[CONTEXTOS_SEMANTICOS, ENTRADAS_SEMANTICAS, GERACAO_SEMANTICA],
+            args=[hash_ctx, entrada, 2 * settings.CACHE_PERGUNTAS_MAX_CHAVES, settings.CACHE_PERGUNTAS_TTL, *removidos],
+        )
+    except Exception as e:
+        log.error("Erro ao registrar contexto no cache semântico", extra={"error": str(e)})
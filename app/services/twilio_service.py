@@ -1,14 +1,24 @@
 import logging
+import random
+import time
 from functools import lru_cache
+from typing import List
+from twilio.base.exceptions import TwilioRestException
+from twilio.http.http_client import TwilioHttpClient
 from twilio.rest import Client
+import httpx
 import requests
 
 # Importa o objeto 'settings' que conterá todas as nossas variáveis de ambiente.
 # Este será nosso ponto central de configuração.
 from app.config import settings
+from app.metricas import medir_dependencia
 
 log = logging.getLogger(__name__)
 
+# Margem abaixo do limite de 1600 caracteres do WhatsApp.
+LIMITE_CARACTERES = 1500
+
 
 @lru_cache()
 def get_twilio_client():
@@ -16,13 +26,15 @@ def get_twilio_client():
     Cria e retorna um cliente Twilio.
     Usa @lru_cache para garantir que o cliente seja instanciado apenas uma vez (singleton),
     melhorando a performance. Isso é fundamental para a injeção de dependências do FastAPI.
+    O cliente HTTP mantém uma sessão com pool de conexões e timeout explícito.
     """
     if not settings.TWILIO_ACCOUNT_SID or not settings.TWILIO_AUTH_TOKEN:
         log.critical("Credenciais da Twilio (SID ou Auth Token) não encontradas nas variáveis de ambiente.")
         return None
     
     try:
-        client = Client(settings.TWILIO_ACCOUNT_SID, settings.TWILIO_AUTH_TOKEN)
+        http_client = TwilioHttpClient(pool_connections=True, timeout=settings.TWILIO_TIMEOUT)
+        client = Client(settings.TWILIO_ACCOUNT_SID, settings.TWILIO_AUTH_TOKEN, http_client=http_client)
         log.info("Cliente Twilio inicializado com sucesso.")
         return client
     except Exception as e:
@@ -30,69 +42,132 @@ def get_twilio_client():
         return None
 
 
-def enviar_mensagem_longa(twilio_client, destinatario: str, texto_completo: str):
+@lru_cache()
+def get_media_http_client():
+    """
+    Cria e retorna um cliente HTTP assíncrono (httpx) para baixar mídias da Twilio.
+    O pool de conexões é compartilhado entre requisições, evitando um novo
+    handshake TLS a cada áudio recebido.
+    """
+    return httpx.AsyncClient(
+        auth=(settings.TWILIO_ACCOUNT_SID, settings.TWILIO_AUTH_TOKEN),
+        timeout=httpx.Timeout(10.0),
+        limits=httpx.Limits(max_connections=100, max_keepalive_connections=20),
+        follow_redirects=True,
+    )
+
+
+def dividir_mensagem(texto_completo: str, limite: int = LIMITE_CARACTERES) -> List[str]:
+    """
+    Divide um texto em partes de até `limite` caracteres numa única passada,
+    agrupando parágrafos inteiros sempre que possível. Parágrafos maiores que
+    o limite são quebrados por palavras (e palavras gigantes, por caracteres).
+    """
+    partes = []
+    atual, tamanho_atual = [], 0
+
+    def fechar_parte():
+        nonlocal atual, tamanho_atual
+        if atual:
+            partes.append("\n\n".join(atual))
+        atual, tamanho_atual = [], 0
+
+    for paragrafo in texto_completo.strip().split("\n\n"):
+        paragrafo = paragrafo.strip()
+        if not paragrafo:
+            continue
+
+        if len(paragrafo) > limite:
+            fechar_parte()
+            palavras, tamanho = [], 0
+            for palavra in paragrafo.split(" "):
+                while len(palavra) > limite:
+                    if palavras:
+                        partes.append(" ".join(palavras))
+                        palavras, tamanho = [], 0
+                    partes.append(palavra[:limite])
+                    palavra = palavra[limite:]
+                if palavras and tamanho + 1 + len(palavra) > limite:
+                    partes.append(" ".join(palavras))
+                    palavras, tamanho = [], 0
+                tamanho += len(palavra) + (1 if palavras else 0)
+                palavras.append(palavra)
+            if palavras:
+                partes.append(" ".join(palavras))
+            continue
+
+        if atual and tamanho_atual + 2 + len(paragrafo) > limite:
+            fechar_parte()
+        tamanho_atual += len(paragrafo) + (2 if atual else 0)
+        atual.append(paragrafo)
+
+    fechar_parte()
+    return partes
+
+
+def erro_transitorio(erro: Exception) -> bool:
+    """Erros de rede, rate limit (429) e falhas 5xx da Twilio valem nova tentativa."""
+    if isinstance(erro, TwilioRestException):
+        return erro.status == 429 or erro.status >= 500
+    return isinstance(erro, (requests.exceptions.ConnectionError, requests.exceptions.Timeout))
+
+
+def _enviar_parte(twilio_client, destinatario: str, corpo: str, indice: int) -> bool:
+    """Envia uma parte com até TWILIO_TENTATIVAS_ENVIO tentativas e backoff exponencial."""
+    for tentativa in range(1, settings.TWILIO_TENTATIVAS_ENVIO + 1):
+        try:
+            with medir_dependencia("twilio", "enviar_mensagem"):
+                twilio_client.messages.create(from_=settings.TWILIO_WHATSAPP_NUMBER, body=corpo, to=destinatario)
+            return True
+        except Exception as e:
+            if tentativa == settings.TWILIO_TENTATIVAS_ENVIO or not erro_transitorio(e):
+                log.error("Erro ao enviar parte da mensagem via Twilio", extra={
+                    "error": str(e), "recipient": destinatario, "part": indice, "attempts": tentativa
+                })
+                return False
+            espera = settings.TWILIO_BACKOFF_INICIAL * 2 ** (tentativa - 1)
+            log.warning("Falha transitória ao enviar parte da mensagem; tentando novamente", extra={
+                "error": str(e), "recipient": destinatario, "part": indice, "attempt": tentativa
+            })
+            time.sleep(espera * random.uniform(0.5, 1.5))
+    return False
+
+
+def enviar_mensagem_longa(twilio_client, destinatario: str, texto_completo: str) -> bool:
     """
     Divide um texto longo em várias mensagens menores que 1600 caracteres
     e as envia via Twilio, tentando quebrar por parágrafos.
+
+    Cada parte só é enviada depois que a anterior foi aceita, sobre o pool de
+    conexões do cliente Twilio, para que cheguem na ordem, cada uma com até
+    TWILIO_TENTATIVAS_ENVIO tentativas. Se uma parte não for aceita, as
+    seguintes não são enviadas, para não chegarem fora de contexto. Retorna
+    True se todas as partes foram aceitas.
     """
     if not twilio_client:
         log.error("Não foi possível enviar mensagem pois o cliente Twilio não está disponível.")
-        return
+        return False
 
-    limite = 1500
-    
-    if len(texto_completo) <= limite:
-        try:
-            twilio_client.messages.create(
-                from_=settings.TWILIO_WHATSAPP_NUMBER,
-                body=texto_completo,
-                to=destinatario
-            )
-        except Exception as e:
-            log.error("Erro ao enviar mensagem simples via Twilio", extra={"error": str(e), "recipient": destinatario})
-        return
+    partes = dividir_mensagem(texto_completo)
+    if not partes:
+        return True
+    if len(partes) == 1:
+        return _enviar_parte(twilio_client, destinatario, partes[0], 1)
 
-    log.info("Texto longo detectado, dividindo em várias mensagens", extra={"recipient": destinatario, "text_length": len(texto_completo)})
-    
-    paragrafos = texto_completo.split('\n\n')
-    mensagem_atual = ""
+    log.info("Texto longo detectado, dividindo em várias mensagens", extra={
+        "recipient": destinatario, "text_length": len(texto_completo), "parts": len(partes)
+    })
 
-    for i, paragrafo in enumerate(paragrafos):
-        if len(paragrafo) > limite:
-            if mensagem_atual.strip():
-                twilio_client.messages.create(from_=settings.TWILIO_WHATSAPP_NUMBER, body=mensagem_atual.strip(), to=destinatario)
-                mensagem_atual = ""
-
-            palavras = paragrafo.split(' ')
-            chunk_atual = ""
-            for palavra in palavras:
-                if len(chunk_atual) + len(palavra) + 1 <= limite:
-                    chunk_atual += f" {palavra}" if chunk_atual else palavra
-                else:
-                    twilio_client.messages.create(from_=settings.TWILIO_WHATSAPP_NUMBER, body=chunk_atual, to=destinatario)
-                    chunk_atual = palavra
-            if chunk_atual:
-                twilio_client.messages.create(from_=settings.TWILIO_WHATSAPP_NUMBER, body=chunk_atual, to=destinatario)
-
-        elif len(mensagem_atual) + len(paragrafo) + 2 > limite:
-            if mensagem_atual.strip():
-                twilio_client.messages.create(from_=settings.TWILIO_WHATSAPP_NUMBER, body=mensagem_atual.strip(), to=destinatario)
-            mensagem_atual = paragrafo + "\n\n"
-        
-        else:
-            mensagem_atual += paragrafo + "\n\n"
-
-    if mensagem_atual.strip():
-        try:
-            twilio_client.messages.create(
-                from_=settings.TWILIO_WHATSAPP_NUMBER,
-                body=mensagem_atual.strip(),
-                to=destinatario
-            )
-        except Exception as e:
-            log.error("Erro ao enviar parte final da mensagem longa", extra={"error": str(e), "recipient": destinatario})
+    enviadas = 0
+    for i, parte in enumerate(partes, 1):
+        if not _enviar_parte(twilio_client, destinatario, parte, i):
+            break
+        enviadas += 1
 
-    log.info("Envio de mensagem longa concluído", extra={"recipient": destinatario})
+    log.info("Envio de mensagem longa concluído", extra={
+        "recipient": destinatario, "parts": len(partes), "failed_parts": len(partes) - enviadas
+    })
+    return enviadas == len(partes)
 
 
 def download_twilio_media(media_url: str) -> bytes | None:
@@ -102,10 +177,28 @@ def download_twilio_media(media_url: str) -> bytes | None:
     """
     try:
         auth = (settings.TWILIO_ACCOUNT_SID, settings.TWILIO_AUTH_TOKEN)
-        response = requests.get(media_url, auth=auth, timeout=10)
-        response.raise_for_status()
+        with medir_dependencia("twilio_midia", "download"):
+            response = requests.get(media_url, auth=auth, timeout=10)
+            response.raise_for_status()
         log.info("Mídia da Twilio baixada com sucesso", extra={"media_url": media_url})
         return response.content
     except requests.exceptions.RequestException as e:
         log.error("Erro ao baixar mídia da Twilio", extra={"error": str(e), "media_url": media_url})
         return None
+
+
+async def download_twilio_media_async(media_url: str) -> bytes | None:
+    """
+    Versão assíncrona de `download_twilio_media`, usada pelo webhook para não
+    bloquear o event loop enquanto o áudio é baixado.
+    Retorna o conteúdo em bytes ou None em caso de erro.
+    """
+    try:
+        with medir_dependencia("twilio_midia", "download"):
+            response = await get_media_http_client().get(media_url)
+            response.raise_for_status()
+        log.info("Mídia da Twilio baixada com sucesso", extra={"media_url": media_url})
+        return response.content
+    except httpx.HTTPError as e:
+        log.error("Erro ao baixar mídia da Twilio", extra={"error": str(e), "media_url": media_url})
+        return None
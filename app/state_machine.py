@@ -1,8 +1,12 @@
 import logging
+import time
 from app.models import UserState
-from app.tasks import tarefa_gerar_perguntas, tarefa_gerar_feedback
+from app.config import settings
+from app.intencoes import PRONTO, RECUSAR_PRO, REINICIAR, detectar
+from app.metricas import medir_etapa
+from app.tasks import tarefa_gerar_perguntas, tarefa_gerar_feedback, tarefa_avaliar_resposta
 from app.services.twilio_service import enviar_mensagem_longa
-from app.utils import validar_email # Assumindo que moveremos `validar_email` para app/utils.py
+from app.utils import validar_email, dados_entrega_feedback # Assumindo que moveremos `validar_email` para app/utils.py
 
 log = logging.getLogger(__name__)
 
@@ -49,24 +53,15 @@ def handle_preparando_perguntas(user_state: UserState, resposta_usuario: str) ->
         log.warning("Erro na geração de perguntas - resetando fluxo", extra={"user_id": user_state.user_key})
         return error_message
 
-    normalized = resposta_usuario.strip().lower()
-    ready_keywords = [
-        'estou pronto', 'estou pronta', 'Estou pronto', 'Estou pronta', 
-        'pronto', 'pronta', 'ready', 'vamos', 'vamos lá', 'pode enviar', 
-        'pode mandar', 'manda', 'envia', 'envie', 'bora', 'ok', 'sim', 
-        'yes', 'go', 'começar', 'comecar', 'começa', 'começa', 'start',
-        'iniciar', 'inicia', 'início', 'inicio', 'let\'s go', 'let us go',
-        'let\'s', 'let us', 'vamos começar', 'vamos comecar', 'vamos la', 
-        'pode começar', 'pode comecar', 'pode começar', 'pode comecar'
-    ]
-    
-    if any(keyword in normalized for keyword in ready_keywords):
+    if detectar(PRONTO, resposta_usuario):
         if user_state.perguntas and len(user_state.perguntas) >= 3:
             user_state.etapa = 'aguardando_resposta_1'
+            user_state.aguardando_entrega = None
             log.info("Usuário pronto e perguntas disponíveis - enviando primeira pergunta", extra={"user_id": user_state.user_key})
             return (f"*Pergunta 1:*\n{user_state.perguntas[0]}")
         else:
-            return "Quase lá! Estou finalizando suas perguntas personalizadas... Mais alguns segundos! ⏰"
+            user_state.aguardando_entrega = 'pergunta_1'
+            return "Quase lá! Estou finalizando suas perguntas personalizadas e te envio a primeira assim que ficar pronta. ⏰"
     else:
         if len(resposta_usuario.strip()) > 10:
             user_state.contexto = resposta_usuario
@@ -107,26 +102,33 @@ def handle_aguardando_resposta_2(user_state: UserState, resposta_usuario: str) -
         return "Erro: Terceira pergunta não encontrada. Digite 'reiniciar' para começar novamente."
 
 def handle_aguardando_resposta_3(user_state: UserState, resposta_usuario: str) -> str:
-    """Coleta a última resposta e inicia a geração do feedback."""
+    """
+    Coleta a última resposta. A task de feedback é disparada pelo webhook
+    depois que o estado é salvo, para que ela leia as três respostas, e envia
+    o feedback por conta própria quando terminar.
+    """
     if not resposta_usuario.strip():
         return "Por favor, responda à pergunta anterior para continuarmos."
     
     user_state.respostas.append(resposta_usuario)
     user_state.etapa = 'gerando_feedback'
-    tarefa_gerar_feedback.delay(user_state.user_key)
+    user_state.aguardando_entrega = 'feedback'
+    user_state.fim_entrevista_ts = time.time()
+    user_state.registrar_evento_funil("interview_completed")
     
-    log.info("Entrevista concluída", extra={
+    user_state.registrar_evento_log("Entrevista concluída", {
         "action": "interview_completed",
         "user_id": user_state.user_key
     })
     
-    log.info("Todas as respostas recebidas, task de feedback iniciada.", extra={"user_id": user_state.user_key})
-    return "Excelente! Recebi todas as suas respostas. ✅ Estou preparando um feedback curto e direto.\n\nAssim que estiver pronto para receber seu feedback, me avise com *'Pode enviar'*."
+    log.info("Todas as respostas recebidas, aguardando geração do feedback.", extra={"user_id": user_state.user_key})
+    return "Excelente! Recebi todas as suas respostas. ✅ Estou preparando um feedback curto e direto e te envio aqui assim que estiver pronto."
 
 def handle_gerando_feedback(user_state: UserState, resposta_usuario: str, twilio_client) -> str:
     """Verifica se o feedback está pronto e o envia imediatamente via TwiML Response."""
     if user_state.erro_feedback:
         user_state.etapa = 'aguardando_contexto'
+        user_state.aguardando_entrega = None
         return f"Houve um problema ao gerar seu feedback: {user_state.erro_feedback}. Digite 'reiniciar' para começar uma nova entrevista."
     
     if user_state.feedback_gerado:
@@ -138,23 +140,29 @@ def handle_gerando_feedback(user_state: UserState, resposta_usuario: str, twilio
         
         user_state.etapa = 'aguardando_feedback_usuario'
         user_state.feedback_gerado = None
+        user_state.aguardando_entrega = None
+        user_state.registrar_evento_log("Feedback entregue ao usuário", dados_entrega_feedback(user_state, "webhook"))
         
         return mensagem_completa
+    elif user_state.aguardando_entrega == 'feedback_stream':
+        return "Já estou te enviando o feedback, parte por parte. É só acompanhar por aqui! 📊"
     else:
+        user_state.aguardando_entrega = 'feedback'
         return "Estou finalizando seu feedback. Já te envio em instantes... 📊"
 
 def handle_aguardando_feedback_usuario(user_state: UserState, resposta_usuario: str) -> str:
     """Coleta o depoimento do usuário e oferece a versão PRO."""
     user_state.depoimento = resposta_usuario
     user_state.etapa = 'aguardando_email_pro'
+    user_state.registrar_evento_funil("user_feedback_received")
     
-    log.info("Depoimento do usuário recebido", extra={
+    user_state.registrar_evento_log("Depoimento do usuário recebido", {
         "action": "user_feedback_received",
         "user_id": user_state.user_key,
         "depoimento": resposta_usuario
     })
     
-    log.info("Oferecendo versão PRO", extra={
+    user_state.registrar_evento_log("Oferecendo versão PRO", {
         "action": "pro_version_offer",
         "user_id": user_state.user_key
     })
@@ -171,14 +179,14 @@ def handle_aguardando_feedback_usuario(user_state: UserState, resposta_usuario:
 
 def handle_aguardando_email_pro(user_state: UserState, resposta_usuario: str) -> str:
     """Processa a resposta sobre a versão PRO e finaliza ou coleta o email."""
-    if resposta_usuario.lower() in ['finalizar', 'finalizar.', 'nao', 'não', 'no', 'skip', 'pular']:
+    if detectar(RECUSAR_PRO, resposta_usuario):
         user_state.etapa = 'finalizado'
         
-        log.info("Versão PRO recusada", extra={
+        user_state.registrar_evento_log("Versão PRO recusada", {
             "action": "pro_version_declined",
             "user_id": user_state.user_key
         })
-        log.info("Ciclo do usuário completo", extra={
+        user_state.registrar_evento_log("Ciclo do usuário completo", {
             "action": "user_cycle_completed",
             "user_id": user_state.user_key
         })
@@ -187,13 +195,14 @@ def handle_aguardando_email_pro(user_state: UserState, resposta_usuario: str) ->
     
     if validar_email(resposta_usuario):
         email = resposta_usuario.strip()
+        user_state.registrar_evento_funil("pro_email_collected")
         
-        log.info("Email para versão PRO coletado", extra={
+        user_state.registrar_evento_log("Email para versão PRO coletado", {
             "action": "pro_email_collected",
             "user_id": user_state.user_key,
             "email": email
         })
-        log.info("Ciclo do usuário completo", extra={
+        user_state.registrar_evento_log("Ciclo do usuário completo", {
             "action": "user_cycle_completed", 
             "user_id": user_state.user_key
         })
@@ -222,3 +231,115 @@ STATE_HANDLERS = {
     "aguardando_feedback_usuario": handle_aguardando_feedback_usuario,
     "aguardando_email_pro": handle_aguardando_email_pro,
 }
+
+
+def processar_mensagem(user_state: UserState, resposta_usuario: str, twilio_client=None) -> tuple[UserState, str]:
+    """
+    Aplica uma mensagem do usuário à máquina de estados.
+    Trata o comando de reinício e estados desconhecidos, e devolve o estado
+    resultante (que pode ser uma nova instância) junto com o texto de resposta.
+    Compartilhado pelo webhook e pela task de transcrição.
+    """
+    user_key = user_state.user_key
+    prev_etapa = user_state.etapa
+
+    if detectar(REINICIAR, resposta_usuario):
+        user_state = UserState(user_key=user_key, last_user_ts=user_state.last_user_ts)
+        handler = STATE_HANDLERS.get(user_state.etapa)
+        with medir_etapa(user_state.etapa):
+            response_text = handler(user_state, resposta_usuario)
+        log.info("Usuário reiniciou a conversa", extra={"user_id": user_key})
+        return user_state, response_text
+
+    handler = STATE_HANDLERS.get(user_state.etapa)
+    if not handler:
+        log.warning("Estado desconhecido encontrado, resetando usuário", extra={"user_id": user_key, "etapa": user_state.etapa})
+        user_state = UserState(user_key=user_key, last_user_ts=user_state.last_user_ts)
+        return user_state, "Me perdi aqui. Vamos recomeçar para garantir que tudo corra bem. Me conte sua vaga, experiência e tecnologias."
+
+    log.info("Processando etapa do usuário", extra={"user_id": user_key, "etapa": user_state.etapa})
+    with medir_etapa(prev_etapa):
+        if user_state.etapa == 'gerando_feedback':
+            response_text = handler(user_state, resposta_usuario, twilio_client)
+        else:
+            response_text = handler(user_state, resposta_usuario)
+
+    if user_state.etapa == 'preparando_perguntas' and prev_etapa == 'aguardando_contexto':
+        user_state.registrar_evento_funil("interview_started")
+        user_state.registrar_evento_log("Entrevista iniciada", {
+            "action": "interview_started",
+            "user_id": user_key
+        })
+
+    return user_state, response_text
+
+
+def criar_mutador_mensagem(user_key: str, resposta_usuario: str, last_user_ts: int, twilio_client=None):
+    """
+    Cria o mutador usado com `atualizar_estado`/`atualizar_estado_async` para
+    aplicar uma mensagem ao estado do usuário. O resultado do mutador é a tupla
+    `(prev_etapa, response_text, novo_usuario, eventos)`; `eventos` são os logs
+    de negócio da transição, a emitir com `emitir_eventos` depois que o CAS
+    confirmar a gravação (um conflito reexecuta o mutador).
+    """
+    def mutador(atual: UserState | None):
+        novo_usuario = atual is None
+        user_state = atual if atual else UserState()
+        prev_etapa = user_state.etapa
+        user_state.user_key = user_key
+        user_state.last_user_ts = max(last_user_ts, user_state.last_user_ts or 0)
+        user_state, response_text = processar_mensagem(user_state, resposta_usuario, twilio_client)
+        if novo_usuario:
+            # Depois de processar: um 'reiniciar' logo na primeira mensagem troca a instância.
+            user_state.registrar_evento_funil("new_user_detected")
+            user_state.eventos_log().insert(0, ("Novo usuário detectado", {
+                "action": "new_user_detected",
+                "user_id": user_key
+            }))
+        return user_state, (prev_etapa, response_text, novo_usuario, user_state.eventos_log())
+
+    return mutador
+
+
+def emitir_eventos(eventos: list):
+    """Emite os logs de negócio devolvidos por um mutador já gravado."""
+    for mensagem, extra in eventos:
+        log.info(mensagem, extra=extra)
+
+
+def disparar_tarefas(prev_etapa: str, user_state: UserState) -> dict:
+    """
+    Dispara as tasks Celery associadas à transição de etapa recém-salva.
+    Deve ser chamada depois que o estado foi persistido, para que o worker
+    leia a versão atualizada. Retorna os campos de erro a gravar no estado
+    caso o disparo falhe (dicionário vazio em caso de sucesso).
+    """
+    user_key = user_state.user_key
+
+    if user_state.etapa == 'preparando_perguntas' and prev_etapa == 'aguardando_contexto':
+        try:
+            tarefa_gerar_perguntas.delay(user_key, user_state.contexto, user_state.last_user_ts)
+            log.info("Task tarefa_gerar_perguntas disparada", extra={"user_id": user_key})
+        except Exception as e:
+            log.error("Falha ao disparar tarefa de geração de perguntas", extra={"user_id": user_key, "error": str(e)})
+            return {"erro_geracao": "Erro ao iniciar geração de perguntas. Tente novamente."}
+
+    if (settings.FEEDBACK_INCREMENTAL and
+            (prev_etapa, user_state.etapa) in [('aguardando_resposta_1', 'aguardando_resposta_2'),
+                                               ('aguardando_resposta_2', 'aguardando_resposta_3')]):
+        indice = len(user_state.respostas) - 1
+        try:
+            tarefa_avaliar_resposta.delay(user_key, indice)
+            log.info("Task tarefa_avaliar_resposta disparada", extra={"user_id": user_key, "indice": indice})
+        except Exception as e:
+            log.warning("Falha ao disparar avaliação antecipada; será feita no feedback final", extra={"user_id": user_key, "error": str(e)})
+
+    if user_state.etapa == 'gerando_feedback' and prev_etapa == 'aguardando_resposta_3':
+        try:
+            tarefa_gerar_feedback.delay(user_key)
+            log.info("Task tarefa_gerar_feedback disparada", extra={"user_id": user_key})
+        except Exception as e:
+            log.error("Falha ao disparar tarefa de geração de feedback", extra={"user_id": user_key, "error": str(e)})
+            return {"erro_feedback": "Erro ao iniciar geração do feedback."}
+
+    return {}
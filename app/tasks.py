@@ -2,25 +2,84 @@ import json
 import logging
 import time
 from celery import Celery
+from celery.signals import setup_logging, task_postrun, task_prerun, worker_process_init, worker_process_shutdown
 from celery.utils.log import get_task_logger
-from vertexai.generative_models import GenerativeModel
 
 from app.config import settings
-from app.services.redis_service import get_redis_client
+from app.logs import configurar_logs, encerrar_logs
+from app.metricas import finalizar_tarefa, iniciar_tarefa
+from app.services.redis_service import get_redis_client, carregar_estado, atualizar_estado, atualizar_campos
 from app.models import UserState
-from app.services.twilio_service import get_twilio_client, enviar_mensagem_longa
-from app.services.gcp_service import initialize_vertexai
+from app.utils import dentro_da_janela_whatsapp, registrar_entrega_feedback
+from app.services.twilio_service import get_twilio_client, dividir_mensagem, download_twilio_media
+from app.services.envio_service import PRIORIDADE_ALTA, PRIORIDADE_BAIXA, EnvioRecusadoError, despachar_parte, enviar_em_ordem
+from app.services.gcp_service import CircuitoAbertoError, get_generative_model, aquecer_modelos, gerar_texto, gerar_texto_em_stream, transcrever_audio_gcp
+from app.services.archive_service import arquivar_sessoes_expirando
+from app.services.ordem_service import aguardar_vez, liberar_vez
+from app.services.cache_service import (
+    buscar_perguntas_em_cache, salvar_perguntas_em_cache,
+    buscar_transcricao_por_midia, buscar_transcricao_por_conteudo, salvar_transcricao_em_cache,
+)
+from app.services.semantic_cache_service import buscar_perguntas_semelhantes, registrar_contexto_semantico
 
 celery_app = Celery('tasks', broker=settings.CELERY_BROKER_URL, backend=settings.CELERY_BROKER_URL)
+# Sem prefetch, um worker ocupado não segura mensagens de baixa prioridade
+# enquanto chegam perguntas e feedbacks na fila.
+celery_app.conf.worker_prefetch_multiplier = 1
 log = get_task_logger(__name__)
 
+# Respostas enviadas depois destas etapas são a oferta PRO e o encerramento,
+# que podem esperar atrás das perguntas e feedbacks de outros usuários.
+ETAPAS_MARKETING = ('aguardando_email_pro', 'finalizado')
+
+MENSAGEM_IA_INSTAVEL = "Nosso serviço de IA está instável no momento"
+
+MENSAGEM_PEDIDO_FEEDBACK = (
+    "\n\nEspero que este feedback tenha ajudado! 🙏\n\n"
+    "Sua opinião é ouro para nós. O que você achou da experiência?"
+)
+
+
+@setup_logging.connect
+def configurar_logs_worker(**kwargs):
+    """Usa no worker o mesmo pipeline de logs do webhook, no lugar do logging do Celery."""
+    configurar_logs()
+
+
+@worker_process_init.connect
+def inicializar_processo_worker(**kwargs):
+    """Aquece o Vertex AI e o modelo generativo uma vez em cada processo do worker."""
+    # A thread que escreve os logs não sobrevive ao fork do processo filho.
+    configurar_logs()
+    if not aquecer_modelos():
+        log.error("Falha ao aquecer o modelo generativo no processo do worker.")
+
+
+@worker_process_shutdown.connect
+def encerrar_processo_worker(**kwargs):
+    """Grava os logs que ainda estão na fila antes de o processo do worker sair."""
+    encerrar_logs()
+
+
+@task_prerun.connect
+def marcar_inicio_tarefa(task_id=None, **kwargs):
+    iniciar_tarefa(task_id)
+
+
+@task_postrun.connect
+def medir_duracao_tarefa(task_id=None, task=None, state=None, **kwargs):
+    """Registra a duração da task no histograma exposto em /metrics."""
+    finalizar_tarefa(task_id, task.name, state)
+
+
 @celery_app.task
 def tarefa_gerar_perguntas(user_key, contexto, last_user_ts=None):
     """
     Worker que gera as perguntas da entrevista em segundo plano.
-    Agora recebe last_user_ts para decidir se pode enviar a pergunta imediatamente
-    (janela de 24h). Caso contrário, marca perguntas_prontas para que o webhook
-    envie quando o usuário voltar.
+    Se o usuário já pediu a primeira pergunta e está na janela de 24h
+    (last_user_ts), o worker a envia assim que as perguntas ficam prontas
+    (ver `_mutador_resultado_perguntas`). Caso contrário, só as grava, e o
+    webhook envia a primeira quando o usuário avisar que está pronto.
     """
     log.info("Iniciando task: gerar perguntas", extra={"user_id": user_key, "contexto_length": len(contexto)})
     r = get_redis_client()
@@ -28,61 +87,103 @@ def tarefa_gerar_perguntas(user_key, contexto, last_user_ts=None):
         log.error("Task falhou: Redis não disponível.", extra={"user_id": user_key})
         return
 
-    user_state_json = r.get(user_key)
-    if user_state_json:
+    twilio_client = get_twilio_client()
+    erro = None
+    perguntas = buscar_perguntas_em_cache(r, contexto, user_key)
+    if perguntas is None:
+        perguntas = buscar_perguntas_semelhantes(r, contexto, user_key)
+
+    if perguntas is None:
+        if not get_generative_model() or not twilio_client:
+            log.error("Falha ao inicializar serviços (Vertex AI ou Twilio)", extra={"user_id": user_key})
+            atualizar_estado(r, user_key, _mutador_resultado_perguntas(user_key, contexto, last_user_ts, erro="Erro de configuração interna."))
+            return
+
         try:
-            user_state = UserState.model_validate_json(user_state_json)
+            perguntas = _gerar_perguntas_ia(contexto)
+            log.info("Perguntas geradas com sucesso", extra={"user_id": user_key, "questions_count": len(perguntas)})
+            removidos = salvar_perguntas_em_cache(r, contexto, perguntas)
+            registrar_contexto_semantico(r, contexto, removidos)
         except Exception as e:
-            log.error("Erro ao deserializar estado do usuário", extra={"user_id": user_key, "error": str(e)})
-            user_state = UserState(user_key=user_key, contexto=contexto, etapa='preparando_perguntas')
-    else:
-        user_state = UserState(user_key=user_key, contexto=contexto, etapa='preparando_perguntas')
+            log.error(
+                "Erro na task de geração de perguntas", 
+                exc_info=True, 
+                extra={"user_id": user_key, "error": str(e), "error_type": type(e).__name__}
+            )
+            perguntas = None
+            if isinstance(e, CircuitoAbertoError):
+                erro = f"{MENSAGEM_IA_INSTAVEL}. Tente novamente em alguns minutos."
+            else:
+                erro = "Não consegui gerar as perguntas com base no seu contexto. Poderia tentar descrevê-lo de outra forma?"
 
-    if last_user_ts:
-        user_state.last_user_ts = last_user_ts
-
-    twilio_client = get_twilio_client()
-    if not initialize_vertexai() or not twilio_client:
-        log.error("Falha ao inicializar serviços (Vertex AI ou Twilio)", extra={"user_id": user_key})
-        user_state.erro_geracao = "Erro de configuração interna."
-        r.set(user_key, user_state.model_dump_json())
+    try:
+        user_state, mensagem_push = atualizar_estado(r, user_key, _mutador_resultado_perguntas(user_key, contexto, last_user_ts, perguntas=perguntas, erro=erro, resetar_contexto=erro is not None))
+        log.info("Estado do usuário salvo no Redis", extra={"user_id": user_key, "etapa": user_state.etapa if user_state else None})
+    except Exception as e:
+        log.error("Erro ao salvar estado no Redis", extra={"user_id": user_key, "error": str(e)})
         return
 
-    try:
-        model = GenerativeModel("gemini-2.5-flash-lite")
-        prompt = f"""
-        Você é um recrutador técnico sênior. Baseado no seguinte contexto de um candidato: '{contexto}'.
-        Gere exatamente 3 perguntas de entrevista (2 de soft skill e 1 de hard skill) no formato JSON array:
-        {{"perguntas": ["pergunta1", "pergunta2", "pergunta3"]}}
-        """
-        response = model.generate_content(prompt)
-        json_response_text = response.text.strip().replace("```json", "").replace("```", "")
-        perguntas_dict = json.loads(json_response_text)
-        perguntas = perguntas_dict.get("perguntas", [])
-
-        if perguntas and len(perguntas) == 3:
-            user_state.perguntas = perguntas
-            user_state.respostas = []
-            log.info("Perguntas geradas com sucesso", extra={"user_id": user_key, "questions_count": len(perguntas)})
+    if mensagem_push:
+        _enviar_push(user_key, mensagem_push, "pergunta_1" if perguntas else "erro_geracao")
+
+
+def _gerar_perguntas_ia(contexto: str) -> list:
+    """Pede ao modelo as 3 perguntas da entrevista e valida o formato da resposta."""
+    prompt = f"""
+    Você é um recrutador técnico sênior. Baseado no seguinte contexto de um candidato: '{contexto}'.
+    Gere exatamente 3 perguntas de entrevista (2 de soft skill e 1 de hard skill) no formato JSON array:
+    {{"perguntas": ["pergunta1", "pergunta2", "pergunta3"]}}
+    """
+    json_response_text = gerar_texto(prompt).strip().replace("```json", "").replace("```", "")
+    perguntas = json.loads(json_response_text).get("perguntas", [])
+    if not perguntas or len(perguntas) != 3:
+        raise ValueError("Formato de resposta inesperado da IA.")
+    return perguntas
+
 
-            user_state.perguntas_prontas = True
+def _mutador_resultado_perguntas(user_key, contexto, last_user_ts, perguntas=None, erro=None, resetar_contexto=False):
+    """
+    Mutador que grava o resultado de `tarefa_gerar_perguntas` no estado atual.
+    Se o usuário já saiu de 'preparando_perguntas' (ex.: reiniciou a conversa),
+    o resultado é descartado em vez de sobrescrever o novo fluxo.
+
+    Se o usuário já pediu a primeira pergunta (`aguardando_entrega`) e está na
+    janela de 24h, a transição de etapa é feita aqui e o resultado do mutador é
+    a mensagem a enviar. Como a marca é limpa na mesma gravação atômica, só um
+    dos lados (webhook ou worker) entrega a pergunta.
+    """
+    def mutador(atual):
+        if atual is None:
+            atual = UserState(user_key=user_key, contexto=contexto, etapa='preparando_perguntas')
+        elif atual.etapa != 'preparando_perguntas':
+            log.info("Usuário saiu da etapa de preparação; descartando resultado", extra={"user_id": user_key, "etapa": atual.etapa})
+            return atual, None
+
+        if last_user_ts:
+            atual.last_user_ts = max(last_user_ts, atual.last_user_ts or 0)
+
+        entregar_agora = atual.aguardando_entrega == 'pergunta_1' and dentro_da_janela_whatsapp(atual.last_user_ts)
+
+        if perguntas:
+            atual.perguntas = perguntas
+            atual.respostas = []
+            if entregar_agora:
+                atual.etapa = 'aguardando_resposta_1'
+                atual.aguardando_entrega = None
+                return atual, f"*Pergunta 1:*\n{perguntas[0]}"
+        elif entregar_agora:
+            atual.etapa = 'aguardando_contexto'
+            atual.contexto = None
+            atual.aguardando_entrega = None
+            return atual, erro
         else:
-            raise ValueError("Formato de resposta inesperado da IA.")
-    except Exception as e:
-        log.error(
-            "Erro na task de geração de perguntas", 
-            exc_info=True, 
-            extra={"user_id": user_key, "error": str(e), "error_type": type(e).__name__}
-        )
-        user_state.etapa = 'aguardando_contexto'
-        user_state.contexto = None
-        user_state.erro_geracao = "Não consegui gerar as perguntas com base no seu contexto. Poderia tentar descrevê-lo de outra forma?"
+            if resetar_contexto:
+                atual.etapa = 'aguardando_contexto'
+                atual.contexto = None
+            atual.erro_geracao = erro
+        return atual, None
 
-    try:
-        r.set(user_key, user_state.model_dump_json())
-        log.info("Estado do usuário salvo no Redis", extra={"user_id": user_key, "etapa": user_state.etapa})
-    except Exception as e:
-        log.error("Erro ao salvar estado no Redis", extra={"user_id": user_key, "error": str(e)})
+    return mutador
 
 
 @celery_app.task
@@ -90,6 +191,8 @@ def tarefa_gerar_feedback(user_key):
     """
     Worker que analisa as respostas e gera o feedback final.
     Utiliza o modelo UserState para carregar e salvar os dados de forma segura.
+    Se o usuário ainda estiver na janela de 24h, o feedback é enviado direto
+    por aqui, sem esperar que ele peça de novo.
     """
     log.info("Iniciando task: gerar feedback", extra={"user_id": user_key})
     r = get_redis_client()
@@ -97,22 +200,152 @@ def tarefa_gerar_feedback(user_key):
         log.error("Task falhou: Redis não disponível.", extra={"user_id": user_key})
         return
 
-    user_state_json = r.get(user_key)
-    if not user_state_json:
+    user_state = carregar_estado(r, user_key)
+    if not user_state:
         log.error("Estado do usuário não encontrado no Redis para a task.", extra={"user_id": user_key})
         return
-    user_state = UserState.model_validate_json(user_state_json)
 
     if not all([user_state.contexto, user_state.perguntas, user_state.respostas]):
         log.error("Dados insuficientes para gerar feedback.", extra={"user_id": user_key})
-        user_state.erro_feedback = "Dados da entrevista estavam incompletos."
-        r.set(user_key, user_state.model_dump_json())
+        atualizar_campos(r, user_key, erro_feedback="Dados da entrevista estavam incompletos.")
         return
 
-    from app.services.gcp_service import initialize_vertexai
-    initialize_vertexai()
+    if settings.FEEDBACK_STREAMING and not settings.FEEDBACK_INCREMENTAL and _reservar_entrega_em_stream(r, user_key):
+        _transmitir_feedback(r, user_key, user_state)
+        return
 
-    prompt = f"""
+    campos = {}
+    try:
+        if settings.FEEDBACK_INCREMENTAL:
+            feedback = _montar_feedback_incremental(user_key, user_state)
+        else:
+            feedback = _gerar_feedback_completo(user_state)
+
+        campos["feedback_gerado"] = feedback
+
+        log.info("Feedback gerado com sucesso", extra={
+            "action": "feedback_generation_success",
+            "user_id": user_key,
+            "feedback_length": len(feedback)
+        })
+
+    except Exception as e:
+        log.error("Erro na task de geração de feedback", extra={"user_id": user_key, "error": str(e)})
+        campos["erro_feedback"] = MENSAGEM_IA_INSTAVEL if isinstance(e, CircuitoAbertoError) else "Erro técnico ao gerar feedback."
+
+    def mutador(atual):
+        if atual is None or atual.etapa != 'gerando_feedback':
+            log.info("Usuário saiu da etapa de feedback; descartando resultado", extra={"user_id": user_key})
+            return atual, None
+        if atual.aguardando_entrega == 'feedback' and dentro_da_janela_whatsapp(atual.last_user_ts):
+            atual.aguardando_entrega = None
+            if "feedback_gerado" in campos:
+                atual.etapa = 'aguardando_feedback_usuario'
+                return atual, campos["feedback_gerado"]
+            atual.etapa = 'aguardando_contexto'
+            return atual, f"Houve um problema ao gerar seu feedback: {campos['erro_feedback']}. Digite 'reiniciar' para começar uma nova entrevista."
+        for campo, valor in campos.items():
+            setattr(atual, campo, valor)
+        return atual, None
+
+    user_state, mensagem_push = atualizar_estado(r, user_key, mutador)
+    if mensagem_push:
+        _enviar_push(user_key, mensagem_push, "feedback" if "feedback_gerado" in campos else "erro_feedback")
+        if "feedback_gerado" in campos:
+            registrar_entrega_feedback(user_state, "push")
+
+
+def _reservar_entrega_em_stream(r, user_key) -> bool:
+    """
+    Marca que o feedback será entregue em streaming por este worker. Só
+    reserva se o usuário está esperando o feedback dentro da janela de 24h;
+    caso contrário, o feedback é gerado inteiro e guardado como antes.
+    """
+    if not get_twilio_client():
+        return False
+
+    def mutador(atual):
+        if (atual is None or atual.etapa != 'gerando_feedback' or atual.aguardando_entrega != 'feedback'
+                or not dentro_da_janela_whatsapp(atual.last_user_ts)):
+            return atual, False
+        atual.aguardando_entrega = 'feedback_stream'
+        return atual, True
+
+    return atualizar_estado(r, user_key, mutador)[1]
+
+
+def _transmitir_feedback(r, user_key, user_state: UserState):
+    """
+    Gera o feedback completo em streaming e envia cada bloco de parágrafos
+    terminados (com pelo menos FEEDBACK_STREAMING_MIN_CARACTERES) assim que
+    ele fica pronto, dividido pela mesma lógica de `enviar_mensagem_longa`.
+    As partes saem em sequência, pelo limitador de envios, para manter a ordem;
+    se uma delas for recusada ou esgotar as novas tentativas, o streaming é
+    interrompido.
+    """
+    twilio_client = get_twilio_client()
+    inicio = time.monotonic()
+    trechos, partes_enviadas = [], 0
+
+    def enviar(texto):
+        nonlocal partes_enviadas
+        for parte in dividir_mensagem(texto):
+            if not enviar_em_ordem(r, twilio_client, user_key, parte):
+                raise RuntimeError("Twilio não aceitou uma parte do feedback.")
+            partes_enviadas += 1
+            if partes_enviadas == 1:
+                log.info("Primeiro trecho do feedback enviado", extra={
+                    "action": "feedback_stream_first_chunk",
+                    "user_id": user_key,
+                    "time_to_first_chunk_ms": int((time.monotonic() - inicio) * 1000)
+                })
+
+    erro = None
+    try:
+        pendente = ""
+        for trecho in gerar_texto_em_stream(_prompt_feedback_completo(user_state)):
+            trechos.append(trecho)
+            pendente += trecho
+            prontos, separador, resto = pendente.rpartition("\n\n")
+            if len(prontos) >= settings.FEEDBACK_STREAMING_MIN_CARACTERES:
+                enviar(prontos)
+                pendente = resto
+        if pendente.strip():
+            enviar(pendente)
+        if not partes_enviadas:
+            raise ValueError("Feedback vazio retornado pela IA.")
+    except Exception as e:
+        log.error("Erro na geração do feedback em streaming", extra={"user_id": user_key, "error": str(e), "parts_sent": partes_enviadas})
+        erro = MENSAGEM_IA_INSTAVEL if isinstance(e, CircuitoAbertoError) else "Erro técnico ao gerar feedback."
+
+    log.info("Feedback em streaming concluído", extra={
+        "action": "feedback_stream_complete" if not erro else "feedback_stream_failed",
+        "user_id": user_key,
+        "time_to_complete_ms": int((time.monotonic() - inicio) * 1000),
+        "parts_sent": partes_enviadas,
+        "feedback_length": sum(len(t) for t in trechos)
+    })
+
+    def mutador(atual):
+        if atual is None or atual.etapa != 'gerando_feedback' or atual.aguardando_entrega != 'feedback_stream':
+            return atual, None
+        atual.aguardando_entrega = None
+        if erro:
+            atual.etapa = 'aguardando_contexto'
+            return atual, f"Houve um problema ao gerar seu feedback: {erro}. Digite 'reiniciar' para começar uma nova entrevista."
+        atual.etapa = 'aguardando_feedback_usuario'
+        return atual, None
+
+    user_state, mensagem_erro = atualizar_estado(r, user_key, mutador)
+    if mensagem_erro:
+        _enviar_push(user_key, mensagem_erro, "erro_feedback")
+    elif not erro and user_state is not None:
+        registrar_entrega_feedback(user_state, "push", modo="streaming")
+
+
+def _prompt_feedback_completo(user_state: UserState) -> str:
+    """Prompt do feedback das três respostas em uma única chamada ao modelo."""
+    return f"""
     Você é um coach de carreira especialista em recrutamento.
     
     **IMPORTANTE: Sua resposta deve ter NO MÁXIMO 1200 caracteres total.**
@@ -137,20 +370,233 @@ def tarefa_gerar_feedback(user_key):
     
     LIMITE: 1200 caracteres no total.
     """
-    try:
-        model = GenerativeModel("gemini-2.5-flash-lite")
-        response = model.generate_content(prompt)
-        
-        user_state.feedback_gerado = response.text
-        
-        log.info("Feedback gerado com sucesso", extra={
-            "action": "feedback_generation_success",
-            "user_id": user_key,
-            "feedback_length": len(response.text)
-        })
 
-    except Exception as e:
-        log.error("Erro na task de geração de feedback", extra={"user_id": user_key, "error": str(e)})
-        user_state.erro_feedback = "Erro técnico ao gerar feedback."
+
+def _gerar_feedback_completo(user_state: UserState) -> str:
+    """Gera o feedback das três respostas em uma única chamada ao modelo."""
+    return gerar_texto(_prompt_feedback_completo(user_state))
+
+
+def _avaliar_resposta(contexto: str, pergunta: str, resposta: str, numero: int) -> str:
+    """Gera a avaliação curta de uma única resposta (seção do feedback final)."""
+    prompt = f"""
+    Você é um coach de carreira especialista em recrutamento.
+    
+    **IMPORTANTE: Sua resposta deve ter NO MÁXIMO 400 caracteres.**
+    
+    Contexto do candidato: {contexto}
+    
+    Pergunta {numero}: {pergunta}
+    Resposta: {resposta}
     
-    r.set(user_key, user_state.model_dump_json())
+    Comece com "*Pergunta {numero}*" e dê: clareza% + 1 ponto forte + 1 melhoria (máximo 2 linhas).
+    Use *negrito* e emojis, mas poucos. Não faça introdução nem despedida.
+    """
+    avaliacao = gerar_texto(prompt).strip()
+    if not avaliacao:
+        raise ValueError("Avaliação vazia retornada pela IA.")
+    return avaliacao
+
+
+def _montar_feedback_incremental(user_key, user_state: UserState) -> str:
+    """
+    Etapa final do modo incremental: junta as avaliações já calculadas por
+    `tarefa_avaliar_resposta` e avalia na hora apenas as que faltam
+    (normalmente só a terceira resposta).
+    """
+    avaliacoes = []
+    reaproveitadas = 0
+    for indice in range(3):
+        avaliacao = user_state.avaliacoes.get(str(indice))
+        if avaliacao:
+            reaproveitadas += 1
+        else:
+            avaliacao = _avaliar_resposta(user_state.contexto, user_state.perguntas[indice], user_state.respostas[indice], indice + 1)
+        avaliacoes.append(avaliacao)
+
+    log.info("Feedback incremental montado", extra={"user_id": user_key, "evaluations_reused": reaproveitadas})
+    return "\n\n".join(avaliacoes) + MENSAGEM_PEDIDO_FEEDBACK
+
+
+@celery_app.task
+def tarefa_avaliar_resposta(user_key, indice):
+    """
+    Worker do modo de feedback incremental (FEEDBACK_INCREMENTAL).
+    Avalia uma resposta assim que ela chega e guarda o resultado em
+    `UserState.avaliacoes`, sobrepondo a latência do modelo com o tempo em que
+    o usuário responde às próximas perguntas.
+    """
+    log.info("Iniciando task: avaliar resposta", extra={"user_id": user_key, "indice": indice})
+    r = get_redis_client()
+    if not r:
+        log.error("Task falhou: Redis não disponível.", extra={"user_id": user_key})
+        return
+
+    user_state = carregar_estado(r, user_key)
+    if not user_state or len(user_state.respostas) <= indice or len(user_state.perguntas) <= indice:
+        log.error("Resposta não encontrada no estado para avaliação.", extra={"user_id": user_key, "indice": indice})
+        return
+
+    resposta = user_state.respostas[indice]
+    try:
+        avaliacao = _avaliar_resposta(user_state.contexto, user_state.perguntas[indice], resposta, indice + 1)
+    except Exception as e:
+        log.error("Erro na task de avaliação de resposta", extra={"user_id": user_key, "indice": indice, "error": str(e)})
+        return
+
+    def mutador(atual):
+        if atual is None or len(atual.respostas) <= indice or atual.respostas[indice] != resposta:
+            log.info("Resposta mudou desde a avaliação; descartando resultado", extra={"user_id": user_key, "indice": indice})
+            return atual, None
+        atual.avaliacoes[str(indice)] = avaliacao
+        return atual, None
+
+    atualizar_estado(r, user_key, mutador)
+    log.info("Avaliação da resposta salva", extra={"user_id": user_key, "indice": indice})
+
+
+@celery_app.task(bind=True, queue='envios', max_retries=settings.TWILIO_MAX_REENVIOS)
+def tarefa_enviar_mensagem(self, destinatario, texto, parte_inicial=0, tentativa=0):
+    """
+    Despachante de envios: toda mensagem enviada pela API da Twilio passa por
+    aqui, uma task por mensagem. As partes (divididas como em
+    `enviar_mensagem_longa`) saem em ordem, cada uma limitada pelo token
+    bucket do remetente. Sob throttling, a task é reagendada no broker a
+    partir da primeira parte não enviada (`parte_inicial`), sem reenviar as
+    já aceitas, até TWILIO_MAX_REENVIOS vezes; `tentativa` conta as novas
+    tentativas dessa parte. Se uma parte falhar, as seguintes não são enviadas.
+    Roda na fila 'envios' para não disputar workers com as chamadas ao LLM.
+    """
+    r = get_redis_client()
+    twilio_client = get_twilio_client()
+    if not r or not twilio_client:
+        log.error("Envio falhou: Redis ou cliente Twilio indisponível.", extra={"recipient": destinatario})
+        raise self.retry(countdown=settings.TWILIO_BACKOFF_INICIAL * 10)
+
+    partes = dividir_mensagem(texto)
+    for indice in range(parte_inicial, len(partes)):
+        try:
+            espera = despachar_parte(r, twilio_client, destinatario, partes[indice], tentativa if indice == parte_inicial else 0)
+        except EnvioRecusadoError:
+            log.error("Envio da mensagem interrompido: parte recusada pela Twilio", extra={
+                "recipient": destinatario, "part": indice + 1, "parts": len(partes), "dropped_parts": len(partes) - indice
+            })
+            return False
+        if espera is not None:
+            if self.request.retries >= self.max_retries:
+                log.error("Envio da mensagem abandonado após o limite de novas tentativas", extra={
+                    "recipient": destinatario, "part": indice + 1, "parts": len(partes),
+                    "dropped_parts": len(partes) - indice, "retries": self.request.retries
+                })
+                return False
+            proxima = tentativa + 1 if indice == parte_inicial else 1
+            raise self.retry(args=(destinatario, texto, indice, proxima), countdown=espera)
+
+    if len(partes) > 1:
+        log.info("Envio de mensagem longa concluído", extra={"recipient": destinatario, "parts": len(partes)})
+    return True
+
+
+def enfileirar_mensagem(destinatario, texto, prioridade=PRIORIDADE_ALTA):
+    """Entrega a mensagem ao despachante de envios, que a divide e envia as partes em ordem."""
+    tarefa_enviar_mensagem.apply_async(args=(destinatario, texto), priority=prioridade)
+
+
+def _enviar_push(user_key, mensagem, conteudo):
+    """Envia ao usuário um conteúdo que ele já havia pedido, sem esperar nova mensagem."""
+    enfileirar_mensagem(user_key, mensagem)
+    log.info("Conteúdo enviado proativamente ao usuário", extra={
+        "action": "content_pushed",
+        "user_id": user_key,
+        "content": conteudo
+    })
+
+
+@celery_app.task(queue='stt')
+def tarefa_transcrever_audio(user_key, media_url, last_user_ts=None, senha=None):
+    """
+    Worker do modo "confirma e processa" de áudios (TRANSCRICAO_ASSINCRONA).
+    Baixa e transcreve o áudio fora do webhook, aplica o texto à máquina de
+    estados e envia a resposta ao usuário via Twilio.
+    Roda na fila 'stt' para que os workers de transcrição escalem separadamente.
+
+    `senha` é a posição da mensagem na ordem do usuário, emitida pelo webhook
+    na chegada: o texto só é aplicado depois das mensagens anteriores, e a
+    senha é liberada ao final mesmo em caso de falha.
+    """
+    log.info("Iniciando task: transcrever áudio", extra={"user_id": user_key, "media_url": media_url})
+    r = get_redis_client()
+    if not r:
+        log.error("Task falhou: Redis não disponível.", extra={"user_id": user_key})
+        return
+
+    try:
+        _transcrever_e_aplicar_audio(r, user_key, media_url, last_user_ts, senha)
+    finally:
+        liberar_vez(r, user_key, senha)
+
+
+def _transcrever_e_aplicar_audio(r, user_key, media_url, last_user_ts, senha):
+    from app.state_machine import criar_mutador_mensagem, disparar_tarefas, emitir_eventos
+
+    twilio_client = get_twilio_client()
+    transcricao = buscar_transcricao_por_midia(r, media_url, user_key)
+    if not transcricao:
+        audio_content = download_twilio_media(media_url)
+        if not audio_content:
+            log.error("Falha no download da mídia", extra={"user_id": user_key})
+            enfileirar_mensagem(user_key, "Não consegui processar seu áudio. Por favor, tente novamente.")
+            return
+
+        transcricao = buscar_transcricao_por_conteudo(r, media_url, audio_content, user_key)
+        if not transcricao:
+            transcricao = transcrever_audio_gcp(audio_content)
+            if transcricao and transcricao.strip():
+                salvar_transcricao_em_cache(r, media_url, audio_content, transcricao.strip())
+
+    if not transcricao or not transcricao.strip():
+        log.warning("Transcrição vazia ou falhou", extra={"user_id": user_key, "transcription": transcricao})
+        enfileirar_mensagem(user_key, "Não consegui entender seu áudio. Por favor, tente falar mais claramente ou envie uma mensagem de texto.")
+        return
+
+    resposta_usuario = transcricao.strip()
+    log.info("Áudio transcrito com sucesso", extra={"user_id": user_key, "transcription_length": len(resposta_usuario), "transcription": resposta_usuario})
+
+    aguardar_vez(r, user_key, senha)
+    user_state, (prev_etapa, response_text, novo_usuario, eventos) = atualizar_estado(
+        r, user_key, criar_mutador_mensagem(user_key, resposta_usuario, last_user_ts or int(time.time()), twilio_client)
+    )
+    emitir_eventos(eventos)
+    if user_state.etapa == 'finalizado':
+        log.info("Ciclo do usuário finalizado. Estado removido do Redis.", extra={"user_id": user_key})
+
+    campos_erro = disparar_tarefas(prev_etapa, user_state)
+    if campos_erro:
+        atualizar_campos(r, user_key, **campos_erro)
+
+    if response_text:
+        prioridade = PRIORIDADE_BAIXA if user_state.etapa in ETAPAS_MARKETING else PRIORIDADE_ALTA
+        enfileirar_mensagem(user_key, response_text, prioridade)
+        log.info("Resposta enviada ao usuário", extra={"user_id": user_key, "response_preview": response_text[:100]})
+
+
+@celery_app.task
+def tarefa_arquivar_sessoes():
+    """
+    Worker periódico (Celery beat) que arquiva em disco as sessões abandonadas
+    prestes a expirar, liberando memória do Redis sem perder os dados para análise.
+    """
+    r = get_redis_client()
+    if not r:
+        log.error("Task falhou: Redis não disponível.")
+        return
+    arquivar_sessoes_expirando(r)
+
+
+if settings.ARQUIVAMENTO_ATIVO:
+    celery_app.conf.beat_schedule = {
+        "arquivar-sessoes-expirando": {
+            "task": tarefa_arquivar_sessoes.name,
+            "schedule": settings.ARQUIVAMENTO_INTERVALO,
+        },
+    }
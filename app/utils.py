@@ -1,4 +1,14 @@
+import hashlib
+import logging
 import re
+import time
+import unicodedata
+
+from app.config import settings
+
+log = logging.getLogger(__name__)
+
+JANELA_WHATSAPP_SEGUNDOS = 24 * 3600
 
 def validar_email(email: str) -> bool:
     """
@@ -8,3 +18,57 @@ def validar_email(email: str) -> bool:
         return False
     padrao = r'^[a-zA-Z0-9._%+-]+@[a-zA-Z0-9.-]+\.[a-zA-Z]{2,}$'
     return re.match(padrao, email) is not None
+
+
+def remover_acentos(texto: str) -> str:
+    """Remove acentos e diacríticos (ex.: 'júnior' -> 'junior')."""
+    decomposto = unicodedata.normalize("NFKD", texto)
+    return "".join(c for c in decomposto if not unicodedata.combining(c))
+
+
+def normalizar_contexto(contexto: str) -> str:
+    """
+    Normaliza o contexto do candidato para comparação: minúsculas, sem acentos
+    nem pontuação, espaços colapsados e tokens ordenados e sem repetição.
+    'Dev Python Júnior, Django' e 'django  dev júnior python' viram o mesmo texto.
+    """
+    texto = remover_acentos(contexto.lower())
+    tokens = re.findall(r"[a-z0-9+#]+", texto)
+    return " ".join(sorted(set(tokens)))
+
+
+def hash_contexto(contexto: str) -> str:
+    """Hash SHA-256 do contexto normalizado, usado como chave de cache."""
+    return hashlib.sha256(normalizar_contexto(contexto).encode("utf-8")).hexdigest()
+
+
+def dentro_da_janela_whatsapp(last_user_ts: int | None) -> bool:
+    """
+    Indica se ainda é possível enviar mensagens livres ao usuário, ou seja,
+    se a última mensagem dele foi há menos de 24h (janela de sessão do WhatsApp).
+    """
+    if not last_user_ts:
+        return False
+    return time.time() - last_user_ts < JANELA_WHATSAPP_SEGUNDOS
+
+
+def dados_entrega_feedback(user_state, canal: str, modo: str | None = None) -> dict:
+    """
+    Campos do log de entrega do feedback, com a latência percebida pelo
+    usuário medida desde o envio da última resposta da entrevista.
+    """
+    latencia_ms = None
+    if user_state.fim_entrevista_ts:
+        latencia_ms = int((time.time() - user_state.fim_entrevista_ts) * 1000)
+    return {
+        "action": "feedback_delivered",
+        "user_id": user_state.user_key,
+        "channel": canal,
+        "feedback_mode": modo or ("incremental" if settings.FEEDBACK_INCREMENTAL else "completo"),
+        "perceived_latency_ms": latencia_ms
+    }
+
+
+def registrar_entrega_feedback(user_state, canal: str, modo: str | None = None):
+    """Registra a entrega do feedback com a latência percebida pelo usuário."""
+    log.info("Feedback entregue ao usuário", extra=dados_entrega_feedback(user_state, canal, modo))
@@ -1,13 +1,20 @@
+import asyncio
 import logging
 import time
 from fastapi import APIRouter, Form, Response, Depends, Request
+from fastapi.concurrency import run_in_threadpool
 from twilio.twiml.messaging_response import MessagingResponse
-from app.models import UserState
-from app.state_machine import STATE_HANDLERS
-from app.services.redis_service import get_redis_client
-from app.services.twilio_service import get_twilio_client, download_twilio_media, enviar_mensagem_longa
-from app.services.gcp_service import transcrever_audio_gcp
-from app.tasks import tarefa_gerar_perguntas
+from app.state_machine import criar_mutador_mensagem, disparar_tarefas, emitir_eventos
+from app.config import settings
+from app.services.redis_service import (
+    get_async_redis_client, atualizar_estado_async, atualizar_campos_async, ConflitoDeVersaoError,
+    reservar_mensagem_async, registrar_resposta_mensagem_async, liberar_mensagem_async, aguardar_resposta_mensagem_async,
+)
+from app.services.twilio_service import get_twilio_client, download_twilio_media_async
+from app.services.gcp_service import transcrever_audio_gcp, get_stt_executor
+from app.services.ordem_service import tirar_senha_async, aguardar_vez_async, liberar_vez_async
+from app.services.cache_service import buscar_transcricao_por_midia_async, buscar_transcricao_por_conteudo_async, salvar_transcricao_em_cache_async
+from app.tasks import tarefa_transcrever_audio
 
 log = logging.getLogger(__name__)
 router = APIRouter()
@@ -19,34 +26,99 @@ async def handle_twilio_webhook(
     Body: str = Form(None),
     NumMedia: int = Form(0),
     MediaUrl0: str = Form(None),
-    r: object = Depends(get_redis_client),
+    MessageSid: str = Form(None),
+    r: object = Depends(get_async_redis_client),
     twilio_client: object = Depends(get_twilio_client)
 ):
     """
     Recebe, processa e orquestra as mensagens do WhatsApp.
     Este endpoint agora atua como um controlador, delegando a lógica
     de negócio para a máquina de estados.
-    """
-    user_key = From
-    response_twiml = MessagingResponse()
 
+    Todo I/O é não bloqueante: Redis via redis.asyncio, download de mídia via
+    httpx, Speech-to-Text em um pool de threads dedicado e as demais chamadas
+    síncronas (Twilio, Celery) no thread pool padrão, para que um áudio lento
+    não trave os demais usuários.
+
+    As entregas são idempotentes por MessageSid: retentativas da Twilio não
+    passam de novo pela máquina de estados e recebem o TwiML da original.
+    """
     log.info("Webhook recebido", extra={
-        "user_id": user_key, 
+        "action": "webhook_received",
+        "user_id": From, 
         "body": Body, 
         "num_media": NumMedia, 
         "media_url": MediaUrl0,
         "body_length": len(Body) if Body else 0
     })
 
+    if not MessageSid:
+        return await _processar_em_ordem(From, Body, NumMedia, MediaUrl0, r, twilio_client)
+
+    if not await reservar_mensagem_async(r, MessageSid):
+        twiml = await aguardar_resposta_mensagem_async(r, MessageSid)
+        log.info("Entrega duplicada ignorada", extra={
+            "action": "webhook_duplicate",
+            "user_id": From,
+            "message_sid": MessageSid,
+            "cached_response": twiml is not None
+        })
+        return Response(content=twiml or str(MessagingResponse()), media_type="application/xml")
+
+    try:
+        resposta = await _processar_em_ordem(From, Body, NumMedia, MediaUrl0, r, twilio_client)
+    except Exception:
+        await liberar_mensagem_async(r, MessageSid)
+        raise
+    await registrar_resposta_mensagem_async(r, MessageSid, resposta.body.decode("utf-8"))
+    return resposta
+
+
+async def _processar_em_ordem(From, Body, NumMedia, MediaUrl0, r, twilio_client) -> Response:
+    """
+    Emite a senha da mensagem na chegada, antes de download e transcrição, e a
+    libera ao final, para que as mensagens de um mesmo usuário sejam aplicadas
+    ao estado na ordem em que chegaram. Se a transcrição for delegada ao
+    worker, a senha vai junto e é ele quem a libera.
+    """
+    senha = await tirar_senha_async(r, From)
+    if NumMedia > 0 and MediaUrl0 and settings.TRANSCRICAO_ASSINCRONA:
+        try:
+            await run_in_threadpool(tarefa_transcrever_audio.delay, From, MediaUrl0, int(time.time()), senha)
+            log.info("Task tarefa_transcrever_audio disparada", extra={"user_id": From})
+            response_twiml = MessagingResponse()
+            response_twiml.message("Recebi seu áudio, um momento enquanto o transcrevo... 🎙️")
+            return Response(content=str(response_twiml), media_type="application/xml")
+        except Exception as e:
+            log.error("Falha ao disparar tarefa de transcrição; transcrevendo no webhook", extra={"user_id": From, "error": str(e)})
+
+    try:
+        return await _processar_mensagem(From, Body, NumMedia, MediaUrl0, r, twilio_client, senha)
+    finally:
+        await liberar_vez_async(r, From, senha)
+
+
+async def _processar_mensagem(From, Body, NumMedia, MediaUrl0, r, twilio_client, senha) -> Response:
+    """Processa uma entrega do webhook e monta o TwiML de resposta."""
+    user_key = From
+    response_twiml = MessagingResponse()
     resposta_usuario = Body.strip() if Body else ""
     
     if NumMedia > 0 and MediaUrl0:
         log.info("Processando mídia recebida", extra={"user_id": user_key, "media_url": MediaUrl0})
         response_twiml.message("Recebi seu áudio, um momento enquanto o transcrevo... 🎙️")
-        audio_content = download_twilio_media(MediaUrl0)
-        if audio_content:
-            log.info("Mídia baixada com sucesso", extra={"user_id": user_key, "content_size": len(audio_content)})
-            transcricao = transcrever_audio_gcp(audio_content)
+
+        # Retentativas do webhook reaproveitam a transcrição sem baixar o áudio de novo.
+        transcricao = await buscar_transcricao_por_midia_async(r, MediaUrl0, user_key)
+        audio_content = None if transcricao else await download_twilio_media_async(MediaUrl0)
+        if transcricao or audio_content:
+            if not transcricao:
+                log.info("Mídia baixada com sucesso", extra={"user_id": user_key, "content_size": len(audio_content)})
+                transcricao = await buscar_transcricao_por_conteudo_async(r, MediaUrl0, audio_content, user_key)
+            if not transcricao:
+                transcricao = await asyncio.get_running_loop().run_in_executor(get_stt_executor(), transcrever_audio_gcp, audio_content)
+                if transcricao and transcricao.strip():
+                    await salvar_transcricao_em_cache_async(r, MediaUrl0, audio_content, transcricao.strip())
             if transcricao and transcricao.strip():
                 resposta_usuario = transcricao.strip()
                 log.info("Áudio transcrito com sucesso", extra={"user_id": user_key, "transcription_length": len(resposta_usuario), "transcription": resposta_usuario})
@@ -61,73 +133,26 @@ async def handle_twilio_webhook(
 
     log.info("Resposta do usuário recebida", extra={"user_id": user_key, "response_type": "audio" if NumMedia > 0 else "text", "response_preview": resposta_usuario[:100]})
 
-    user_state_json = r.get(user_key)
-    if user_state_json:
-        user_state = UserState.model_validate_json(user_state_json)
-        log.info("Estado do usuário carregado", extra={"user_id": user_key, "current_state": user_state.etapa, "responses_count": len(user_state.respostas)})
-    else:
-        log.info("Novo usuário detectado", extra={
-            "action": "new_user_detected",
-            "user_id": user_key
-        })
-        user_state = UserState()
-
-    prev_etapa = user_state.etapa
-
-    user_state.user_key = user_key
-
-    user_state.last_user_ts = int(time.time())
-
-    if resposta_usuario.lower() in ['reiniciar', 'recomeçar', 'restart']:
-        user_state = UserState(user_key=user_key)
-        handler = STATE_HANDLERS.get(user_state.etapa)
-        response_text = handler(user_state, resposta_usuario)
-        log.info("Usuário reiniciou a conversa", extra={"user_id": user_key})
-    else:
-        handler = STATE_HANDLERS.get(user_state.etapa)
-        if handler:
-            log.info("Processando etapa do usuário", extra={"user_id": user_key, "etapa": user_state.etapa})
-            
-            if user_state.etapa == 'preparando_perguntas' and prev_etapa == 'aguardando_contexto':
-                log.info("Entrevista iniciada", extra={
-                    "action": "interview_started",
-                    "user_id": user_key
-                })
-            
-            if user_state.etapa == 'gerando_feedback':
-                 response_text = handler(user_state, resposta_usuario, twilio_client)
-            else:
-                 response_text = handler(user_state, resposta_usuario)
-        else:
-            log.warning("Estado desconhecido encontrado, resetando usuário", extra={"user_id": user_key, "etapa": user_state.etapa})
-            user_state = UserState(user_key=user_key)
-            response_text = "Me perdi aqui. Vamos recomeçar para garantir que tudo corra bem. Me conte sua vaga, experiência e tecnologias."
+    await aguardar_vez_async(r, user_key, senha)
+    try:
+        user_state, (prev_etapa, response_text, novo_usuario, eventos) = await atualizar_estado_async(
+            r, user_key, criar_mutador_mensagem(user_key, resposta_usuario, int(time.time()), twilio_client)
+        )
+    except ConflitoDeVersaoError as e:
+        log.error("Não foi possível salvar o estado do usuário", extra={"user_id": user_key, "error": str(e)})
+        response_twiml.message("Tive um probleminha aqui. Pode me enviar sua mensagem novamente?")
+        return Response(content=str(response_twiml), media_type="application/xml")
 
-    if user_state.etapa == 'finalizado':
-        log.info("Ciclo do usuário finalizado. Removendo estado do Redis.", extra={"user_id": user_key})
-        r.delete(user_key)
-    else:
-        r.set(user_key, user_state.model_dump_json())
+    emitir_eventos(eventos)
+    if not novo_usuario:
+        log.info("Estado do usuário carregado", extra={"user_id": user_key, "current_state": prev_etapa, "responses_count": len(user_state.respostas)})
 
-    if user_state.etapa == 'preparando_perguntas' and prev_etapa == 'aguardando_contexto':
-        try:
-            tarefa_gerar_perguntas.delay(user_state.user_key, user_state.contexto, user_state.last_user_ts)
-            log.info("Task tarefa_gerar_perguntas disparada", extra={"user_id": user_key})
-        except Exception as e:
-            log.error("Falha ao disparar tarefa de geração de perguntas", extra={"user_id": user_key, "error": str(e)})
-            user_state.erro_geracao = "Erro ao iniciar geração de perguntas. Tente novamente."
-            r.set(user_key, user_state.model_dump_json())
+    if user_state.etapa == 'finalizado':
+        log.info("Ciclo do usuário finalizado. Estado removido do Redis.", extra={"user_id": user_key})
 
-    if (getattr(user_state, "perguntas_prontas", False) and 
-        user_state.etapa == "aguardando_resposta_1" and 
-        twilio_client):
-        try:
-            texto = f"*Pergunta 1:*\n{user_state.perguntas[0]}"
-            enviar_mensagem_longa(twilio_client, user_key, texto)
-            user_state.perguntas_prontas = False
-            r.set(user_key, user_state.model_dump_json())
-        except Exception as e:
-            log.error("Erro ao enviar pergunta pronta via Twilio", extra={"user_id": user_key, "error": str(e)})
+    campos_erro = await run_in_threadpool(disparar_tarefas, prev_etapa, user_state)
+    if campos_erro:
+        await atualizar_campos_async(r, user_key, **campos_erro)
 
     if response_text:
         response_twiml.message(response_text)
@@ -0,0 +1,298 @@
+import json
+import os
+import shutil
+
+import numpy as np
+
+from analisar_logs import (
+    FILTRO_ACTION, VERSAO_CHECKPOINT, carregar_checkpoint, dividir_em_trechos, ler_trecho, posicao_salva, processar_trechos,
+)
+
+# Armazém colunar dos eventos com "action" dos logs, para consultas de funil e
+# coorte por período sem reler o JSONL.
+#
+# <pasta de logs>/colunar/
+#   acoes.json, usuarios.json   dicionários globais (código = posição na lista)
+#   ingestao.json               bytes já ingeridos de cada arquivo de log e
+#                               partições da última ingestão ainda por publicar
+#   .pendente/AAAA-MM-DD/       partições novas, gravadas antes do checkpoint
+#   AAAA-MM-DD/                 uma partição por dia do evento (asctime)
+#     ts.npy       int64, milissegundos desde a época (horário local do log), ordenado
+#     acao.npy     uint16, código da action
+#     usuario.npy  int32, código do user_id (-1 = evento sem usuário)
+#     indice_usuarios.npy, indice_inicio.npy, indice_ordem.npy
+#                  índice por usuário: códigos ordenados, onde começa cada um
+#                  e a permutação que agrupa os eventos de cada usuário
+#
+# As colunas são lidas com mmap e as consultas abrem só as partições do
+# período pedido. A ingestão é incremental, como a análise: só os bytes novos
+# de cada arquivo são lidos, e as partições dos dias afetados são regravadas.
+#
+# Para que uma queda no meio da ingestão não duplique eventos, as partições
+# novas vão primeiro para .pendente/; o checkpoint com os novos offsets é
+# gravado junto com a lista delas, e só então elas substituem as publicadas.
+# Ao abrir o armazém, uma lista no checkpoint é concluída (os offsets já
+# contam com ela) e um .pendente/ sem lista é descartado (os bytes serão
+# lidos de novo).
+
+PASTA_ARMAZEM = "colunar"
+PASTA_PENDENTE = ".pendente"
+FUNIL = ("new_user_detected", "interview_started", "interview_completed", "user_feedback_received", "pro_email_collected")
+MS_POR_DIA = 86_400_000
+
+
+def extrair_eventos(arquivo, inicio, fim):
+    """
+    Eventos com action de um trecho do log (roda nos processos do pool), com
+    actions e usuários codificados por dicionários locais ao trecho.
+    """
+    dados = ler_trecho(arquivo, inicio, fim)
+    instantes, acoes, usuarios = [], [], []
+    dicionario_acoes, dicionario_usuarios = {}, {}
+    for linha in dados.split('\n'):
+        if FILTRO_ACTION not in linha:
+            continue
+        try:
+            evento = json.loads(linha)
+        except ValueError:
+            continue
+        if not isinstance(evento, dict):
+            continue
+        action, asctime = evento.get('action'), evento.get('asctime')
+        if not action or not isinstance(asctime, str) or len(asctime) != 23:
+            continue
+        # "2026-01-31 12:00:00,123" -> "2026-01-31T12:00:00.123"
+        instantes.append(f"{asctime[:10]}T{asctime[11:19]}.{asctime[20:]}")
+        acoes.append(dicionario_acoes.setdefault(action, len(dicionario_acoes)))
+        usuarios.append(dicionario_usuarios.setdefault(str(evento.get('user_id') or ''), len(dicionario_usuarios)))
+    ts = np.array(instantes, dtype='datetime64[ms]').astype(np.int64)
+    return ts, np.array(acoes, dtype=np.int64), list(dicionario_acoes), np.array(usuarios, dtype=np.int64), list(dicionario_usuarios)
+
+
+def _salvar_json(caminho, dados):
+    temporario = f"{caminho}.tmp"
+    with open(temporario, 'w', encoding='utf-8') as f:
+        json.dump(dados, f, ensure_ascii=False)
+    os.replace(temporario, caminho)
+
+
+def _salvar_coluna(caminho, coluna):
+    temporario = f"{caminho}.tmp"
+    with open(temporario, 'wb') as f:
+        np.save(f, coluna)
+    os.replace(temporario, caminho)
+
+
+class ArmazemEventos:
+    """Leitura e ingestão do armazém colunar de uma pasta de logs."""
+
+    def __init__(self, pasta_logs):
+        self.pasta_logs = pasta_logs
+        self.pasta = os.path.join(pasta_logs, PASTA_ARMAZEM)
+        self._abrir()
+        self._recuperar_ingestao()
+
+    def _abrir(self):
+        os.makedirs(self.pasta, exist_ok=True)
+        self.acoes = self._carregar_json("acoes.json", [])
+        self.usuarios = self._carregar_json("usuarios.json", [])
+        self._codigos_acoes = {acao: i for i, acao in enumerate(self.acoes)}
+        self._codigos_usuarios = {usuario: i for i, usuario in enumerate(self.usuarios)}
+
+    def _carregar_json(self, nome, padrao):
+        try:
+            with open(os.path.join(self.pasta, nome), 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return padrao
+
+    # ------------------------------------------------------------------ ingestão
+
+    def _salvar_ingestao(self, arquivos, pendentes):
+        _salvar_json(os.path.join(self.pasta, "ingestao.json"),
+                     {"versao": VERSAO_CHECKPOINT, "arquivos": arquivos, "particoes_pendentes": pendentes})
+
+    def _publicar_pendentes(self, dias):
+        """Move as partições de .pendente/ para o lugar das publicadas (pode ser repetido após uma queda)."""
+        for dia in dias:
+            origem, destino = os.path.join(self.pasta, PASTA_PENDENTE, dia), os.path.join(self.pasta, dia)
+            if not os.path.isdir(origem):
+                continue
+            os.makedirs(destino, exist_ok=True)
+            for nome in os.listdir(origem):
+                os.replace(os.path.join(origem, nome), os.path.join(destino, nome))
+
+    def _recuperar_ingestao(self):
+        """Conclui a publicação interrompida de uma ingestão já registrada e descarta a que não chegou ao checkpoint."""
+        pendentes = self._carregar_json("ingestao.json", {}).get("particoes_pendentes")
+        if pendentes:
+            print(f"♻️  Concluindo a publicação de {len(pendentes)} partições de uma ingestão interrompida")
+            self._publicar_pendentes(pendentes)
+            self._salvar_ingestao(carregar_checkpoint(os.path.join(self.pasta, "ingestao.json")), [])
+        shutil.rmtree(os.path.join(self.pasta, PASTA_PENDENTE), ignore_errors=True)
+
+    def ingerir(self, arquivos_log, processos=1):
+        """Acrescenta ao armazém os eventos novos dos arquivos. Retorna quantos eventos foram ingeridos."""
+        caminho_estado = os.path.join(self.pasta, "ingestao.json")
+        estado = carregar_checkpoint(caminho_estado)
+        trechos, offsets = [], {}
+        for arquivo in arquivos_log:
+            chave = os.path.abspath(arquivo)
+            try:
+                info = os.stat(arquivo)
+            except FileNotFoundError:
+                continue
+            anterior = posicao_salva(estado, arquivo, info)
+            if anterior is False:
+                # Os eventos antigos do arquivo já estão nas partições e não dá para
+                # separá-los: o armazém é refeito do zero.
+                print(f"♻️  {os.path.basename(arquivo)} mudou desde a última ingestão; reconstruindo o armazém")
+                shutil.rmtree(self.pasta)
+                self._abrir()
+                return self.ingerir(arquivos_log, processos)
+            inicio = anterior["offset"] if anterior else 0
+            novos = dividir_em_trechos(arquivo, inicio)
+            trechos.extend(novos)
+            offsets[chave] = {"inode": info.st_ino, "offset": novos[-1][2] if novos else inicio}
+
+        partes = []
+        for ts, acoes, acoes_locais, usuarios, usuarios_locais in processar_trechos(trechos, processos, extrair_eventos):
+            if len(ts):
+                mapa_acoes = np.array([self._codificar(self.acoes, self._codigos_acoes, a) for a in acoes_locais])
+                mapa_usuarios = np.array([self._codificar(self.usuarios, self._codigos_usuarios, u) if u else -1
+                                          for u in usuarios_locais])
+                partes.append((ts, mapa_acoes[acoes], mapa_usuarios[usuarios]))
+
+        total, dias_gravados = 0, []
+        if partes:
+            ts, acoes, usuarios = (np.concatenate(coluna) for coluna in zip(*partes))
+            total = len(ts)
+            # Dicionários antes das partições: uma partição nunca aponta para um código inexistente.
+            _salvar_json(os.path.join(self.pasta, "acoes.json"), self.acoes)
+            _salvar_json(os.path.join(self.pasta, "usuarios.json"), self.usuarios)
+            dias = ts // MS_POR_DIA
+            for dia in np.unique(dias):
+                selecao = dias == dia
+                dias_gravados.append(str(np.datetime64(int(dia), 'D')))
+                self._gravar_particao(dias_gravados[-1], ts[selecao], acoes[selecao], usuarios[selecao])
+
+        estado = {k: v for k, v in estado.items() if os.path.exists(k)}
+        # O checkpoint é o ponto de confirmação: depois dele, as partições pendentes valem.
+        self._salvar_ingestao({**estado, **offsets}, dias_gravados)
+        if dias_gravados:
+            self._publicar_pendentes(dias_gravados)
+            self._salvar_ingestao({**estado, **offsets}, [])
+            shutil.rmtree(os.path.join(self.pasta, PASTA_PENDENTE), ignore_errors=True)
+        return total
+
+    @staticmethod
+    def _codificar(lista, codigos, valor):
+        if valor not in codigos:
+            codigos[valor] = len(lista)
+            lista.append(valor)
+        return codigos[valor]
+
+    def _gravar_particao(self, dia, ts, acoes, usuarios):
+        """Junta os eventos novos aos da partição publicada e grava o resultado em .pendente/."""
+        pasta = os.path.join(self.pasta, PASTA_PENDENTE, dia)
+        if os.path.isdir(os.path.join(self.pasta, dia)):
+            ts = np.concatenate([self._coluna(dia, "ts"), ts])
+            acoes = np.concatenate([self._coluna(dia, "acao"), acoes])
+            usuarios = np.concatenate([self._coluna(dia, "usuario"), usuarios])
+        os.makedirs(pasta, exist_ok=True)
+        ordem = np.argsort(ts, kind='stable')
+        ts, acoes, usuarios = ts[ordem], acoes[ordem].astype(np.uint16), usuarios[ordem].astype(np.int32)
+        ordem_usuario = np.argsort(usuarios, kind='stable')
+        indice_usuarios, indice_inicio = np.unique(usuarios[ordem_usuario], return_index=True)
+        for nome, coluna in (("ts", ts), ("acao", acoes), ("usuario", usuarios),
+                             ("indice_usuarios", indice_usuarios),
+                             ("indice_inicio", np.append(indice_inicio, len(usuarios))),
+                             ("indice_ordem", ordem_usuario)):
+            _salvar_coluna(os.path.join(pasta, f"{nome}.npy"), coluna)
+
+    # ------------------------------------------------------------------ consultas
+
+    def particoes(self, de=None, ate=None):
+        """Dias (AAAA-MM-DD) com eventos entre `de` e `ate`, inclusive."""
+        dias = sorted(d for d in os.listdir(self.pasta)
+                      if d != PASTA_PENDENTE and os.path.isdir(os.path.join(self.pasta, d)))
+        return [d for d in dias if (de is None or d >= de) and (ate is None or d <= ate)]
+
+    def _coluna(self, dia, nome):
+        return np.load(os.path.join(self.pasta, dia, f"{nome}.npy"), mmap_mode='r')
+
+    def usuarios_por_acao(self, acoes, de=None, ate=None, por_dia=False):
+        """
+        Códigos dos usuários distintos com cada action no período. Com
+        `por_dia`, retorna {dia: {action: usuários}} em vez de {action: usuários}.
+        """
+        codigos = {self._codigos_acoes[a]: a for a in acoes if a in self._codigos_acoes}
+        vazio = np.empty(0, dtype=np.int32)
+        resultado = {}
+        for dia in self.particoes(de, ate) if codigos else []:
+            coluna_acao, coluna_usuario = self._coluna(dia, "acao"), self._coluna(dia, "usuario")
+            selecao = np.isin(coluna_acao, list(codigos))
+            acoes_dia, usuarios_dia = coluna_acao[selecao], coluna_usuario[selecao]
+            resultado[dia] = {acao: usuarios_dia[acoes_dia == codigo] for codigo, acao in codigos.items()}
+        if por_dia:
+            return {dia: {acao: np.unique(u[u >= 0]) for acao, u in por_acao.items()} for dia, por_acao in resultado.items()}
+        juntos = {}
+        for acao in acoes:
+            partes = [por_acao[acao] for por_acao in resultado.values() if acao in por_acao]
+            usuarios = np.unique(np.concatenate(partes)) if partes else vazio
+            juntos[acao] = usuarios[usuarios >= 0]
+        return juntos
+
+    def ocorrencias_por_acao(self, acoes, de=None, ate=None):
+        """Quantos eventos de cada action há no período, com ou sem usuário."""
+        codigos = {self._codigos_acoes[a]: a for a in acoes if a in self._codigos_acoes}
+        resultado = dict.fromkeys(acoes, 0)
+        for dia in self.particoes(de, ate) if codigos else []:
+            contagens = np.bincount(self._coluna(dia, "acao"), minlength=max(codigos) + 1)
+            for codigo, acao in codigos.items():
+                resultado[acao] += int(contagens[codigo])
+        return resultado
+
+    def funil(self, de=None, ate=None, passos=FUNIL, coorte=None):
+        """
+        Funil do período: para cada passo, usuários distintos com a action e
+        quantos deles passaram também por todos os passos anteriores. Com
+        `coorte` (lista de actions), só conta usuários com alguma delas no período.
+        """
+        usuarios = self.usuarios_por_acao(list(passos) + list(coorte or []), de, ate)
+        na_coorte = np.unique(np.concatenate([usuarios[acao] for acao in coorte])) if coorte else None
+        resultado, seguiram = [], None
+        for passo in passos:
+            no_passo = usuarios[passo] if na_coorte is None else np.intersect1d(usuarios[passo], na_coorte, assume_unique=True)
+            seguiram = no_passo if seguiram is None else np.intersect1d(seguiram, no_passo, assume_unique=True)
+            resultado.append((passo, len(no_passo), len(seguiram)))
+        return resultado
+
+    def coortes(self, de=None, ate=None, entrada="interview_started", conversao="interview_completed"):
+        """
+        Coortes diárias: usuários cuja primeira `entrada` no período foi em cada
+        dia e quantos deles tiveram `conversao` até `ate`.
+        """
+        convertidos = self.usuarios_por_acao([conversao], de, ate)[conversao]
+        vistos = np.empty(0, dtype=np.int32)
+        resultado = []
+        for dia, por_acao in self.usuarios_por_acao([entrada], de, ate, por_dia=True).items():
+            novos = np.setdiff1d(por_acao[entrada], vistos, assume_unique=True)
+            vistos = np.union1d(vistos, novos)
+            resultado.append((dia, len(novos), len(np.intersect1d(novos, convertidos, assume_unique=True))))
+        return resultado
+
+    def eventos_do_usuario(self, user_id, de=None, ate=None):
+        """Linha do tempo (instante, action) de um usuário, pelo índice de cada partição."""
+        codigo = self._codigos_usuarios.get(user_id)
+        eventos = []
+        for dia in self.particoes(de, ate) if codigo is not None else []:
+            indice = self._coluna(dia, "indice_usuarios")
+            posicao = np.searchsorted(indice, codigo)
+            if posicao == len(indice) or indice[posicao] != codigo:
+                continue
+            inicio = self._coluna(dia, "indice_inicio")
+            linhas = np.sort(self._coluna(dia, "indice_ordem")[inicio[posicao]:inicio[posicao + 1]])
+            ts, acoes = self._coluna(dia, "ts")[linhas], self._coluna(dia, "acao")[linhas]
+            eventos.extend((np.datetime64(int(t), 'ms'), self.acoes[a]) for t, a in zip(ts, acoes))
+        return eventos
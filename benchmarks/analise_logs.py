@@ -0,0 +1,175 @@
+"""
+Benchmark do motor incremental de `analisar_logs.py`.
+
+Gera em `--pasta` um corpus sintético de `--gb` GB de logs JSONL, em
+`--dias` arquivos diários `bot_metrics_AAAA-MM-DD.jsonl`, no formato do
+JsonFormatter do bot (eventos com "action" misturados a linhas de bibliotecas
+sem "action"), e compara:
+
+1. o laço antigo (um processo, `json.loads` em todas as linhas);
+2. execução fria do motor (sem checkpoint);
+3. execução quente (checkpoint em dia, nenhum dado novo);
+4. execução incremental (mais `--novos-mb` MB no arquivo do dia e um arquivo novo).
+
+Confere que as métricas do motor batem com as do laço antigo. O ganho do pool
+de processos depende das CPUs disponíveis (`--processos`, padrão: todas).
+
+Uso:
+    python benchmarks/analise_logs.py [--gb 2] [--dias 60] [--novos-mb 20] [--pasta /tmp/bench_logs]
+"""
+import argparse
+import contextlib
+import io
+import json
+import os
+import random
+import shutil
+import sys
+import time
+from collections import Counter
+from datetime import date, datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import analisar_logs
+from analisar_logs import analisar_logs as analisar
+
+EVENTOS = [
+    ("webhook_received", 30), ("new_user_detected", 3), ("interview_started", 3),
+    ("interview_completed", 2), ("feedback_generation_success", 2), ("user_feedback_received", 1),
+    ("user_cycle_completed", 1), ("pro_version_offer", 2), ("pro_email_collected", 1),
+    ("pro_version_declined", 1), ("question_cache_hit", 2), ("question_cache_miss", 1),
+    ("transcription_cache_hit", 2), ("transcription_cache_miss", 4), ("feedback_delivered", 2),
+    ("feedback_stream_first_chunk", 1), ("feedback_stream_complete", 1), ("content_pushed", 8),
+    ("ordering_waited", 2),
+]
+
+SEM_ACTION = [
+    ("httpx", "HTTP Request: POST https://api.twilio.com/2010-04-01/Accounts/AC/Messages.json \"HTTP/1.1 201 Created\""),
+    ("celery.app.trace", "Task app.tasks.tarefa_gerar_perguntas succeeded in 2.1s: None"),
+    ("app.main", "Aplicação iniciando..."),
+    ("uvicorn.access", "127.0.0.1:51000 - \"POST /webhook/twilio HTTP/1.1\" 200"),
+]
+
+
+def gerar_linhas(rng, quantidade):
+    """Pool de linhas já serializadas, sorteadas na hora de escrever o corpus."""
+    acoes = [a for a, peso in EVENTOS for _ in range(peso)]
+    linhas = []
+    for i in range(quantidade):
+        agora = datetime(2026, 1, 1) + timedelta(seconds=i)
+        registro = {"asctime": agora.strftime("%Y-%m-%d %H:%M:%S,%f")[:23], "levelname": "INFO"}
+        if rng.random() < 0.3:
+            registro["name"], registro["message"] = rng.choice(SEM_ACTION)
+        else:
+            action = rng.choice(acoes)
+            registro.update({"name": "app.state_machine", "message": f"Evento {action}", "action": action,
+                             "user_id": f"whatsapp:+5511{rng.randrange(200000):09d}"})
+            if action == "user_feedback_received":
+                registro["depoimento"] = "Gostei muito das perguntas, bem parecidas com as reais."
+            elif action == "pro_email_collected":
+                registro["email"] = f"usuario{i}@exemplo.com"
+            elif action == "feedback_delivered":
+                registro.update({"feedback_mode": rng.choice(["completo", "streaming"]),
+                                 "perceived_latency_ms": rng.randint(2000, 30000)})
+            elif action == "feedback_stream_first_chunk":
+                registro["time_to_first_chunk_ms"] = rng.randint(800, 4000)
+            elif action == "feedback_stream_complete":
+                registro["time_to_complete_ms"] = rng.randint(5000, 30000)
+            elif action == "transcription_cache_hit":
+                registro["audio_seconds_saved"] = rng.randint(5, 120)
+        linhas.append((json.dumps(registro) + "\n").encode())
+    return linhas
+
+
+def escrever(caminho, linhas, rng, tamanho):
+    escritos = 0
+    with open(caminho, "ab") as f:
+        while escritos < tamanho:
+            bloco = b"".join(rng.choices(linhas, k=20000))
+            f.write(bloco)
+            escritos += len(bloco)
+    return escritos
+
+
+def analisar_antigo(pasta):
+    """Cópia do laço original: um processo, json.loads em todas as linhas de todos os arquivos."""
+    metricas = Counter()
+    usuarios = set()
+    for nome in sorted(os.listdir(pasta)):
+        if not nome.endswith(".jsonl"):
+            continue
+        with open(os.path.join(pasta, nome), "r", encoding="utf-8") as f:
+            for linha in f:
+                try:
+                    evento = json.loads(linha.strip())
+                    action = evento.get("action", "")
+                    if action:
+                        metricas[action] += 1
+                    if action == "interview_started" and evento.get("user_id", ""):
+                        usuarios.add(evento["user_id"])
+                except json.JSONDecodeError:
+                    continue
+    return metricas, usuarios
+
+
+def cronometrar(funcao, *args, **kwargs):
+    inicio = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        resultado = funcao(*args, **kwargs)
+    return time.perf_counter() - inicio, resultado
+
+
+def executar(args):
+    rng = random.Random(3)
+    linhas = gerar_linhas(rng, 50000)
+    shutil.rmtree(args.pasta, ignore_errors=True)
+    os.makedirs(args.pasta)
+
+    print("📊 ANÁLISE DE LOGS")
+    print("=" * 50)
+    inicio = time.perf_counter()
+    primeiro_dia = date(2026, 1, 1)
+    total = sum(
+        escrever(os.path.join(args.pasta, f"bot_metrics_{primeiro_dia + timedelta(days=d)}.jsonl"),
+                 linhas, rng, args.gb * 1e9 / args.dias)
+        for d in range(args.dias)
+    )
+    print(f"📝 Corpus: {total / 1e9:.2f} GB em {args.dias} arquivos (gerado em {time.perf_counter() - inicio:.0f}s)")
+    print(f"🖥️  CPUs: {os.cpu_count()} | processos do pool: {args.processos or os.cpu_count()}")
+
+    duracao, (metricas_antigas, usuarios_antigos) = cronometrar(analisar_antigo, args.pasta)
+    print(f"\n🐢 Laço antigo (1 processo, json.loads em tudo): {duracao:.1f}s ({total / 1e6 / duracao:.0f} MB/s)")
+
+    duracao, agregado = cronometrar(analisar, args.pasta, processos=args.processos)
+    print(f"🧊 Motor, execução fria: {duracao:.1f}s ({total / 1e6 / duracao:.0f} MB/s)")
+    iguais = agregado.metricas == metricas_antigas and agregado.usuarios_unicos_entrevista == usuarios_antigos
+    print(f"   {'✅ Métricas iguais às do laço antigo' if iguais else '❌ Métricas diferentes do laço antigo'}")
+
+    duracao, _ = cronometrar(analisar, args.pasta, processos=args.processos)
+    print(f"🔥 Motor, execução quente (sem dados novos): {duracao * 1000:.0f} ms")
+
+    ultimo_dia = primeiro_dia + timedelta(days=args.dias - 1)
+    novos = escrever(os.path.join(args.pasta, f"bot_metrics_{ultimo_dia}.jsonl"), linhas, rng, args.novos_mb * 1e6 / 2)
+    novos += escrever(os.path.join(args.pasta, f"bot_metrics_{ultimo_dia + timedelta(days=1)}.jsonl"),
+                      linhas, rng, args.novos_mb * 1e6 / 2)
+    duracao, agregado = cronometrar(analisar, args.pasta, processos=args.processos)
+    _, (metricas_antigas, _) = cronometrar(analisar_antigo, args.pasta)
+    print(f"➕ Motor, execução incremental ({novos / 1e6:.0f} MB novos em 2 arquivos): {duracao:.2f}s")
+    print(f"   {'✅ Métricas iguais às do laço antigo' if agregado.metricas == metricas_antigas else '❌ Métricas diferentes do laço antigo'}")
+
+    tamanho_checkpoint = os.path.getsize(os.path.join(args.pasta, analisar_logs.NOME_CHECKPOINT))
+    print(f"💾 Checkpoint: {tamanho_checkpoint / 1e6:.1f} MB")
+    if not args.manter:
+        shutil.rmtree(args.pasta, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Laço antigo x motor incremental de análise de logs.")
+    parser.add_argument("--gb", type=float, default=2.0)
+    parser.add_argument("--dias", type=int, default=60)
+    parser.add_argument("--novos-mb", type=float, default=20.0)
+    parser.add_argument("--processos", type=int, default=None)
+    parser.add_argument("--pasta", default="/tmp/bench_logs")
+    parser.add_argument("--manter", action="store_true", help="Não apaga o corpus no final")
+    executar(parser.parse_args())
@@ -0,0 +1,241 @@
+"""
+Benchmark do armazém colunar de eventos (`armazem_eventos.py`).
+
+Gera em `--pasta` `--dias` arquivos diários de log com `--usuarios-por-dia`
+usuários novos por dia percorrendo o funil (novo usuário → entrevista →
+conclusão → depoimento → email PRO, parte deles mandando áudio), completados
+com eventos de entrega e linhas sem "action" até somar `--gb` GB. Compara:
+
+1. o scan do JSONL (como o analisador fazia): funil de uma semana e coortes;
+2. a ingestão fria no armazém e o tamanho resultante;
+3. as mesmas consultas no armazém (uma semana, o período todo, só usuários
+   de áudio) e a linha do tempo de um usuário pelo índice.
+
+Confere que o funil e as coortes do armazém batem com os do scan, e que uma
+queda no meio da ingestão (antes ou depois do checkpoint) não duplica nem
+perde eventos na ingestão seguinte.
+
+Uso:
+    python benchmarks/armazem_eventos.py [--gb 1] [--dias 60] [--usuarios-por-dia 2000] [--pasta /tmp/bench_armazem]
+"""
+import argparse
+import contextlib
+import io
+import json
+import os
+import random
+import shutil
+import sys
+import time
+from collections import defaultdict
+from datetime import date, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from analisar_logs import consultar_periodo
+from armazem_eventos import FUNIL, PASTA_ARMAZEM, ArmazemEventos
+
+AUDIO = ["transcription_cache_hit", "transcription_cache_miss"]
+ENTREGA = ["webhook_received", "content_pushed", "question_cache_hit", "ordering_waited"]
+SEM_ACTION = [
+    ("httpx", "HTTP Request: POST https://api.twilio.com/2010-04-01/Accounts/AC/Messages.json \"HTTP/1.1 201 Created\""),
+    ("uvicorn.access", "127.0.0.1:51000 - \"POST /webhook/twilio HTTP/1.1\" 200"),
+]
+
+
+def linha(dia, segundo, **campos):
+    hora = f"{segundo // 3600:02d}:{segundo // 60 % 60:02d}:{segundo % 60:02d},{random.randrange(1000):03d}"
+    registro = {"asctime": f"{dia} {hora}", "name": "app.state_machine", "levelname": "INFO", **campos}
+    return json.dumps(registro) + "\n"
+
+
+def jornadas(dia, usuarios, rng):
+    """Eventos do funil dos usuários novos do dia, em ordem de tempo por usuário."""
+    linhas = []
+    for user_id in usuarios:
+        instante = rng.randrange(80000)
+        passos = [FUNIL[0]]
+        for passo, chance in zip(FUNIL[1:], (0.7, 0.6, 0.5, 0.3)):
+            if rng.random() > chance:
+                break
+            passos.append(passo)
+        audio = rng.random() < 0.4
+        for passo in passos:
+            instante += rng.randrange(1, 60)
+            if audio and passo == "interview_completed":
+                linhas.append(linha(dia, instante, message="audio", action=rng.choice(AUDIO), user_id=user_id))
+            linhas.append(linha(dia, instante, message=passo, action=passo, user_id=user_id))
+    return linhas
+
+
+def gerar_corpus(args, rng):
+    primeiro_dia = date(2026, 1, 1)
+    total = 0
+    for d in range(args.dias):
+        dia = primeiro_dia + timedelta(days=d)
+        usuarios = [f"whatsapp:+5511{d:03d}{i:06d}" for i in range(args.usuarios_por_dia)]
+        enchimento = [linha(dia, rng.randrange(86400), message="entrega", action=rng.choice(ENTREGA),
+                            user_id=rng.choice(usuarios)) for _ in range(3000)]
+        enchimento += [linha(dia, rng.randrange(86400), message=m).replace("app.state_machine", nome)
+                       for nome, m in SEM_ACTION for _ in range(600)]
+        enchimento = [l.encode() for l in enchimento]
+        with open(os.path.join(args.pasta, f"bot_metrics_{dia}.jsonl"), "wb") as f:
+            conteudo = "".join(jornadas(dia, usuarios, rng)).encode()
+            f.write(conteudo)
+            escritos = len(conteudo)
+            while escritos < args.gb * 1e9 / args.dias:
+                bloco = b"".join(rng.choices(enchimento, k=20000))
+                f.write(bloco)
+                escritos += len(bloco)
+        total += escritos
+    return total, primeiro_dia
+
+
+def scan_jsonl(pasta, de, ate, coorte=None):
+    """Funil e coortes relendo todo o JSONL, uma linha de cada vez."""
+    usuarios = defaultdict(set)
+    entrada_por_dia = defaultdict(set)
+    for nome in sorted(os.listdir(pasta)):
+        if not nome.endswith(".jsonl"):
+            continue
+        with open(os.path.join(pasta, nome), "r", encoding="utf-8") as f:
+            for texto in f:
+                try:
+                    evento = json.loads(texto)
+                except json.JSONDecodeError:
+                    continue
+                dia, action, user_id = evento.get("asctime", "")[:10], evento.get("action"), evento.get("user_id")
+                if action and user_id and de <= dia <= ate:
+                    usuarios[action].add(user_id)
+                    if action == "interview_started":
+                        entrada_por_dia[dia].add(user_id)
+    na_coorte = set().union(*(usuarios[a] for a in coorte)) if coorte else None
+    funil, seguiram = [], None
+    for passo in FUNIL:
+        no_passo = usuarios[passo] if na_coorte is None else usuarios[passo] & na_coorte
+        seguiram = no_passo if seguiram is None else seguiram & no_passo
+        funil.append((passo, len(no_passo), len(seguiram)))
+    coortes, vistos = [], set()
+    for dia in sorted(entrada_por_dia):
+        novos = entrada_por_dia[dia] - vistos
+        vistos |= novos
+        coortes.append((dia, len(novos), len(novos & usuarios["interview_completed"])))
+    return funil, coortes
+
+
+def cronometrar(funcao, *args, **kwargs):
+    inicio = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        resultado = funcao(*args, **kwargs)
+    return time.perf_counter() - inicio, resultado
+
+
+def tamanho_pasta(pasta):
+    return sum(os.path.getsize(os.path.join(raiz, n)) for raiz, _, nomes in os.walk(pasta) for n in nomes)
+
+
+class QuedaSimulada(Exception):
+    pass
+
+
+def conferir_queda_na_ingestao(pasta):
+    """
+    Ingere um lote, acrescenta outro ao log e derruba a ingestão dele antes e
+    depois de gravar o checkpoint. Após reabrir e ingerir de novo, cada
+    action deve aparecer exatamente uma vez por linha do log.
+    """
+    rng = random.Random(3)
+    arquivo = os.path.join(pasta, "bot_metrics_2026-01-01.jsonl")
+    resultados = {}
+    for momento, metodo in (("antes do checkpoint", "_salvar_ingestao"), ("depois do checkpoint", "_publicar_pendentes")):
+        shutil.rmtree(pasta, ignore_errors=True)
+        os.makedirs(pasta)
+        with open(arquivo, "w", encoding="utf-8") as f:
+            f.writelines(jornadas(date(2026, 1, 1), [f"u{i}" for i in range(500)], rng))
+        with contextlib.redirect_stdout(io.StringIO()):
+            ArmazemEventos(pasta).ingerir([arquivo])
+        with open(arquivo, "a", encoding="utf-8") as f:
+            f.writelines(jornadas(date(2026, 1, 2), [f"v{i}" for i in range(500)], rng))
+
+        armazem, original = ArmazemEventos(pasta), getattr(ArmazemEventos, metodo)
+
+        def derrubar(*args, **kwargs):
+            raise QuedaSimulada()
+        setattr(ArmazemEventos, metodo, derrubar)
+        try:
+            armazem.ingerir([arquivo])
+        except QuedaSimulada:
+            pass
+        finally:
+            setattr(ArmazemEventos, metodo, original)
+        with contextlib.redirect_stdout(io.StringIO()):
+            armazem = ArmazemEventos(pasta)
+            armazem.ingerir([arquivo])
+
+        esperado = defaultdict(int)
+        with open(arquivo, "r", encoding="utf-8") as f:
+            for texto in f:
+                esperado[json.loads(texto)["action"]] += 1
+        resultados[momento] = armazem.ocorrencias_por_acao(list(esperado)) == dict(esperado)
+    shutil.rmtree(pasta, ignore_errors=True)
+    return resultados
+
+
+def executar(args):
+    rng = random.Random(5)
+    random.seed(5)
+    shutil.rmtree(args.pasta, ignore_errors=True)
+    os.makedirs(args.pasta)
+
+    print("📊 ARMAZÉM COLUNAR DE EVENTOS")
+    print("=" * 50)
+    total, primeiro_dia = gerar_corpus(args, rng)
+    print(f"📝 Corpus: {total / 1e9:.2f} GB em {args.dias} arquivos, {args.usuarios_por_dia} usuários novos por dia")
+
+    semana = (str(primeiro_dia + timedelta(days=args.dias - 7)), str(primeiro_dia + timedelta(days=args.dias - 1)))
+    tudo = (str(primeiro_dia), semana[1])
+
+    duracao, esperado = cronometrar(scan_jsonl, args.pasta, *semana)
+    print(f"\n🐢 Scan do JSONL, funil + coortes da última semana: {duracao:.1f}s")
+
+    duracao, armazem = cronometrar(consultar_periodo, args.pasta, *semana, processos=args.processos)
+    tamanho = tamanho_pasta(os.path.join(args.pasta, PASTA_ARMAZEM))
+    print(f"🗄️  Ingestão fria + primeira consulta: {duracao:.1f}s | armazém com {tamanho / 1e6:.1f} MB "
+          f"({total / tamanho:.0f}x menor que o JSONL)")
+
+    iguais = (armazem.funil(*semana), armazem.coortes(*semana)) == esperado
+    print(f"   {'✅ Funil e coortes iguais aos do scan' if iguais else '❌ Resultado diferente do scan'}")
+    _, esperado_audio = cronometrar(scan_jsonl, args.pasta, *tudo, coorte=AUDIO)
+    iguais_audio = armazem.funil(*tudo, coorte=AUDIO) == esperado_audio[0]
+    print(f"   {'✅ Funil dos usuários de áudio igual ao do scan' if iguais_audio else '❌ Funil de áudio diferente do scan'}")
+
+    for nome, consulta in (
+        ("Funil da última semana", lambda: armazem.funil(*semana)),
+        (f"Funil dos {args.dias} dias", lambda: armazem.funil(*tudo)),
+        ("Funil dos usuários de áudio, período todo", lambda: armazem.funil(*tudo, coorte=AUDIO)),
+        ("Coortes diárias da última semana", lambda: armazem.coortes(*semana)),
+        ("Linha do tempo de um usuário, período todo",
+         lambda: armazem.eventos_do_usuario(f"whatsapp:+5511{args.dias // 2:03d}000007", *tudo)),
+    ):
+        duracao, resultado = cronometrar(consulta)
+        print(f"⚡ {nome}: {duracao * 1000:.1f} ms ({len(resultado)} linhas)")
+
+    duracao, _ = cronometrar(consultar_periodo, args.pasta, *semana, processos=args.processos)
+    print(f"🔥 Consulta pelo analisador sem dados novos (checa offsets + funil + coortes): {duracao * 1000:.0f} ms")
+    if not args.manter:
+        shutil.rmtree(args.pasta, ignore_errors=True)
+
+    print()
+    for momento, ok in conferir_queda_na_ingestao(f"{args.pasta}_queda").items():
+        print(f"{'✅' if ok else '❌'} Queda na ingestão {momento}: {'nenhum evento duplicado ou perdido' if ok else 'contagens diferentes do log'}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Scan do JSONL x armazém colunar para funil e coortes.")
+    parser.add_argument("--gb", type=float, default=1.0)
+    parser.add_argument("--dias", type=int, default=60)
+    parser.add_argument("--usuarios-por-dia", type=int, default=2000)
+    parser.add_argument("--processos", type=int, default=None)
+    parser.add_argument("--pasta", default="/tmp/bench_armazem")
+    parser.add_argument("--manter", action="store_true", help="Não apaga o corpus no final")
+    executar(parser.parse_args())
@@ -0,0 +1,184 @@
+"""
+Benchmark do índice semântico de contextos (cache de perguntas por paráfrase).
+
+Gera um corpus sintético de contextos (cargo x nível x stack, com frases
+variadas), indexa todos e faz dois tipos de consulta:
+
+- paráfrases de contextos indexados, com outra frase, erros de digitação e
+  palavras extras: contam como acerto quando o vizinho acima do limiar tem o
+  mesmo cargo, nível e stack, e como falso positivo quando não tem;
+- contextos inéditos (combinação cargo x nível x stack fora do índice): todo
+  vizinho acima do limiar é um falso positivo.
+
+Reporta latência de busca, memória do índice e as taxas acima.
+
+Depois registra `--registros` contextos pelo caminho real (cache de perguntas
+com LRU de `--limite-cache` chaves + cache semântico, no fakeredis) e confere
+que o log no Redis e o índice em memória ficam limitados e que o índice não
+guarda contextos já descartados pelo LRU do cache de perguntas.
+
+Uso:
+    python benchmarks/cache_semantico.py [--contextos 100000] [--consultas 2000] [--limiar 0.8] [--registros 3000] [--limite-cache 500]
+"""
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("ID_PROJETO", "benchmark")
+os.environ.setdefault("TWILIO_ACCOUNT_SID", "ACbenchmark")
+os.environ.setdefault("TWILIO_AUTH_TOKEN", "benchmark")
+os.environ.setdefault("TWILIO_WHATSAPP_NUMBER", "whatsapp:+10000000000")
+
+import numpy as np
+
+from app.config import settings
+from app.services import semantic_cache_service
+from app.services.cache_service import INDICE_LRU_PERGUNTAS, chave_perguntas, salvar_perguntas_em_cache
+from app.services.semantic_cache_service import (
+    CONTEXTOS_SEMANTICOS, ENTRADAS_SEMANTICAS, IndiceSemantico, buscar_perguntas_semelhantes,
+    get_indice_semantico, registrar_contexto_semantico, vetorizar_contexto,
+)
+
+CARGOS = ["backend", "frontend", "fullstack", "dados", "mobile", "devops", "qa", "machine learning",
+          "segurança", "produto", "suporte", "infraestrutura", "embarcados", "games", "sre", "bi"]
+NIVEIS = {"júnior": ["júnior", "junior", "jr"], "pleno": ["pleno", "nível pleno", "pl"],
+          "sênior": ["sênior", "senior", "sr"], "estágio": ["estágio", "estagiário", "estagio"]}
+TECNOLOGIAS = ["python", "java", "javascript", "typescript", "go", "rust", "c#", "php", "ruby", "kotlin",
+               "swift", "sql", "django", "spring", "react", "angular", "vue", "node", "aws", "docker",
+               "kubernetes", "terraform", "pandas", "spark", "airflow", "flutter", "postgres", "mongodb"]
+EXTRAS = ["remoto", "startup", "fintech", "banco", "ecommerce", "inglês", "híbrido", "multinacional"]
+MODELOS = [
+    "vaga {cargo} {nivel}, {techs}",
+    "desenvolvedor {cargo} {nivel} com {techs}",
+    "sou {nivel} e quero vaga de {cargo}. trabalho com {techs}",
+    "entrevista para {cargo} nível {nivel} usando {techs}",
+    "{techs} - dev {cargo} {nivel}",
+    "procurando emprego {cargo} {nivel}; sei {techs}",
+]
+
+
+def sortear_rotulo(rng):
+    cargo = rng.choice(CARGOS)
+    nivel = rng.choice(list(NIVEIS))
+    techs = tuple(sorted(rng.sample(TECNOLOGIAS, rng.randint(2, 3))))
+    return cargo, nivel, techs
+
+
+def gerar_contexto(rng, rotulo):
+    cargo, nivel, techs = rotulo
+    techs_frase = list(techs)
+    rng.shuffle(techs_frase)
+    return rng.choice(MODELOS).format(cargo=cargo, nivel=rng.choice(NIVEIS[nivel]), techs=", ".join(techs_frase))
+
+
+def parafrasear(rng, rotulo):
+    """Outra frase para o mesmo rótulo, com um erro de digitação e uma palavra extra."""
+    palavras = gerar_contexto(rng, rotulo).split()
+    longas = [i for i, p in enumerate(palavras) if len(p) > 6]
+    if longas:
+        i = rng.choice(longas)
+        j = rng.randrange(1, len(palavras[i]) - 1)
+        palavras[i] = palavras[i][:j] + palavras[i][j + 1:]
+    palavras.insert(rng.randrange(len(palavras) + 1), rng.choice(EXTRAS))
+    return " ".join(palavras)
+
+
+def percentil(valores, p):
+    return float(np.percentile(np.asarray(valores), p))
+
+
+def executar(args):
+    rng = random.Random(7)
+    indice = IndiceSemantico(settings.CACHE_SEMANTICO_DIMENSAO, settings.CACHE_SEMANTICO_TABELAS, settings.CACHE_SEMANTICO_BITS)
+    rotulos = []
+
+    inicio = time.perf_counter()
+    for i in range(args.contextos):
+        rotulo = sortear_rotulo(rng)
+        indice.adicionar(str(i), vetorizar_contexto(gerar_contexto(rng, rotulo)))
+        rotulos.append(rotulo)
+    duracao_indexacao = time.perf_counter() - inicio
+    indexados = set(rotulos)
+
+    def consultar(texto):
+        inicio = time.perf_counter()
+        resultado = indice.buscar(vetorizar_contexto(texto))
+        latencias.append(time.perf_counter() - inicio)
+        return resultado if resultado and resultado[1] >= args.limiar else None
+
+    latencias = []
+    acertos = falsos = 0
+    for _ in range(args.consultas):
+        rotulo = rotulos[rng.randrange(len(rotulos))]
+        resultado = consultar(parafrasear(rng, rotulo))
+        if resultado:
+            if rotulos[int(resultado[0])] == rotulo:
+                acertos += 1
+            else:
+                falsos += 1
+
+    falsos_ineditos = 0
+    for _ in range(args.consultas):
+        rotulo = sortear_rotulo(rng)
+        while rotulo in indexados:
+            rotulo = sortear_rotulo(rng)
+        if consultar(parafrasear(rng, rotulo)):
+            falsos_ineditos += 1
+
+    print("📊 ÍNDICE SEMÂNTICO DE CONTEXTOS")
+    print("=" * 50)
+    print(f"📚 Contextos indexados: {args.contextos} em {duracao_indexacao:.1f}s")
+    print(f"💾 Memória do índice: {indice.nbytes() / 1024 / 1024:.1f} MB")
+    print(f"⏱️  Busca p50: {percentil(latencias, 50) * 1000:.2f} ms | p99: {percentil(latencias, 99) * 1000:.2f} ms")
+    print(f"🎯 Paráfrases servidas corretamente (limiar {args.limiar}): {acertos / args.consultas * 100:.1f}%")
+    print(f"⚠️  Paráfrases com vizinho errado: {falsos / args.consultas * 100:.1f}%")
+    print(f"⚠️  Contextos inéditos com hit indevido: {falsos_ineditos / args.consultas * 100:.1f}%")
+
+    conferir_limites(args, rng)
+
+
+def conferir_limites(args, rng):
+    """Registra contextos com o LRU do cache de perguntas ativo e mede o tamanho das estruturas."""
+    import fakeredis
+
+    settings.CACHE_SEMANTICO_ATIVO = True
+    settings.CACHE_PERGUNTAS_MAX_CHAVES = args.limite_cache
+    get_indice_semantico.cache_clear()
+    semantic_cache_service._script_registro.cache_clear()
+    r = fakeredis.FakeRedis(decode_responses=True)
+    log_maximo = indice_maximo = 0
+
+    for i in range(args.registros):
+        contexto = f"{gerar_contexto(rng, sortear_rotulo(rng))} {i}"
+        removidos = salvar_perguntas_em_cache(r, contexto, ["P1", "P2", "P3"])
+        registrar_contexto_semantico(r, contexto, removidos)
+        if i % 10 == 0:
+            buscar_perguntas_semelhantes(r, gerar_contexto(rng, sortear_rotulo(rng)))
+            log_maximo = max(log_maximo, r.llen(ENTRADAS_SEMANTICAS))
+            indice_maximo = max(indice_maximo, len(get_indice_semantico()))
+
+    buscar_perguntas_semelhantes(r, gerar_contexto(rng, sortear_rotulo(rng)))
+    indice = get_indice_semantico()
+    descartados = sum(1 for chave in indice.posicoes if not r.exists(chave_perguntas(chave)))
+
+    print()
+    print(f"🧹 {args.registros} registros com LRU de {args.limite_cache} chaves no cache de perguntas")
+    print(f"   📜 Log no Redis: máximo {log_maximo} entradas (limite {2 * args.limite_cache})")
+    print(f"   🗂️  Contextos vivos: {r.hlen(CONTEXTOS_SEMANTICOS)} | cache de perguntas: {r.zcard(INDICE_LRU_PERGUNTAS)}")
+    print(f"   🧠 Índice em memória: máximo {indice_maximo} posições, {len(indice.posicoes)} contextos buscáveis")
+    print(f"   {'✅' if not descartados else '❌'} Contextos no índice sem perguntas no cache: {descartados}")
+    if descartados or log_maximo > 2 * args.limite_cache + 1:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark do cache semântico de contextos.")
+    parser.add_argument("--contextos", type=int, default=100_000)
+    parser.add_argument("--consultas", type=int, default=2000)
+    parser.add_argument("--limiar", type=float, default=settings.CACHE_SEMANTICO_LIMIAR)
+    parser.add_argument("--registros", type=int, default=3000)
+    parser.add_argument("--limite-cache", type=int, default=500)
+    executar(parser.parse_args())
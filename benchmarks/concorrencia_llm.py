@@ -0,0 +1,107 @@
+"""
+Vazão das chamadas ao modelo generativo por modo de pool do worker Celery.
+
+Com um modelo stub de latência realista (lognormal em torno de
+`--latencia-ms`), simula entrevistas (uma chamada para as perguntas e outra
+para o feedback) durante `--duracao` segundos, sempre por `gerar_texto`
+(prazo, hedging e disjuntor), em dois modos:
+
+- prefork: `--processos` workers, cada um processando uma task por vez;
+- `--pool=threads`: os mesmos processos com `--threads` tasks concorrentes
+  cada, cada processo com seu pool de GCP_THREADPOOL_SIZE threads.
+
+Reporta vazão (entrevistas/minuto) e a latência por chamada, cuja diferença
+para o stub é a espera adicionada no processo.
+
+Uso:
+    python benchmarks/concorrencia_llm.py [--processos 4] [--threads 16] [--latencia-ms 800] [--duracao 20]
+"""
+import argparse
+import logging
+import os
+import random
+import statistics
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("ID_PROJETO", "benchmark")
+os.environ.setdefault("TWILIO_ACCOUNT_SID", "ACbenchmark")
+os.environ.setdefault("TWILIO_AUTH_TOKEN", "benchmark")
+os.environ.setdefault("TWILIO_WHATSAPP_NUMBER", "whatsapp:+10000000000")
+
+from app.config import settings
+from app.services import gcp_service
+
+
+class ModeloStub:
+    def __init__(self, latencia):
+        self.latencia = latencia
+
+    def _sortear(self):
+        return random.lognormvariate(0, 0.3) * self.latencia
+
+    class Resposta:
+        text = "ok"
+
+    def generate_content(self, prompt):
+        time.sleep(self._sortear())
+        return self.Resposta()
+
+
+def simular(n_tarefas_concorrentes, duracao):
+    """Roda `n_tarefas_concorrentes` laços de entrevistas e mede vazão e latência por chamada."""
+    latencias, entrevistas = [], [0]
+    lock = threading.Lock()
+    fim = time.monotonic() + duracao
+
+    def laco():
+        while time.monotonic() < fim:
+            for prompt in ("perguntas", "feedback"):
+                inicio = time.monotonic()
+                gcp_service.gerar_texto(prompt)
+                with lock:
+                    latencias.append(time.monotonic() - inicio)
+            with lock:
+                entrevistas[0] += 1
+
+    inicio = time.monotonic()
+    threads = [threading.Thread(target=laco) for _ in range(n_tarefas_concorrentes)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return entrevistas[0] / (time.monotonic() - inicio) * 60, latencias
+
+
+def relatorio(nome, vazao, latencias):
+    latencias = sorted(latencias)
+    p95 = latencias[int(len(latencias) * 0.95) - 1]
+    print(f"\n{nome}")
+    print(f"   🚀 Vazão: {vazao:.0f} entrevistas/min")
+    print(f"   ⏱️  Latência por chamada: mediana {statistics.median(latencias) * 1000:.0f} ms | p95 {p95 * 1000:.0f} ms")
+
+
+def executar(args):
+    logging.disable(logging.CRITICAL)
+    modelo = ModeloStub(args.latencia_ms / 1000)
+    gcp_service.get_generative_model = lambda nome=None: modelo
+    # Todos os processos simulados dividem este processo: um pool por processo.
+    settings.GCP_THREADPOOL_SIZE *= args.processos
+
+    print("📊 CONCORRÊNCIA DAS CHAMADAS AO MODELO")
+    print("=" * 50)
+    print(f"🧪 Latência do stub: ~{args.latencia_ms:.0f} ms | Processos: {args.processos}")
+
+    relatorio("🐢 Prefork, uma task por processo", *simular(args.processos, args.duracao))
+    relatorio(f"⚡ --pool=threads ({args.threads} tasks por processo)", *simular(args.processos * args.threads, args.duracao))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Vazão e latência das chamadas ao modelo por modo de pool do worker.")
+    parser.add_argument("--processos", type=int, default=4)
+    parser.add_argument("--threads", type=int, default=16)
+    parser.add_argument("--latencia-ms", type=float, default=800.0)
+    parser.add_argument("--duracao", type=float, default=20.0)
+    executar(parser.parse_args())
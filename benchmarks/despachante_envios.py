@@ -0,0 +1,184 @@
+"""
+Simulação do despachante de envios sob carga acima do limite da Twilio.
+
+Uma Twilio falsa (em memória) aceita no máximo `--limite` mensagens por
+segundo por remetente e responde 429 acima disso. Durante `--duracao`
+segundos chegam partes de mensagem a `--fator` vezes o limite (parte delas
+de baixa prioridade, como a oferta PRO), em dois cenários:
+
+- envio direto, como antes: cada parte é enviada na hora, com as tentativas
+  e o backoff de `enviar_mensagem_longa`, e descartada se esgotá-los;
+- despachante: fila com prioridade (o papel da fila 'envios' do Celery), com
+  workers chamando `despachar_parte`, limitada pelo token bucket no Redis;
+  quando a parte deve esperar, ela volta à fila com o countdown devolvido
+  (como o `self.retry` da task), até TWILIO_MAX_REENVIOS vezes, sem prender
+  o worker.
+
+Reporta vazão sustentada, partes descartadas e o tempo de fila por prioridade.
+Requer fakeredis com suporte a Lua (`pip install fakeredis[lua]`).
+
+Uso:
+    python benchmarks/despachante_envios.py [--limite 20] [--fator 2] [--duracao 10] [--workers 8]
+"""
+import argparse
+import heapq
+import itertools
+import logging
+import os
+import statistics
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("ID_PROJETO", "benchmark")
+os.environ.setdefault("TWILIO_ACCOUNT_SID", "ACbenchmark")
+os.environ.setdefault("TWILIO_AUTH_TOKEN", "benchmark")
+os.environ.setdefault("TWILIO_WHATSAPP_NUMBER", "whatsapp:+10000000000")
+
+import fakeredis
+from twilio.base.exceptions import TwilioRestException
+
+from app.config import settings
+from app.services import twilio_service
+from app.services.envio_service import PRIORIDADE_ALTA, PRIORIDADE_BAIXA, EnvioRecusadoError, despachar_parte
+
+
+class TwilioFalsa:
+    """Aceita até `limite` mensagens por segundo (com rajada igual ao limite) e responde 429 acima disso."""
+
+    def __init__(self, limite, latencia):
+        self.limite = limite
+        self.latencia = latencia
+        self.tokens = limite
+        self.ultimo = time.monotonic()
+        self.lock = threading.Lock()
+        self.aceitas = 0
+        self.recusadas = 0
+        self.messages = self
+
+    def create(self, from_, body, to):
+        time.sleep(self.latencia)
+        with self.lock:
+            agora = time.monotonic()
+            self.tokens = min(self.limite, self.tokens + (agora - self.ultimo) * self.limite)
+            self.ultimo = agora
+            if self.tokens < 1:
+                self.recusadas += 1
+                raise TwilioRestException(429, "https://api.twilio.com", "Too Many Requests")
+            self.tokens -= 1
+            self.aceitas += 1
+
+
+def chegadas(args):
+    """Instantes de chegada (relativos) e prioridades das partes, a `fator` vezes o limite."""
+    taxa = args.limite * args.fator
+    total = int(taxa * args.duracao)
+    return [(i / taxa, PRIORIDADE_BAIXA if i % 10 < 3 else PRIORIDADE_ALTA) for i in range(total)]
+
+
+def cenario_direto(args, eventos):
+    twilio = TwilioFalsa(args.limite, args.latencia_ms / 1000)
+    entregues = []
+    inicio = time.monotonic()
+
+    def enviar(chegada):
+        if twilio_service._enviar_parte(twilio, "whatsapp:+5511999999999", "parte", 1):
+            entregues.append(time.monotonic() - inicio)
+
+    with ThreadPoolExecutor(max_workers=64) as executor:
+        for chegada, _ in eventos:
+            time.sleep(max(0, chegada - (time.monotonic() - inicio)))
+            executor.submit(enviar, chegada)
+    return twilio, entregues, time.monotonic() - inicio, {}
+
+
+def cenario_despachante(args, eventos):
+    twilio = TwilioFalsa(args.limite, args.latencia_ms / 1000)
+    r = fakeredis.FakeRedis(decode_responses=True)
+    fila, agendadas, sequencia, lock = [], [], itertools.count(), threading.Condition()
+    esperas = {PRIORIDADE_ALTA: [], PRIORIDADE_BAIXA: []}
+    entregues = []
+    pendentes = [len(eventos)]
+    inicio = time.monotonic()
+
+    def produtor():
+        for chegada, prioridade in eventos:
+            time.sleep(max(0, chegada - (time.monotonic() - inicio)))
+            with lock:
+                heapq.heappush(fila, (prioridade, next(sequencia), chegada, 0))
+                lock.notify()
+
+    def liberar_agendadas():
+        # Papel do broker: tasks reagendadas voltam à fila quando vence o countdown.
+        while agendadas and agendadas[0][0] <= time.monotonic():
+            heapq.heappush(fila, heapq.heappop(agendadas)[1])
+
+    def worker():
+        while True:
+            with lock:
+                liberar_agendadas()
+                while not fila:
+                    if not pendentes[0]:
+                        return
+                    lock.wait(timeout=0.01)
+                    liberar_agendadas()
+                prioridade, seq, chegada, tentativa = heapq.heappop(fila)
+            try:
+                espera, recusada = despachar_parte(r, twilio, "whatsapp:+5511999999999", "parte", tentativa), False
+            except EnvioRecusadoError:
+                espera, recusada = None, True
+            with lock:
+                if espera is not None and tentativa < settings.TWILIO_MAX_REENVIOS:
+                    heapq.heappush(agendadas, (time.monotonic() + espera, (prioridade, seq, chegada, tentativa + 1)))
+                    continue
+                pendentes[0] -= 1
+                if espera is None and not recusada:
+                    agora = time.monotonic() - inicio
+                    entregues.append(agora)
+                    esperas[prioridade].append(agora - chegada)
+                lock.notify_all()
+
+    threads = [threading.Thread(target=produtor)] + [threading.Thread(target=worker) for _ in range(args.workers)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return twilio, entregues, time.monotonic() - inicio, esperas
+
+
+def relatorio(nome, eventos, twilio, entregues, duracao, esperas):
+    descartadas = len(eventos) - len(entregues)
+    print(f"\n{nome}")
+    print(f"   📨 Entregues: {len(entregues)}/{len(eventos)} | 🗑️  Descartadas: {descartadas}")
+    print(f"   🚦 Respostas 429 da Twilio: {twilio.recusadas}")
+    print(f"   ⚡ Vazão sustentada: {len(entregues) / duracao:.1f} msg/s em {duracao:.1f}s")
+    for prioridade, rotulo in ((PRIORIDADE_ALTA, "alta (perguntas/feedback)"), (PRIORIDADE_BAIXA, "baixa (oferta PRO)")):
+        if esperas.get(prioridade):
+            print(f"   ⏱️  Fila, prioridade {rotulo}: mediana {statistics.median(esperas[prioridade]):.2f}s "
+                  f"| máx {max(esperas[prioridade]):.2f}s")
+
+
+def executar(args):
+    logging.disable(logging.CRITICAL)
+    settings.TWILIO_LIMITE_ENVIOS_POR_SEGUNDO = args.limite
+    settings.TWILIO_RAJADA_ENVIOS = max(1, int(args.limite))
+    settings.TWILIO_BACKOFF_INICIAL = 0.2
+    eventos = chegadas(args)
+
+    print("📊 DESPACHANTE DE ENVIOS")
+    print("=" * 50)
+    print(f"🚦 Limite da Twilio: {args.limite:.0f} msg/s | Carga: {args.fator:.0f}x ({len(eventos)} partes em {args.duracao}s)")
+    relatorio("🐢 Envio direto com retry", eventos, *cenario_direto(args, eventos))
+    relatorio("✅ Despachante com token bucket", eventos, *cenario_despachante(args, eventos))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Simulação do despachante de envios acima do limite da Twilio.")
+    parser.add_argument("--limite", type=float, default=20.0)
+    parser.add_argument("--fator", type=float, default=2.0)
+    parser.add_argument("--duracao", type=float, default=10.0)
+    parser.add_argument("--workers", type=int, default=8)
+    parser.add_argument("--latencia-ms", type=float, default=50.0)
+    executar(parser.parse_args())
@@ -0,0 +1,141 @@
+"""
+Benchmark do envio de mensagens longas (feedback) pela Twilio.
+
+Sobe um servidor HTTP local que imita a API de mensagens da Twilio (com
+latência e taxa de erros 429 configuráveis) e mede o tempo total para enviar
+feedbacks de 1.5k, 5k e 20k caracteres de duas formas:
+
+- sequencial, sem pool de conexões (uma conexão nova por parte), como antes;
+- `enviar_mensagem_longa`, com pool de conexões e novas tentativas, ainda
+  uma parte por vez; confere que as partes chegaram na ordem.
+
+Uso:
+    python benchmarks/envio_mensagem_longa.py [--latencia-ms 150] [--taxa-429 0.05]
+"""
+import argparse
+import json
+import logging
+import os
+import random
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("ID_PROJETO", "benchmark")
+os.environ.setdefault("TWILIO_ACCOUNT_SID", "ACbenchmark")
+os.environ.setdefault("TWILIO_AUTH_TOKEN", "benchmark")
+os.environ.setdefault("TWILIO_WHATSAPP_NUMBER", "whatsapp:+10000000000")
+
+from twilio.http.http_client import TwilioHttpClient
+from twilio.rest import Client
+
+from app.config import settings
+from app.services import twilio_service
+
+PARAGRAFO = (
+    "Na sua resposta sobre o projeto de integração você explicou bem o contexto e as decisões técnicas, "
+    "mas poderia ter quantificado o resultado e mencionado como mediu o sucesso da entrega. "
+)
+
+
+class TwilioFalsa(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True
+    latencia = 0.15
+    taxa_429 = 0.0
+    recebidas = []
+
+    def do_POST(self):
+        corpo = parse_qs(self.rfile.read(int(self.headers.get("Content-Length", 0))).decode())
+        time.sleep(self.latencia)
+        if random.random() < self.taxa_429:
+            self._responder(429, {"code": 20429, "message": "Too Many Requests", "status": 429})
+        else:
+            self.recebidas.append(corpo["Body"][0])
+            self._responder(201, {"sid": f"SM{random.getrandbits(64):032x}", "status": "queued"})
+
+    def _responder(self, status, corpo):
+        dados = json.dumps(corpo).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(dados)))
+        self.end_headers()
+        self.wfile.write(dados)
+
+    def log_message(self, *args):
+        pass
+
+
+def criar_cliente(porta, pool_connections):
+    class HttpClientLocal(TwilioHttpClient):
+        def request(self, method, url, *args, **kwargs):
+            url = url.replace("https://api.twilio.com", f"http://127.0.0.1:{porta}")
+            return super().request(method, url, *args, **kwargs)
+
+    http_client = HttpClientLocal(pool_connections=pool_connections, timeout=10)
+    return Client(settings.TWILIO_ACCOUNT_SID, settings.TWILIO_AUTH_TOKEN, http_client=http_client)
+
+
+def gerar_feedback(n_caracteres):
+    paragrafos = []
+    while sum(len(p) + 2 for p in paragrafos) < n_caracteres:
+        paragrafos.append(PARAGRAFO * random.randint(1, 4))
+    return "\n\n".join(paragrafos)[:n_caracteres]
+
+
+def envio_sequencial_sem_pool(cliente, destinatario, texto):
+    """Reproduz o fluxo anterior: uma parte por vez, sem reaproveitar conexões."""
+    for parte in twilio_service.dividir_mensagem(texto):
+        cliente.messages.create(from_=settings.TWILIO_WHATSAPP_NUMBER, body=parte, to=destinatario)
+
+
+def medir(funcao, repeticoes):
+    inicio = time.perf_counter()
+    for _ in range(repeticoes):
+        funcao()
+    return (time.perf_counter() - inicio) / repeticoes
+
+
+def executar(args):
+    logging.disable(logging.CRITICAL)
+    TwilioFalsa.latencia = args.latencia_ms / 1000
+    servidor = ThreadingHTTPServer(("127.0.0.1", 0), TwilioFalsa)
+    threading.Thread(target=servidor.serve_forever, daemon=True).start()
+    porta = servidor.server_address[1]
+
+    settings.TWILIO_BACKOFF_INICIAL = 0.05
+    sem_pool = criar_cliente(porta, pool_connections=False)
+    com_pool = criar_cliente(porta, pool_connections=True)
+    destinatario = "whatsapp:+5511999999999"
+
+    print("📊 ENVIO DE MENSAGENS LONGAS")
+    print("=" * 50)
+    print(f"⏱️  Latência simulada da Twilio: {args.latencia_ms:.0f} ms | 429 injetados: {args.taxa_429 * 100:.0f}%")
+    for tamanho in (1500, 5000, 20000):
+        texto = gerar_feedback(tamanho)
+        n_partes = len(twilio_service.dividir_mensagem(texto))
+
+        TwilioFalsa.taxa_429 = 0.0
+        antes = medir(lambda: envio_sequencial_sem_pool(sem_pool, destinatario, texto), args.repeticoes)
+        TwilioFalsa.taxa_429 = args.taxa_429
+        TwilioFalsa.recebidas = []
+        depois = medir(lambda: twilio_service.enviar_mensagem_longa(com_pool, destinatario, texto), args.repeticoes)
+        em_ordem = TwilioFalsa.recebidas == twilio_service.dividir_mensagem(texto) * args.repeticoes
+
+        print(f"\n📝 {tamanho} caracteres ({n_partes} partes)")
+        print(f"   🐢 Sequencial sem pool: {antes * 1000:.0f} ms")
+        print(f"   ⚡ Pool de conexões (com retry): {depois * 1000:.0f} ms")
+        print(f"   {'✅' if em_ordem else '❌'} Partes recebidas na ordem: {em_ordem}")
+
+    servidor.shutdown()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Tempo de envio de mensagens longas via Twilio.")
+    parser.add_argument("--latencia-ms", type=float, default=150.0)
+    parser.add_argument("--taxa-429", type=float, default=0.05)
+    parser.add_argument("--repeticoes", type=int, default=5)
+    executar(parser.parse_args())
@@ -0,0 +1,141 @@
+"""
+Teste de estresse do compare-and-set do estado do usuário.
+
+Vários escritores concorrentes (threads) atualizam o MESMO UserState, cada um
+anexando respostas numeradas via `atualizar_estado`. Ao final, verifica que
+nenhuma atualização foi perdida e reporta a vazão sob contenção e o número de
+conflitos (re-execuções do mutador). Depois força um conflito na mensagem
+que conclui a entrevista e confere que o log `interview_completed` sai uma
+única vez, mesmo com o mutador executado duas vezes.
+
+Usa um Redis local se `--redis-url` for informado; caso contrário, fakeredis
+(`pip install fakeredis[lua]`).
+
+Uso:
+    python benchmarks/estado_concorrente.py [--escritores 32] [--updates 200]
+"""
+import argparse
+import logging
+import os
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("ID_PROJETO", "benchmark")
+os.environ.setdefault("TWILIO_ACCOUNT_SID", "ACbenchmark")
+os.environ.setdefault("TWILIO_AUTH_TOKEN", "benchmark")
+os.environ.setdefault("TWILIO_WHATSAPP_NUMBER", "whatsapp:+10000000000")
+
+import redis
+
+from app.models import UserState
+from app.services.redis_service import atualizar_campos, atualizar_estado, carregar_estado
+from app.state_machine import criar_mutador_mensagem, emitir_eventos
+
+
+def criar_cliente(redis_url):
+    if redis_url:
+        return redis.Redis.from_url(redis_url, decode_responses=True)
+    import fakeredis
+    return fakeredis.FakeRedis(decode_responses=True)
+
+
+class AcoesDoLog(logging.Handler):
+    """Guarda as "action" logadas."""
+
+    def __init__(self):
+        super().__init__()
+        self.acoes = []
+
+    def emit(self, record):
+        if getattr(record, "action", None):
+            self.acoes.append(record.action)
+
+
+def conferir_logs_com_conflito(r) -> bool:
+    """Conclui uma entrevista com um escritor concorrente gravando no meio do CAS."""
+    user_key = "whatsapp:+5511999990001"
+    atualizar_estado(r, user_key, lambda atual: (UserState(
+        user_key=user_key, etapa='aguardando_resposta_3', perguntas=["P1", "P2", "P3"], respostas=["R1", "R2"]), None))
+
+    mutador = criar_mutador_mensagem(user_key, "Terceira resposta.", int(time.time()))
+    execucoes = [0]
+
+    def mutador_com_conflito(atual):
+        execucoes[0] += 1
+        if execucoes[0] == 1:
+            atualizar_campos(r, user_key, last_user_ts=int(time.time()))
+        return mutador(atual)
+
+    acoes = AcoesDoLog()
+    logging.getLogger().addHandler(acoes)
+    logging.getLogger().setLevel(logging.INFO)
+    try:
+        _, (_, _, _, eventos) = atualizar_estado(r, user_key, mutador_com_conflito)
+        emitir_eventos(eventos)
+    finally:
+        logging.getLogger().removeHandler(acoes)
+
+    concluidas = acoes.acoes.count("interview_completed")
+    print(f"🔁 Mutador da mensagem executado {execucoes[0]}x; logs interview_completed: {concluidas}")
+    return execucoes[0] == 2 and concluidas == 1
+
+
+def executar(args):
+    r = criar_cliente(args.redis_url)
+    user_key = "whatsapp:+5511999990000"
+    r.delete(user_key)
+
+    execucoes = [0]
+    lock = threading.Lock()
+
+    def escritor(indice):
+        for n in range(args.updates):
+            def mutador(atual):
+                with lock:
+                    execucoes[0] += 1
+                estado = atual or UserState(user_key=user_key, etapa='aguardando_resposta_1')
+                estado.respostas.append(f"{indice}:{n}")
+                return estado, None
+
+            atualizar_estado(r, user_key, mutador, max_tentativas=10_000)
+
+    threads = [threading.Thread(target=escritor, args=(i,)) for i in range(args.escritores)]
+    inicio = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    duracao = time.perf_counter() - inicio
+
+    esperado = args.escritores * args.updates
+    estado = carregar_estado(r, user_key)
+    gravadas = len(estado.respostas)
+    unicas = len(set(estado.respostas))
+
+    print("📊 ESTRESSE DE CONCORRÊNCIA NO ESTADO")
+    print("=" * 50)
+    print(f"✍️  Escritores: {args.escritores} x {args.updates} atualizações")
+    print(f"✅ Atualizações esperadas: {esperado}")
+    print(f"💾 Atualizações gravadas: {gravadas} (únicas: {unicas}, versão final: {estado.version})")
+    print(f"🔁 Conflitos (mutador reexecutado): {execucoes[0] - esperado}")
+    print(f"⚡ Vazão sob contenção: {esperado / duracao:.0f} atualizações/s")
+
+    if gravadas != esperado or unicas != esperado or estado.version != esperado:
+        print("❌ Atualizações perdidas ou duplicadas!")
+        sys.exit(1)
+    print("✅ Nenhuma atualização perdida.")
+
+    if not conferir_logs_com_conflito(r):
+        print("❌ Log de ação repetido (ou conflito não provocado)!")
+        sys.exit(1)
+    print("✅ Logs de ação emitidos uma vez, após a gravação.")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Estresse do compare-and-set do UserState.")
+    parser.add_argument("--escritores", type=int, default=32)
+    parser.add_argument("--updates", type=int, default=200)
+    parser.add_argument("--redis-url", default=None)
+    executar(parser.parse_args())
@@ -0,0 +1,189 @@
+"""
+Contadores do funil no Redis (`app.services.funil_service`).
+
+1. `--usuarios` usuários percorrem o funil pela máquina de estados
+   (`atualizar_estado` + `criar_mutador_mensagem`), parte deles parando em
+   cada passo. Confere que os contadores do dia batem com os eventos
+   "action" dos logs e que gravar o estado continua custando as mesmas idas
+   ao Redis com e sem eventos do funil.
+2. Preenche `--dias` dias de contadores com `--usuarios-por-dia` usuários por
+   dia e mede o funil de uma semana e do período todo, comparando os
+   usuários distintos estimados (HyperLogLog) com os exatos.
+
+Sem `--redis-url`, roda no fakeredis (`pip install fakeredis[lua]`), em que
+o HyperLogLog é um conjunto exato e o PFCOUNT de vários dias é uma união em
+Python: o erro e o tempo da parte 2 só são representativos num Redis de verdade.
+
+Uso:
+    python benchmarks/funil_contadores.py [--usuarios 2000] [--dias 60] [--usuarios-por-dia 2000] [--redis-url redis://localhost:6379/15]
+"""
+import argparse
+import logging
+import os
+import random
+import sys
+import time
+from collections import defaultdict
+from datetime import date, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("ID_PROJETO", "benchmark")
+os.environ.setdefault("TWILIO_ACCOUNT_SID", "ACbenchmark")
+os.environ.setdefault("TWILIO_AUTH_TOKEN", "benchmark")
+os.environ.setdefault("TWILIO_WHATSAPP_NUMBER", "whatsapp:+10000000000")
+
+import fakeredis
+import redis
+
+from app.services.funil_service import EVENTOS_FUNIL, consultar_funil
+from app.services.redis_service import atualizar_campos, atualizar_estado, chave_contador_funil, chave_usuarios_funil
+from app.state_machine import criar_mutador_mensagem, emitir_eventos
+
+
+class EventosDoLog(logging.Handler):
+    """Guarda os usuários distintos e as ocorrências de cada "action" do funil logada."""
+
+    def __init__(self):
+        super().__init__()
+        self.usuarios = defaultdict(set)
+        self.ocorrencias = defaultdict(int)
+
+    def emit(self, record):
+        acao = getattr(record, "action", None)
+        if acao in EVENTOS_FUNIL:
+            self.usuarios[acao].add(record.user_id)
+            self.ocorrencias[acao] += 1
+
+
+class ContadorDeIdas:
+    """Conta as idas ao Redis (comandos avulsos e pipelines) do cliente."""
+
+    def __init__(self, r):
+        self.idas = 0
+        original = r.execute_command
+
+        def executar(*args, **kwargs):
+            self.idas += 1
+            return original(*args, **kwargs)
+        r.execute_command = executar
+
+
+def enviar(r, user_key, texto):
+    user_state, (prev_etapa, response_text, novo_usuario, eventos) = atualizar_estado(
+        r, user_key, criar_mutador_mensagem(user_key, texto, int(time.time()))
+    )
+    emitir_eventos(eventos)
+
+
+def jornada(r, user_key, rng, idas, idas_por_tipo):
+    """Leva o usuário pelo funil até desistir em algum passo."""
+    def medir(com_evento, texto):
+        antes = idas.idas
+        enviar(r, user_key, texto)
+        idas_por_tipo[com_evento].append(idas.idas - antes)
+
+    medir(True, "Oi")
+    if rng.random() > 0.7:
+        return
+    medir(True, "Vaga de backend pleno, 4 anos de Python, Django e AWS.")
+    atualizar_campos(r, user_key, perguntas=["P1", "P2", "P3"])
+    enviar(r, user_key, "Estou pronto")
+    if rng.random() > 0.6:
+        return
+    medir(False, "Primeira resposta.")
+    medir(False, "Segunda resposta.")
+    medir(True, "Terceira resposta.")
+    # O worker entrega o feedback e avança a etapa.
+    atualizar_campos(r, user_key, etapa="aguardando_feedback_usuario", aguardando_entrega=None)
+    if rng.random() > 0.5:
+        return
+    medir(True, "Gostei muito, as perguntas foram realistas.")
+    if rng.random() > 0.3:
+        enviar(r, user_key, "finalizar")
+        return
+    medir(True, f"usuario{rng.randrange(10 ** 6)}@exemplo.com")
+
+
+def preencher_historico(r, args, rng):
+    """Grava contadores diários como o CAS faria, guardando os usuários exatos de cada evento."""
+    primeiro_dia = date.today() - timedelta(days=args.dias)
+    exatos = defaultdict(lambda: defaultdict(set))
+    for d in range(args.dias):
+        dia = str(primeiro_dia + timedelta(days=d))
+        pipe = r.pipeline(transaction=False)
+        for i in range(args.usuarios_por_dia):
+            # Parte dos usuários volta em outros dias.
+            user_key = f"whatsapp:+5511{rng.randrange(args.dias * args.usuarios_por_dia // 2):09d}"
+            for evento, chance in zip(EVENTOS_FUNIL, (1.0, 0.7, 0.6, 0.5, 0.3)):
+                if rng.random() > chance:
+                    break
+                pipe.incr(chave_contador_funil(dia, evento))
+                pipe.pfadd(chave_usuarios_funil(dia, evento), user_key)
+                exatos[dia][evento].add(user_key)
+        pipe.execute()
+    return primeiro_dia, exatos
+
+
+def novo_redis(args):
+    if args.redis_url:
+        r = redis.Redis.from_url(args.redis_url, decode_responses=True)
+        r.flushdb()
+        return r
+    return fakeredis.FakeRedis(decode_responses=True)
+
+
+def executar(args):
+    rng = random.Random(11)
+    random.seed(11)
+    logging.getLogger().setLevel(logging.INFO)
+    eventos_log = EventosDoLog()
+    logging.getLogger().addHandler(eventos_log)
+
+    print("📊 CONTADORES DO FUNIL NO REDIS")
+    print("=" * 50)
+
+    r = novo_redis(args)
+    idas = ContadorDeIdas(r)
+    idas_por_tipo = {True: [], False: []}
+    inicio = time.perf_counter()
+    for i in range(args.usuarios):
+        jornada(r, f"whatsapp:+5521{i:09d}", rng, idas, idas_por_tipo)
+    duracao = time.perf_counter() - inicio
+    logging.getLogger().removeHandler(eventos_log)
+
+    hoje = time.strftime('%Y-%m-%d')
+    print(f"👥 {args.usuarios} jornadas pela máquina de estados em {duracao:.1f}s")
+    for com_evento, nome in ((False, "sem evento do funil"), (True, "com evento do funil")):
+        medias = idas_por_tipo[com_evento]
+        print(f"   📨 Mensagem {nome}: {sum(medias) / len(medias):.1f} idas ao Redis")
+    iguais = True
+    for evento, ocorrencias, usuarios in consultar_funil(r, hoje, hoje):
+        ok = (ocorrencias, usuarios) == (eventos_log.ocorrencias[evento], len(eventos_log.usuarios[evento]))
+        iguais &= ok
+        print(f"   {'✅' if ok else '❌'} {evento}: {ocorrencias} eventos / ~{usuarios} usuários no Redis | "
+              f"{eventos_log.ocorrencias[evento]} / {len(eventos_log.usuarios[evento])} nos logs")
+    print(f"   {'✅ Contadores iguais aos logs' if iguais else '⚠️  Diferença entre contadores e logs'}")
+
+    r = novo_redis(args)
+    primeiro_dia, exatos = preencher_historico(r, args, rng)
+    print(f"\n🗓️  Histórico: {args.dias} dias x {args.usuarios_por_dia} usuários por dia")
+    ultimo_dia = primeiro_dia + timedelta(days=args.dias - 1)
+    for nome, de in (("Última semana", ultimo_dia - timedelta(days=6)), (f"{args.dias} dias", primeiro_dia)):
+        de, ate = str(de), str(ultimo_dia)
+        inicio = time.perf_counter()
+        funil = consultar_funil(r, de, ate)
+        duracao = time.perf_counter() - inicio
+        erro_maximo = 0.0
+        for evento, _, usuarios in funil:
+            exato = len(set().union(*(exatos[dia][evento] for dia in exatos if de <= dia <= ate)))
+            erro_maximo = max(erro_maximo, abs(usuarios - exato) / exato * 100)
+        print(f"⚡ {nome}: {duracao * 1000:.1f} ms | maior erro dos usuários distintos: {erro_maximo:.2f}%")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Contadores do funil no Redis: consistência com os logs e tempo de consulta.")
+    parser.add_argument("--usuarios", type=int, default=2000)
+    parser.add_argument("--dias", type=int, default=60)
+    parser.add_argument("--usuarios-por-dia", type=int, default=2000)
+    parser.add_argument("--redis-url", default=None, help="Redis de verdade (o banco é esvaziado)")
+    executar(parser.parse_args())
@@ -0,0 +1,128 @@
+"""
+Micro-benchmark da detecção de intenções da máquina de estados.
+
+Compara a checagem antiga de "estou pronto" de `handle_preparando_perguntas`
+(lista de 40 expressões recriada a cada chamada e busca por substring) com o
+padrão pré-compilado de `app.intencoes`, sobre:
+
+1. um corpus de `--respostas` respostas transcritas sintéticas, do tamanho de
+   respostas reais de entrevista (60 a 200 palavras), que NÃO são pedidos
+   para começar: mede o tempo por mensagem e os falsos positivos;
+2. um conjunto rotulado de mensagens curtas (o que de fato chega nessa etapa),
+   com o tempo por mensagem e os acertos e erros de cada versão.
+
+Uso:
+    python benchmarks/intencoes.py [--respostas 5000] [--repeticoes 5]
+"""
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("ID_PROJETO", "benchmark")
+os.environ.setdefault("TWILIO_ACCOUNT_SID", "ACbenchmark")
+os.environ.setdefault("TWILIO_AUTH_TOKEN", "benchmark")
+os.environ.setdefault("TWILIO_WHATSAPP_NUMBER", "whatsapp:+10000000000")
+
+from app.intencoes import PRONTO, detectar
+
+FRASES = [
+    "no meu último projeto eu trabalhei com uma API de pagamentos em Python e Django",
+    "a demanda do time era reduzir o tempo de resposta dos endpoints mais usados",
+    "usamos tokens JWT para autenticação e o cache ficava no Redis",
+    "eu comecei analisando os logs e montei um dashboard no Grafana",
+    "o comando que mais me ajudou foi o explain do Postgres",
+    "a solução mais simples foi criar um índice composto na tabela de pedidos",
+    "no início eu tive dificuldade com o algoritmo de conciliação",
+    "meu gestor sempre cobrava uma documentação clara no Confluence",
+    "a gente migrou parte da infraestrutura para o Google Cloud",
+    "eu conversei com o cliente para entender o problema de negócio",
+    "tivemos um incidente em produção e eu liderei o postmortem",
+    "o resultado foi uma queda de quarenta por cento na latência",
+    "aprendi muito sobre comunicação com pessoas de outras áreas",
+    "a principal métrica que acompanhávamos era a taxa de conversão",
+    "implementei testes automatizados e a cobertura subiu bastante",
+    "o maior desafio foi priorizar as tarefas com prazos apertados",
+    "eu mandei um resumo semanal para os stakeholders com os riscos",
+    "usei um bookmark no navegador para acompanhar os alertas do Sentry",
+    "assumi o onboarding dos estagiários e montei um guia de boas práticas",
+    "a arquitetura era baseada em eventos com filas no RabbitMQ",
+]
+
+ROTULADAS = [
+    ("Estou pronto!", True), ("estou pronta", True), ("ok", True), ("OK!", True),
+    ("Bora", True), ("Vamos lá", True), ("PODE COMEÇAR", True), ("pode mandar", True),
+    ("sim", True), ("let’s go", True), ("Pronto, pode enviar", True), ("começa", True),
+    ("book", False), ("token expirado", False), ("trabalho com google cloud", False),
+    ("demanda alta de comandos", False), ("é bem simples", False), ("algoritmos", False),
+    ("meu nome é Simone", False), ("gosto de golang", False), ("okta e sso", False),
+    ("recomendações de leitura", False),
+]
+
+
+def detectar_antigo(resposta_usuario):
+    """Cópia da checagem original de `handle_preparando_perguntas`."""
+    normalized = resposta_usuario.strip().lower()
+    ready_keywords = [
+        'estou pronto', 'estou pronta', 'Estou pronto', 'Estou pronta',
+        'pronto', 'pronta', 'ready', 'vamos', 'vamos lá', 'pode enviar',
+        'pode mandar', 'manda', 'envia', 'envie', 'bora', 'ok', 'sim',
+        'yes', 'go', 'começar', 'comecar', 'começa', 'começa', 'start',
+        'iniciar', 'inicia', 'início', 'inicio', 'let\'s go', 'let us go',
+        'let\'s', 'let us', 'vamos começar', 'vamos comecar', 'vamos la',
+        'pode começar', 'pode comecar', 'pode começar', 'pode comecar'
+    ]
+    return any(keyword in normalized for keyword in ready_keywords)
+
+
+def detectar_novo(resposta_usuario):
+    return detectar(PRONTO, resposta_usuario)
+
+
+def gerar_respostas(n, rng):
+    respostas = []
+    for _ in range(n):
+        palavras = []
+        while len(palavras) < rng.randint(60, 200):
+            palavras.extend(rng.choice(FRASES).split())
+        respostas.append(" ".join(palavras).capitalize() + ".")
+    return respostas
+
+
+def medir(detector, respostas, repeticoes):
+    inicio = time.perf_counter()
+    for _ in range(repeticoes):
+        positivos = sum(detector(r) for r in respostas)
+    return (time.perf_counter() - inicio) / (repeticoes * len(respostas)), positivos
+
+
+def executar(args):
+    rng = random.Random(11)
+    respostas = gerar_respostas(args.respostas, rng)
+    palavras = sum(len(r.split()) for r in respostas) / len(respostas)
+
+    print("📊 DETECÇÃO DE INTENÇÕES")
+    print("=" * 50)
+    print(f"📝 {len(respostas)} respostas transcritas sintéticas, {palavras:.0f} palavras em média")
+
+    curtas = [texto for texto, _ in ROTULADAS]
+    for nome, detector in (("🐢 Lista + substring (antigo)", detectar_antigo), ("⚡ Regex pré-compilada", detectar_novo)):
+        por_mensagem, positivos = medir(detector, respostas, args.repeticoes)
+        por_comando, _ = medir(detector, curtas, args.repeticoes * 100)
+        acertos = sum(detector(texto) == esperado for texto, esperado in ROTULADAS)
+        erros = [texto for texto, esperado in ROTULADAS if detector(texto) != esperado]
+        print(f"\n{nome}")
+        print(f"   ⏱️  Respostas longas: {por_mensagem * 1e6:.1f} µs por mensagem | mensagens curtas: {por_comando * 1e6:.2f} µs")
+        print(f"   🚨 Falsos 'estou pronto' no corpus: {positivos}/{len(respostas)}")
+        print(f"   🎯 Mensagens rotuladas: {acertos}/{len(ROTULADAS)} corretas")
+        if erros:
+            print(f"   ❌ Erros: {', '.join(repr(e) for e in erros)}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Tempo e precisão da detecção de intenções.")
+    parser.add_argument("--respostas", type=int, default=5000)
+    parser.add_argument("--repeticoes", type=int, default=5)
+    executar(parser.parse_args())
@@ -0,0 +1,156 @@
+"""
+Latência do webhook com os logs ligados: handlers síncronos x fila + listener.
+
+Cada um dos `--mensagens` usuários, já na primeira pergunta da entrevista,
+manda uma resposta de texto; as mensagens chegam a `--taxa` por segundo.
+Compara, com os logs realmente gravados em disco:
+
+1. o setup antigo de `app/main.py`: StreamHandler no console e FileHandler,
+   ambos síncronos, formatando e escrevendo dentro da requisição;
+2. o pipeline de `app.logs` (QueueHandler + QueueListener).
+
+Cada cenário roda com o console rápido e com `--atraso-console-ms` por
+escrita, simulando o stdout de um container cujo coletor de logs não
+acompanha (o pipe enche e a escrita bloqueia).
+
+Requer `pip install httpx fakeredis[lua]`.
+
+Uso:
+    python benchmarks/logs_webhook.py [--mensagens 2000] [--taxa 100] [--atraso-console-ms 0.5]
+"""
+import argparse
+import asyncio
+import logging
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("ID_PROJETO", "benchmark")
+os.environ.setdefault("TWILIO_ACCOUNT_SID", "ACbenchmark")
+os.environ.setdefault("TWILIO_AUTH_TOKEN", "benchmark")
+os.environ.setdefault("TWILIO_WHATSAPP_NUMBER", "whatsapp:+10000000000")
+
+import httpx
+from fakeredis.aioredis import FakeRedis as FakeAsyncRedis
+from pythonjsonlogger import jsonlogger
+
+import app.logs as logs
+import app.state_machine as state_machine
+from app.main import app
+from app.models import UserState
+from app.services.redis_service import chave_estado, get_async_redis_client
+from app.services.twilio_service import get_twilio_client
+
+
+class ConsoleLento:
+    """Stream que demora `atraso` segundos por escrita, como um pipe cheio."""
+
+    def __init__(self, atraso):
+        self.atraso = atraso
+        self.destino = open(os.devnull, "w")
+
+    def write(self, texto):
+        if self.atraso:
+            time.sleep(self.atraso)
+        return self.destino.write(texto)
+
+    def flush(self):
+        self.destino.flush()
+
+
+class TarefaStub:
+    @staticmethod
+    def delay(*args, **kwargs):
+        return None
+
+
+def configurar_antigo(pasta, console):
+    """Cópia do setup original de `app/main.py`, com a pasta e o console do benchmark."""
+    root = logging.getLogger()
+    console_handler = logging.StreamHandler(console)
+    console_handler.setFormatter(jsonlogger.JsonFormatter(logs.FORMATO))
+    file_handler = logging.FileHandler(os.path.join(pasta, "bot_metrics_antigo.jsonl"), encoding="utf-8")
+    file_handler.setFormatter(jsonlogger.JsonFormatter(logs.FORMATO))
+    root.addHandler(console_handler)
+    root.addHandler(file_handler)
+    return lambda: [root.removeHandler(h) or h.close() for h in (console_handler, file_handler)]
+
+
+def configurar_novo(pasta, console):
+    logs.configurar_logs(pasta, stream=console)
+    return logs.encerrar_logs
+
+
+async def preparar_usuarios(r, usuarios):
+    await r.flushall()
+    pipe = r.pipeline(transaction=False)
+    estado = UserState(etapa="aguardando_resposta_1", perguntas=["P1", "P2", "P3"])
+    for user_key in usuarios:
+        estado.user_key = user_key
+        gravar, _ = UserState.para_hash(estado.model_dump(exclude={"version"}))
+        pipe.hset(chave_estado(user_key), mapping={**gravar, "version": 1})
+    await pipe.execute()
+
+
+async def cenario(client, r, args, configurar, atraso):
+    pasta = tempfile.mkdtemp(prefix="bench_logs_")
+    usuarios = [f"whatsapp:+5511{i:09d}" for i in range(args.mensagens)]
+    await preparar_usuarios(r, usuarios)
+    encerrar = configurar(pasta, ConsoleLento(atraso))
+    latencias = []
+
+    async def enviar(user_key, atraso_chegada):
+        await asyncio.sleep(atraso_chegada)
+        inicio = time.perf_counter()
+        resposta = await client.post("/webhook/twilio", data={"From": user_key, "Body": "Minha resposta.", "MessageSid": f"SM{user_key}"})
+        resposta.raise_for_status()
+        latencias.append(time.perf_counter() - inicio)
+
+    inicio = time.perf_counter()
+    await asyncio.gather(*[enviar(u, i / args.taxa) for i, u in enumerate(usuarios)])
+    duracao = time.perf_counter() - inicio
+    encerrar()
+    linhas = sum(sum(1 for _ in open(os.path.join(pasta, n))) for n in os.listdir(pasta))
+    shutil.rmtree(pasta)
+    return sorted(latencias), duracao, linhas
+
+
+def relatorio(nome, args, latencias, duracao, linhas):
+    def p(q):
+        return latencias[min(len(latencias) - 1, int(len(latencias) * q))] * 1000
+    print(f"   {nome}: p50 {p(0.5):.1f} ms | p99 {p(0.99):.1f} ms | máx {latencias[-1] * 1000:.0f} ms | "
+          f"{len(latencias) / duracao:.0f} msg/s | {linhas / len(latencias):.1f} linhas de log por mensagem")
+
+
+async def executar(args):
+    random.seed(3)
+    r = FakeAsyncRedis(decode_responses=True)
+    state_machine.tarefa_gerar_feedback = TarefaStub
+    state_machine.tarefa_avaliar_resposta = TarefaStub
+    app.dependency_overrides[get_async_redis_client] = lambda: r
+    app.dependency_overrides[get_twilio_client] = lambda: object()
+    # Sai do pipeline configurado na importação de app.main; cada cenário monta o seu.
+    logs.encerrar_logs()
+
+    print("📊 LATÊNCIA DO WEBHOOK COM LOGS")
+    print("=" * 50)
+    print(f"📨 {args.mensagens} mensagens de texto a {args.taxa:.0f} msg/s")
+
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://teste", timeout=None) as client:
+        for atraso in (0.0, args.atraso_console_ms / 1000):
+            print(f"\n🖥️  Console {'rápido' if not atraso else f'com {atraso * 1000:.1f} ms por escrita'}")
+            relatorio("🐢 Handlers síncronos (antigo)", args, *await cenario(client, r, args, configurar_antigo, atraso))
+            relatorio("⚡ Fila + listener", args, *await cenario(client, r, args, configurar_novo, atraso))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Latência do webhook com logs síncronos x em fila.")
+    parser.add_argument("--mensagens", type=int, default=2000)
+    parser.add_argument("--taxa", type=float, default=100.0)
+    parser.add_argument("--atraso-console-ms", type=float, default=0.5)
+    asyncio.run(executar(parser.parse_args()))
@@ -0,0 +1,119 @@
+"""
+Custo das métricas Prometheus (`app.metricas`) e soma entre processos.
+
+1. Custo de uma medição (`with medir_dependencia(...)`) em relação a um
+   bloco vazio, no modo de um processo e no modo multiprocesso
+   (PROMETHEUS_MULTIPROC_DIR), com uma e com `--threads` threads medindo ao
+   mesmo tempo.
+2. `--processos` processos medem `--medicoes` chamadas cada um na mesma pasta
+   multiprocesso; confere que o /metrics soma todos e mede o tempo do scrape.
+
+Uso:
+    python benchmarks/metricas.py [--medicoes 200000] [--threads 8] [--processos 4]
+"""
+import argparse
+import contextlib
+import multiprocessing
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, RAIZ)
+os.environ.setdefault("ID_PROJETO", "benchmark")
+os.environ.setdefault("TWILIO_ACCOUNT_SID", "ACbenchmark")
+os.environ.setdefault("TWILIO_AUTH_TOKEN", "benchmark")
+os.environ.setdefault("TWILIO_WHATSAPP_NUMBER", "whatsapp:+10000000000")
+
+
+def custo_por_medicao(medicoes, threads):
+    """Roda no processo filho, já com ou sem PROMETHEUS_MULTIPROC_DIR. Devolve ns por medição (vazio, medido)."""
+    from app.metricas import medir_dependencia
+
+    def laco(medir):
+        for _ in range(medicoes // threads):
+            with medir():
+                pass
+
+    def cronometrar(medir):
+        trabalhadores = [threading.Thread(target=laco, args=(medir,)) for _ in range(threads)]
+        inicio = time.perf_counter()
+        for t in trabalhadores:
+            t.start()
+        for t in trabalhadores:
+            t.join()
+        return (time.perf_counter() - inicio) / medicoes * 1e9
+
+    return cronometrar(contextlib.nullcontext), cronometrar(lambda: medir_dependencia("redis", "carregar_estado"))
+
+
+def medir_em_processo(medicoes):
+    from app.metricas import medir_dependencia
+    for _ in range(medicoes):
+        with medir_dependencia("twilio", "enviar_mensagem"):
+            pass
+
+
+def executar_filho(args):
+    """Ponto de entrada do subprocesso que mede o custo em um dos modos."""
+    for threads in (1, args.threads):
+        vazio, medido = custo_por_medicao(args.medicoes, threads)
+        print(f"{threads} {vazio:.0f} {medido:.0f}")
+
+
+def executar(args):
+    print("📊 CUSTO DAS MÉTRICAS PROMETHEUS")
+    print("=" * 50)
+
+    pasta = tempfile.mkdtemp(prefix="bench_prometheus_")
+    for modo, ambiente in (("um processo", {}), ("multiprocesso", {"PROMETHEUS_MULTIPROC_DIR": pasta})):
+        saida = subprocess.run(
+            [sys.executable, __file__, "--filho", "--medicoes", str(args.medicoes), "--threads", str(args.threads)],
+            env={**os.environ, **ambiente}, capture_output=True, text=True, check=True,
+        ).stdout
+        print(f"\n⏱️  Modo {modo}")
+        for linha in saida.split("\n"):
+            if linha.strip():
+                threads, vazio, medido = linha.split()
+                print(f"   {threads} thread(s): {int(medido) - int(vazio)} ns por medição (bloco vazio: {vazio} ns)")
+    shutil.rmtree(pasta)
+
+    # Soma entre processos: a variável precisa existir antes de o prometheus_client ser importado.
+    pasta = tempfile.mkdtemp(prefix="bench_prometheus_")
+    os.environ["PROMETHEUS_MULTIPROC_DIR"] = pasta
+    processos = [multiprocessing.Process(target=medir_em_processo, args=(args.medicoes,)) for _ in range(args.processos)]
+    for p in processos:
+        p.start()
+    for p in processos:
+        p.join()
+
+    from app.metricas import gerar_metricas
+    inicio = time.perf_counter()
+    texto = gerar_metricas().decode()
+    duracao = time.perf_counter() - inicio
+    contagem = next(
+        float(l.rsplit(" ", 1)[1]) for l in texto.splitlines()
+        if l.startswith("bot_dependencia_segundos_count") and 'dependencia="twilio"' in l
+    )
+    esperado = args.processos * args.medicoes
+    print(f"\n🧮 {args.processos} processos x {args.medicoes} medições: /metrics soma {contagem:.0f} "
+          f"({'✅ igual ao esperado' if contagem == esperado else f'❌ esperado {esperado}'})")
+    print(f"🔎 Scrape do /metrics com {len(os.listdir(pasta))} arquivos de processo: {duracao * 1000:.1f} ms")
+    shutil.rmtree(pasta)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Custo por medição e soma multiprocesso das métricas Prometheus.")
+    parser.add_argument("--medicoes", type=int, default=200000)
+    parser.add_argument("--threads", type=int, default=8)
+    parser.add_argument("--processos", type=int, default=4)
+    parser.add_argument("--filho", action="store_true", help=argparse.SUPPRESS)
+    argumentos = parser.parse_args()
+    if argumentos.filho:
+        executar_filho(argumentos)
+    else:
+        executar(argumentos)
@@ -0,0 +1,203 @@
+"""
+Benchmark da ordem de processamento por usuário no webhook.
+
+Cada um dos `--usuarios` usuários, já na primeira pergunta da entrevista,
+manda uma rajada de três mensagens, com 20 ms entre elas: um áudio (com
+transcrição stub de `--stt-min-ms` a `--stt-max-ms`) seguido de dois textos.
+As rajadas chegam espalhadas ao longo de `--janela` segundos.
+
+Tudo roda num único processo sobre o fakeredis, que satura perto de 300
+mensagens/s; mantenha usuários x 3 / janela abaixo disso.
+
+Compara o webhook sem e com a ordem por usuário (ORDEM_ATIVA), reportando:
+- usuários cujas respostas foram gravadas fora da ordem de chegada;
+- vazão total e latência das requisições, para mostrar que a espera é só
+  entre mensagens do mesmo usuário, sem serialização global.
+
+Confere também, direto nas senhas, que uma mensagem do meio que falha antes
+da sua vez não libera a seguinte antes da primeira terminar, e que quem
+esgota a espera dá as anteriores pendentes como perdidas.
+
+Requer `pip install httpx fakeredis[lua]`.
+
+Uso:
+    python benchmarks/ordem_por_usuario.py [--usuarios 10000] [--janela 200]
+"""
+import argparse
+import asyncio
+import logging
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("ID_PROJETO", "benchmark")
+os.environ.setdefault("TWILIO_ACCOUNT_SID", "ACbenchmark")
+os.environ.setdefault("TWILIO_AUTH_TOKEN", "benchmark")
+os.environ.setdefault("TWILIO_WHATSAPP_NUMBER", "whatsapp:+10000000000")
+
+import httpx
+from fakeredis.aioredis import FakeRedis as FakeAsyncRedis
+
+import app.state_machine as state_machine
+import app.webhook as webhook
+from app.config import settings
+from app.main import app
+from app.models import UserState
+from app.services.ordem_service import aguardar_vez_async, chave_ordem, liberar_vez_async, tirar_senha_async
+from app.services.redis_service import carregar_estado_async, chave_estado, get_async_redis_client
+from app.services.twilio_service import get_twilio_client
+
+PERGUNTAS = ["P1", "P2", "P3"]
+
+
+def instalar_stubs(r, args):
+    async def download_stub(media_url):
+        return media_url.encode()
+
+    def transcrever_stub(audio_content):
+        time.sleep(random.uniform(args.stt_min_ms, args.stt_max_ms) / 1000)
+        return "audio"
+
+    class TarefaStub:
+        @staticmethod
+        def delay(*args, **kwargs):
+            return None
+
+    webhook.download_twilio_media_async = download_stub
+    state_machine.tarefa_gerar_feedback = TarefaStub
+    state_machine.tarefa_avaliar_resposta = TarefaStub
+    webhook.transcrever_audio_gcp = transcrever_stub
+    settings.CACHE_TRANSCRICAO_ATIVO = False
+    settings.STT_THREADPOOL_SIZE = 256
+    app.dependency_overrides[get_async_redis_client] = lambda: r
+    app.dependency_overrides[get_twilio_client] = lambda: object()
+
+
+async def preparar_usuarios(r, usuarios):
+    await r.flushall()
+    pipe = r.pipeline(transaction=False)
+    estado = UserState(etapa="aguardando_resposta_1", perguntas=PERGUNTAS)
+    for user_key in usuarios:
+        estado.user_key = user_key
+        gravar, _ = UserState.para_hash(estado.model_dump(exclude={"version"}))
+        pipe.hset(chave_estado(user_key), mapping={**gravar, "version": 1})
+    await pipe.execute()
+
+
+async def rajada(client, user_key, atraso, latencias):
+    await asyncio.sleep(atraso)
+    mensagens = [
+        {"From": user_key, "NumMedia": "1", "MediaUrl0": f"https://api.twilio.com/media/{user_key}"},
+        {"From": user_key, "Body": "texto 1"},
+        {"From": user_key, "Body": "texto 2"},
+    ]
+
+    async def enviar(dados, pausa):
+        await asyncio.sleep(pausa)
+        inicio = time.perf_counter()
+        resposta = await client.post("/webhook/twilio", data=dados)
+        resposta.raise_for_status()
+        latencias.append(time.perf_counter() - inicio)
+
+    await asyncio.gather(*[enviar(dados, i * 0.02) for i, dados in enumerate(mensagens)])
+
+
+async def cenario(client, r, args, ordem_ativa):
+    settings.ORDEM_ATIVA = ordem_ativa
+    usuarios = [f"whatsapp:+5511{i:09d}" for i in range(args.usuarios)]
+    await preparar_usuarios(r, usuarios)
+    latencias = []
+    inicio = time.perf_counter()
+    await asyncio.gather(*[rajada(client, u, random.uniform(0, args.janela), latencias) for u in usuarios])
+    duracao = time.perf_counter() - inicio
+
+    fora_de_ordem = 0
+    for user_key in usuarios:
+        estado = await carregar_estado_async(r, user_key)
+        if estado.respostas != ["audio", "texto 1", "texto 2"]:
+            fora_de_ordem += 1
+    return fora_de_ordem, duracao, sorted(latencias)
+
+
+def relatorio(nome, args, fora_de_ordem, duracao, latencias):
+    def p(q):
+        return latencias[min(len(latencias) - 1, int(len(latencias) * q))] * 1000
+    print(f"\n{nome}")
+    print(f"   🔀 Usuários com respostas fora de ordem: {fora_de_ordem}/{args.usuarios}")
+    print(f"   🚀 Vazão: {len(latencias) / duracao:.0f} msg/s ({len(latencias)} mensagens em {duracao:.1f}s, janela de chegada {args.janela:.0f}s)")
+    print(f"   ⏱️  Latência: p50 {p(0.5):.0f} ms | p99 {p(0.99):.0f} ms | máx {latencias[-1] * 1000:.0f} ms")
+
+
+async def conferir_senha_do_meio_falhando(r):
+    """
+    Senhas 1, 2 e 3 de um usuário: a 2 falha e é liberada enquanto a 1 ainda
+    processa. A 3 deve continuar esperando até a 1 terminar.
+    """
+    settings.ORDEM_ATIVA = True
+    user_key = "whatsapp:+5500000000001"
+    s1, s2, s3 = [await tirar_senha_async(r, user_key) for _ in range(3)]
+    await liberar_vez_async(r, user_key, s2)
+    espera_3 = asyncio.create_task(aguardar_vez_async(r, user_key, s3))
+    await asyncio.sleep(0.3)
+    liberada_antes = espera_3.done()
+    inicio = time.perf_counter()
+    await liberar_vez_async(r, user_key, s1)
+    em_ordem = await espera_3
+    atraso_ms = (time.perf_counter() - inicio) * 1000
+    await liberar_vez_async(r, user_key, s3)
+    vez = await r.hget(chave_ordem(user_key), "vez")
+
+    print("\n🧩 Senha do meio falhando antes da sua vez")
+    print(f"   {'❌' if liberada_antes else '✅'} Senha 3 liberada antes da 1 terminar: {'sim' if liberada_antes else 'não'}")
+    print(f"   {'✅' if em_ordem else '❌'} Senha 3 em ordem após a 1 terminar ({atraso_ms:.0f} ms depois) | vez final: {vez}")
+
+
+async def conferir_senha_perdida(r):
+    """
+    A senha 1 nunca termina: a 2 esgota ORDEM_ESPERA_MAXIMA e dá a 1 como
+    perdida, e a 3 passa a esperar só pela 2.
+    """
+    espera_maxima, settings.ORDEM_ESPERA_MAXIMA = settings.ORDEM_ESPERA_MAXIMA, 0.2
+    user_key = "whatsapp:+5500000000002"
+    _, s2, s3 = [await tirar_senha_async(r, user_key) for _ in range(3)]
+    em_ordem_2 = await aguardar_vez_async(r, user_key, s2)
+    await liberar_vez_async(r, user_key, s2)
+    inicio = time.perf_counter()
+    em_ordem_3 = await aguardar_vez_async(r, user_key, s3)
+    espera_3_ms = (time.perf_counter() - inicio) * 1000
+    settings.ORDEM_ESPERA_MAXIMA = espera_maxima
+
+    print("\n🧩 Senha que nunca termina")
+    print(f"   {'✅' if not em_ordem_2 else '❌'} Senha 2 desistiu de esperar após 0.2s")
+    print(f"   {'✅' if em_ordem_3 else '❌'} Senha 3 em ordem logo após a 2 ({espera_3_ms:.0f} ms de espera)")
+
+
+async def executar(args):
+    logging.disable(logging.CRITICAL)
+    random.seed(7)
+    r = FakeAsyncRedis(decode_responses=True)
+    instalar_stubs(r, args)
+
+    print("📊 ORDEM DE PROCESSAMENTO POR USUÁRIO")
+    print("=" * 50)
+    print(f"👥 {args.usuarios} usuários, rajadas de áudio + 2 textos | STT stub {args.stt_min_ms:.0f}-{args.stt_max_ms:.0f} ms")
+
+    transport = httpx.ASGITransport(app=app)
+    limites = httpx.Limits(max_connections=None)
+    async with httpx.AsyncClient(transport=transport, base_url="http://teste", limits=limites, timeout=None) as client:
+        relatorio("🐢 Sem ordem por usuário", args, *await cenario(client, r, args, ordem_ativa=False))
+        relatorio("✅ Com ordem por usuário (senha no Redis)", args, *await cenario(client, r, args, ordem_ativa=True))
+
+    await conferir_senha_do_meio_falhando(r)
+    await conferir_senha_perdida(r)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Ordem por usuário e vazão do webhook com rajadas de mensagens.")
+    parser.add_argument("--usuarios", type=int, default=10000)
+    parser.add_argument("--janela", type=float, default=200.0)
+    parser.add_argument("--stt-min-ms", type=float, default=50.0)
+    parser.add_argument("--stt-max-ms", type=float, default=300.0)
+    asyncio.run(executar(parser.parse_args()))
@@ -0,0 +1,169 @@
+"""
+Benchmark da camada de resiliência (prazos, hedging e disjuntor) do gcp_service.
+
+Um stub local injeta falhas numa chamada que normalmente leva ~`--latencia-ms`:
+uma fração `--lentas` das chamadas trava por `--travamento-ms` (região lenta)
+e uma fração `--erros` falha na hora. Mede:
+
+1. latência de cauda (p50/p95/p99/máx) chamando o stub direto, como antes,
+   e pela camada de resiliência sem e com hedging;
+2. com o serviço fora do ar (100% de erro), quantas chamadas chegam ao stub
+   antes de o disjuntor abrir e quanto tempo leva para recusar as demais.
+
+Uso:
+    python benchmarks/resiliencia_gcp.py [--chamadas 400] [--concorrencia 8] [--lentas 0.05]
+"""
+import argparse
+import logging
+import os
+import random
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("ID_PROJETO", "benchmark")
+os.environ.setdefault("TWILIO_ACCOUNT_SID", "ACbenchmark")
+os.environ.setdefault("TWILIO_AUTH_TOKEN", "benchmark")
+os.environ.setdefault("TWILIO_WHATSAPP_NUMBER", "whatsapp:+10000000000")
+
+from app.config import settings
+from app.services import gcp_service
+from app.services.gcp_service import CircuitoAbertoError, ResilienciaServico
+
+
+class ServicoComFalhas:
+    """Stub do modelo: latência lognormal, travamentos e erros injetados."""
+
+    def __init__(self, latencia, travamento, frac_lentas, frac_erros):
+        self.latencia = latencia
+        self.travamento = travamento
+        self.frac_lentas = frac_lentas
+        self.frac_erros = frac_erros
+        self.chamadas = 0
+        self.lock = threading.Lock()
+
+    def chamar(self, prazo):
+        with self.lock:
+            self.chamadas += 1
+        sorteio = random.random()
+        if sorteio < self.frac_erros:
+            time.sleep(0.01)
+            raise RuntimeError("503 Service Unavailable")
+        if sorteio < self.frac_erros + self.frac_lentas:
+            time.sleep(min(prazo, self.travamento))
+            if self.travamento > prazo:
+                raise TimeoutError("Deadline Exceeded")
+        else:
+            time.sleep(random.lognormvariate(0, 0.25) * self.latencia)
+        return "ok"
+
+
+def percentis(valores):
+    valores = sorted(valores)
+    def p(q):
+        return valores[min(len(valores) - 1, int(len(valores) * q))] * 1000
+    return f"p50 {p(0.5):.0f} ms | p95 {p(0.95):.0f} ms | p99 {p(0.99):.0f} ms | máx {valores[-1] * 1000:.0f} ms"
+
+
+def medir_sem_camada(args):
+    stub = ServicoComFalhas(args.latencia_ms / 1000, args.travamento_ms / 1000, args.lentas, args.erros)
+    latencias, falhas = [], 0
+
+    def uma_chamada(_):
+        nonlocal falhas
+        inicio = time.monotonic()
+        try:
+            stub.chamar(float("inf"))
+        except Exception:
+            falhas += 1
+        latencias.append(time.monotonic() - inicio)
+
+    with ThreadPoolExecutor(max_workers=args.concorrencia) as executor:
+        list(executor.map(uma_chamada, range(args.chamadas)))
+    return latencias, falhas, stub.chamadas
+
+
+def medir_cauda(args, hedge):
+    settings.GCP_HEDGE_ATIVO = hedge
+    resiliencia = ResilienciaServico(f"stub-{'hedge' if hedge else 'simples'}")
+    stub = ServicoComFalhas(args.latencia_ms / 1000, args.travamento_ms / 1000, args.lentas, args.erros)
+
+    # Aquecimento: alimenta os percentis antes da medição.
+    for _ in range(settings.GCP_AMOSTRAS_MINIMAS * 2):
+        resiliencia.registrar(True, random.lognormvariate(0, 0.25) * stub.latencia)
+
+    latencias, falhas = [], 0
+
+    def uma_chamada(_):
+        nonlocal falhas
+        inicio = time.monotonic()
+        try:
+            resiliencia.executar(stub.chamar)
+        except Exception:
+            falhas += 1
+        latencias.append(time.monotonic() - inicio)
+
+    with ThreadPoolExecutor(max_workers=args.concorrencia) as executor:
+        list(executor.map(uma_chamada, range(args.chamadas)))
+    return latencias, falhas, stub.chamadas
+
+
+def medir_disjuntor(args):
+    resiliencia = ResilienciaServico("stub-fora-do-ar")
+    stub = ServicoComFalhas(args.latencia_ms / 1000, 0, 0, 1.0)
+    recusadas, tempos_recusa = 0, []
+    for _ in range(args.chamadas):
+        inicio = time.monotonic()
+        try:
+            resiliencia.executar(stub.chamar)
+        except CircuitoAbertoError:
+            recusadas += 1
+            tempos_recusa.append(time.monotonic() - inicio)
+        except Exception:
+            pass
+    return recusadas, stub.chamadas, tempos_recusa
+
+
+def executar(args):
+    logging.disable(logging.CRITICAL)
+    gcp_service.get_redis_client = lambda: None
+    settings.GCP_PRAZO_MINIMO = args.prazo_minimo_ms / 1000
+    settings.GCP_PRAZO_MAXIMO = args.travamento_ms / 1000 * 2
+
+    print("📊 RESILIÊNCIA DAS CHAMADAS AO GCP")
+    print("=" * 50)
+    print(f"🧪 Stub: ~{args.latencia_ms:.0f} ms, {args.lentas * 100:.0f}% travando {args.travamento_ms:.0f} ms, "
+          f"{args.erros * 100:.0f}% de erro | {args.chamadas} chamadas, concorrência {args.concorrencia}")
+
+    cenarios = (
+        ("🐌 Chamada direta (sem prazo, sem retry)", lambda: medir_sem_camada(args)),
+        ("🐢 Sem hedging (só prazo e nova tentativa em erro)", lambda: medir_cauda(args, hedge=False)),
+        ("⚡ Com hedging após o p95", lambda: medir_cauda(args, hedge=True)),
+    )
+    for nome, medir in cenarios:
+        latencias, falhas, chamadas_stub = medir()
+        print(f"\n{nome}")
+        print(f"   ⏱️  {percentis(latencias)}")
+        print(f"   ❌ Falhas: {falhas} | 📨 Requisições ao stub: {chamadas_stub} "
+              f"(+{(chamadas_stub / args.chamadas - 1) * 100:.0f}%)")
+
+    recusadas, chamadas_stub, tempos_recusa = medir_disjuntor(args)
+    print("\n🔌 Serviço fora do ar (100% de erro)")
+    print(f"   📨 Requisições que chegaram ao stub: {chamadas_stub} de {args.chamadas} chamadas")
+    print(f"   🚫 Recusadas pelo disjuntor: {recusadas}")
+    if tempos_recusa:
+        print(f"   ⚡ Tempo para recusar: {max(tempos_recusa) * 1000:.2f} ms (máx)")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Latência de cauda com prazos, hedging e disjuntor.")
+    parser.add_argument("--chamadas", type=int, default=400)
+    parser.add_argument("--concorrencia", type=int, default=8)
+    parser.add_argument("--latencia-ms", type=float, default=200.0)
+    parser.add_argument("--travamento-ms", type=float, default=3000.0)
+    parser.add_argument("--prazo-minimo-ms", type=float, default=500.0)
+    parser.add_argument("--lentas", type=float, default=0.05)
+    parser.add_argument("--erros", type=float, default=0.02)
+    executar(parser.parse_args())
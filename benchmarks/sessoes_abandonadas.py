@@ -0,0 +1,113 @@
+"""
+Benchmark de memória do Redis com sessões abandonadas.
+
+Cria N sessões paradas no meio da entrevista (contexto, perguntas e respostas
+transcritas), mede a memória do Redis, executa o arquivamento e mede de novo,
+reportando também o tamanho do arquivo .jsonl.gz gerado.
+
+Com `--redis-url` usa `INFO memory` de um Redis real; com fakeredis
+(`pip install fakeredis[lua]`) reporta apenas o volume de dados gravados.
+
+Uso:
+    python benchmarks/sessoes_abandonadas.py [--sessoes 100000] [--redis-url redis://localhost:6379/15]
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("ID_PROJETO", "benchmark")
+os.environ.setdefault("TWILIO_ACCOUNT_SID", "ACbenchmark")
+os.environ.setdefault("TWILIO_AUTH_TOKEN", "benchmark")
+os.environ.setdefault("TWILIO_WHATSAPP_NUMBER", "whatsapp:+10000000000")
+
+import redis
+
+from app.models import UserState
+from app.services.archive_service import arquivar_sessoes_expirando
+from app.services.redis_service import _argumentos_gravacao, _script_cas, chave_estado
+
+PALAVRAS = (
+    "eu trabalhei em um projeto onde precisei liderar a equipe para entregar "
+    "uma api em python com django e sql dentro do prazo e aprendi muito sobre "
+    "comunicação prioridades e qualidade de código"
+).split()
+
+
+def texto(n_palavras):
+    return " ".join(random.choice(PALAVRAS) for _ in range(n_palavras))
+
+
+def criar_sessao(i):
+    etapa = random.choice(["aguardando_contexto", "preparando_perguntas", "aguardando_resposta_1",
+                           "aguardando_resposta_2", "aguardando_resposta_3", "aguardando_feedback_usuario"])
+    user_state = UserState(user_key=f"whatsapp:+5511{i:09d}", etapa=etapa, last_user_ts=int(time.time()))
+    if etapa != "aguardando_contexto":
+        user_state.contexto = texto(25)
+        user_state.perguntas = [texto(30) for _ in range(3)]
+        n_respostas = {"aguardando_resposta_2": 1, "aguardando_resposta_3": 2, "aguardando_feedback_usuario": 3}.get(etapa, 0)
+        user_state.respostas = [texto(120) for _ in range(n_respostas)]
+    return user_state
+
+
+def memoria(r):
+    try:
+        return r.info("memory")["used_memory"]
+    except Exception:
+        return None
+
+
+def formatar(n_bytes):
+    return "n/d (fakeredis)" if n_bytes is None else f"{n_bytes / 1024 / 1024:.1f} MB"
+
+
+def executar(args):
+    if args.redis_url:
+        r = redis.Redis.from_url(args.redis_url, decode_responses=True)
+        r.flushdb()
+    else:
+        import fakeredis
+        r = fakeredis.FakeRedis(decode_responses=True)
+
+    memoria_inicial = memoria(r)
+    script = _script_cas(r)
+    bytes_gravados = 0
+
+    inicio = time.perf_counter()
+    for lote_inicio in range(0, args.sessoes, 1000):
+        pipe = r.pipeline(transaction=False)
+        for i in range(lote_inicio, min(lote_inicio + 1000, args.sessoes)):
+            user_state = criar_sessao(i)
+            argumentos = _argumentos_gravacao(user_state.user_key, None, user_state, 0)
+            bytes_gravados += sum(len(str(a).encode()) for a in argumentos)
+            script(keys=[chave_estado(user_state.user_key)], args=argumentos, client=pipe)
+        pipe.execute()
+    duracao_carga = time.perf_counter() - inicio
+    memoria_com_sessoes = memoria(r)
+
+    with tempfile.TemporaryDirectory() as diretorio:
+        inicio = time.perf_counter()
+        arquivadas = arquivar_sessoes_expirando(r, antecedencia=10 ** 9, diretorio=diretorio)
+        duracao_arquivo = time.perf_counter() - inicio
+        tamanho_arquivo = sum(os.path.getsize(os.path.join(diretorio, f)) for f in os.listdir(diretorio))
+    memoria_final = memoria(r)
+
+    print("📊 SESSÕES ABANDONADAS E ARQUIVAMENTO")
+    print("=" * 50)
+    print(f"🧪 Sessões criadas: {args.sessoes} em {duracao_carga:.1f}s ({bytes_gravados / 1024 / 1024:.1f} MB enviados)")
+    print(f"💾 Memória inicial: {formatar(memoria_inicial)}")
+    print(f"💾 Memória com sessões (sem TTL seriam permanentes): {formatar(memoria_com_sessoes)}")
+    print(f"📦 Sessões arquivadas: {arquivadas} em {duracao_arquivo:.1f}s")
+    print(f"📦 Arquivo compactado: {tamanho_arquivo / 1024 / 1024:.1f} MB")
+    print(f"💾 Memória após arquivamento: {formatar(memoria_final)}")
+    print(f"🔑 Chaves restantes: {r.dbsize()}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Memória do Redis com sessões abandonadas.")
+    parser.add_argument("--sessoes", type=int, default=100_000)
+    parser.add_argument("--redis-url", default=None)
+    executar(parser.parse_args())
@@ -0,0 +1,119 @@
+"""
+Teste de carga do webhook contra stubs locais.
+
+Sobe a aplicação FastAPI em processo (via httpx.ASGITransport), substitui Redis,
+download de mídia, Speech-to-Text e Celery por stubs com latência simulada e mede a
+latência (p50/p99) de mensagens de texto enquanto áudios lentos estão em
+processamento concorrente.
+
+Requer `pip install httpx fakeredis[lua]` (o Redis em memória executa os
+scripts Lua do armazenamento de estado).
+
+Uso:
+    python benchmarks/teste_carga.py [--textos 500] [--audios 50] [--latencia-stt 2.0]
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import time
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, RAIZ)
+os.environ.setdefault("ID_PROJETO", "benchmark")
+os.environ.setdefault("TWILIO_ACCOUNT_SID", "ACbenchmark")
+os.environ.setdefault("TWILIO_AUTH_TOKEN", "benchmark")
+os.environ.setdefault("TWILIO_WHATSAPP_NUMBER", "whatsapp:+10000000000")
+
+import httpx
+from fakeredis.aioredis import FakeRedis as FakeAsyncRedis
+
+import app.state_machine as state_machine
+import app.webhook as webhook
+from app.main import app
+from app.services.redis_service import get_async_redis_client
+from app.services.twilio_service import get_twilio_client
+
+
+def instalar_stubs(latencia_download, latencia_stt):
+    """Substitui as dependências externas do webhook por stubs com latência."""
+    fake_redis = FakeAsyncRedis(decode_responses=True)
+
+    async def download_stub(media_url):
+        await asyncio.sleep(latencia_download)
+        return b"OggS" + b"\x00" * 4096
+
+    def transcrever_stub(audio_content):
+        time.sleep(latencia_stt)
+        return "Minha resposta em áudio para a pergunta."
+
+    class TarefaStub:
+        @staticmethod
+        def delay(*args, **kwargs):
+            return None
+
+    webhook.download_twilio_media_async = download_stub
+    webhook.transcrever_audio_gcp = transcrever_stub
+    state_machine.tarefa_gerar_perguntas = TarefaStub
+    state_machine.tarefa_gerar_feedback = TarefaStub
+    app.dependency_overrides[get_async_redis_client] = lambda: fake_redis
+    app.dependency_overrides[get_twilio_client] = lambda: object()
+
+
+async def enviar(client, dados):
+    inicio = time.perf_counter()
+    response = await client.post("/webhook/twilio", data=dados)
+    response.raise_for_status()
+    return time.perf_counter() - inicio
+
+
+def percentil(valores, p):
+    ordenados = sorted(valores)
+    indice = min(len(ordenados) - 1, int(round(p / 100 * (len(ordenados) - 1))))
+    return ordenados[indice]
+
+
+async def executar(args):
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://teste") as client:
+        audios = [
+            asyncio.create_task(enviar(client, {
+                "From": f"whatsapp:+55119000{i:05d}",
+                "NumMedia": "1",
+                "MediaUrl0": f"https://api.twilio.com/media/{i}",
+            }))
+            for i in range(args.audios)
+        ]
+        await asyncio.sleep(0.05)
+
+        textos = [
+            asyncio.create_task(enviar(client, {
+                "From": f"whatsapp:+55118000{i:05d}",
+                "Body": "dev python júnior, django, sql",
+            }))
+            for i in range(args.textos)
+        ]
+        latencias_texto = await asyncio.gather(*textos)
+        latencias_audio = await asyncio.gather(*audios)
+
+    print("📊 RESULTADO DO TESTE DE CARGA")
+    print("=" * 50)
+    print(f"🎙️  Áudios concorrentes: {args.audios} (STT simulado: {args.latencia_stt:.2f}s)")
+    print(f"💬 Mensagens de texto: {args.textos}")
+    print(f"⏱️  Texto p50: {percentil(latencias_texto, 50) * 1000:.1f} ms")
+    print(f"⏱️  Texto p99: {percentil(latencias_texto, 99) * 1000:.1f} ms")
+    print(f"⏱️  Texto média: {statistics.mean(latencias_texto) * 1000:.1f} ms")
+    print(f"⏱️  Áudio p50: {percentil(latencias_audio, 50) * 1000:.1f} ms")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Teste de carga do webhook com stubs locais.")
+    parser.add_argument("--textos", type=int, default=500)
+    parser.add_argument("--audios", type=int, default=50)
+    parser.add_argument("--latencia-download", type=float, default=0.3)
+    parser.add_argument("--latencia-stt", type=float, default=2.0)
+    args = parser.parse_args()
+
+    instalar_stubs(args.latencia_download, args.latencia_stt)
+    asyncio.run(executar(args))
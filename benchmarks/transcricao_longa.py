@@ -0,0 +1,116 @@
+"""
+Benchmark do pré-processamento de áudio e da transcrição de notas de voz longas.
+
+Gera notas de voz Ogg Opus sintéticas (falas de 2 a 8 s separadas por pausas,
+com silêncio no começo e no fim) de 10 s a 5 min e as transcreve com um
+reconhecedor stub local que, como o `recognize` síncrono do Google, recusa
+áudios acima de 60 s e demora `--base-ms` + `--fator` x a duração do áudio.
+
+Compara o fluxo antigo (áudio inteiro numa única chamada) com
+`transcrever_audio_gcp` (aparar silêncio, dividir e transcrever os trechos
+em paralelo), reportando latência ponta a ponta e se a transcrição saiu.
+
+Uso:
+    python benchmarks/transcricao_longa.py [--base-ms 300] [--fator 0.1]
+"""
+import argparse
+import logging
+import os
+import random
+import struct
+import sys
+import time
+from types import SimpleNamespace
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("ID_PROJETO", "benchmark")
+os.environ.setdefault("TWILIO_ACCOUNT_SID", "ACbenchmark")
+os.environ.setdefault("TWILIO_AUTH_TOKEN", "benchmark")
+os.environ.setdefault("TWILIO_WHATSAPP_NUMBER", "whatsapp:+10000000000")
+
+from app.services import gcp_service
+from app.services.audio_service import escrever_ogg_opus, inspecionar_audio
+
+# SILK banda larga, 20 ms por pacote, um quadro (RFC 6716, tabela 2).
+TOC_SILK_20MS = 9 << 3
+CABECALHO = b"OpusHead" + struct.pack("<BBHIhB", 1, 1, 312, 16000, 0, 0)
+TAGS = b"OpusTags" + struct.pack("<I", 9) + b"benchmark" + struct.pack("<I", 0)
+
+
+def gerar_nota_de_voz(duracao, rng):
+    """Nota de voz sintética: pacotes de fala (40-70 bytes) e de silêncio (2 bytes)."""
+    pacotes = []
+
+    def silencio(segundos):
+        pacotes.extend(bytes([TOC_SILK_20MS, 0]) for _ in range(int(segundos * 50)))
+
+    def fala(segundos):
+        pacotes.extend(bytes([TOC_SILK_20MS]) + rng.randbytes(rng.randint(40, 70)) for _ in range(int(segundos * 50)))
+
+    silencio(1.5)
+    while len(pacotes) / 50 < duracao - 2:
+        fala(min(rng.uniform(2, 8), duracao - 2 - len(pacotes) / 50))
+        silencio(rng.uniform(0.3, 1.5))
+    silencio(max(0, duracao - len(pacotes) / 50))
+    return escrever_ogg_opus(CABECALHO, TAGS, pacotes)
+
+
+class ReconhecedorStub:
+    """Imita o `recognize` síncrono: recusa mais de 60 s e demora proporcionalmente à duração."""
+
+    def __init__(self, base, fator):
+        self.base = base
+        self.fator = fator
+
+    def recognize(self, config, audio, timeout=None):
+        info = inspecionar_audio(audio.content)
+        if info is None:
+            raise ValueError("Áudio inválido.")
+        if info.duracao > 60:
+            raise ValueError("400 Sync input too long. For audio longer than 1 min use LongRunningRecognize.")
+        time.sleep(self.base + self.fator * info.duracao)
+        alternativa = SimpleNamespace(transcript=f"[{info.duracao:.0f}s]")
+        return SimpleNamespace(results=[SimpleNamespace(alternatives=[alternativa])])
+
+
+def fluxo_antigo(reconhecedor, conteudo):
+    audio = gcp_service.speech.RecognitionAudio(content=conteudo)
+    try:
+        resposta = reconhecedor.recognize(config=None, audio=audio)
+        return resposta.results[0].alternatives[0].transcript
+    except ValueError:
+        return ""
+
+
+def executar(args):
+    logging.disable(logging.CRITICAL)
+    rng = random.Random(3)
+    reconhecedor = ReconhecedorStub(args.base_ms / 1000, args.fator)
+    gcp_service.get_speech_client = lambda: reconhecedor
+    gcp_service.get_redis_client = lambda: None
+
+    print("📊 TRANSCRIÇÃO DE NOTAS DE VOZ LONGAS")
+    print("=" * 50)
+    print(f"🧪 Stub: {args.base_ms:.0f} ms + {args.fator} x duração, recusa acima de 60 s")
+    for duracao in (10, 30, 60, 120, 300):
+        conteudo = gerar_nota_de_voz(duracao, rng)
+        info = inspecionar_audio(conteudo)
+
+        inicio = time.perf_counter()
+        antigo = fluxo_antigo(reconhecedor, conteudo)
+        tempo_antigo = time.perf_counter() - inicio
+
+        inicio = time.perf_counter()
+        novo = gcp_service.transcrever_audio_gcp(conteudo)
+        tempo_novo = time.perf_counter() - inicio
+
+        print(f"\n🎙️  {duracao} s ({len(conteudo) / 1024:.0f} KB, {info.duracao:.0f} s decodificáveis)")
+        print(f"   🐢 Chamada única: {tempo_antigo * 1000:.0f} ms {'✅' if antigo else '❌ recusado'}")
+        print(f"   ⚡ Pipeline: {tempo_novo * 1000:.0f} ms {'✅' if novo else '❌'} trechos: {novo}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Latência de transcrição de notas de voz longas.")
+    parser.add_argument("--base-ms", type=float, default=300.0)
+    parser.add_argument("--fator", type=float, default=0.1)
+    executar(parser.parse_args())
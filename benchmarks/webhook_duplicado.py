@@ -0,0 +1,133 @@
+"""
+Verificação da idempotência do webhook por MessageSid.
+
+Coloca um usuário na última pergunta da entrevista e reenvia a MESMA entrega
+do webhook (mesmo MessageSid) `--replays` vezes em paralelo, como a Twilio faz
+quando a resposta demora. Verifica que houve exatamente uma transição de
+estado e um disparo da task de feedback, e que todas as entregas receberam o
+mesmo TwiML. Para comparação, repete o envio sem MessageSid (comportamento
+antigo, sem deduplicação).
+
+Requer `pip install httpx fakeredis[lua]`. Sai com código 1 se a verificação falhar.
+
+Uso:
+    python benchmarks/webhook_duplicado.py [--replays 50] [--latencia-disparo 0.2]
+"""
+import argparse
+import asyncio
+import logging
+import os
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("ID_PROJETO", "benchmark")
+os.environ.setdefault("TWILIO_ACCOUNT_SID", "ACbenchmark")
+os.environ.setdefault("TWILIO_AUTH_TOKEN", "benchmark")
+os.environ.setdefault("TWILIO_WHATSAPP_NUMBER", "whatsapp:+10000000000")
+
+import httpx
+from fakeredis.aioredis import FakeRedis as FakeAsyncRedis
+
+import app.state_machine as state_machine
+from app.main import app
+from app.models import UserState
+from app.services.redis_service import atualizar_estado_async, carregar_estado_async, get_async_redis_client
+from app.services.twilio_service import get_twilio_client
+
+USER_KEY = "whatsapp:+5511999990000"
+
+
+class TarefaStub:
+    """Conta os disparos; a latência alarga a janela em que as retentativas chegam."""
+
+    def __init__(self, latencia):
+        self.latencia = latencia
+        self.disparos = 0
+        self.lock = threading.Lock()
+
+    def delay(self, *args, **kwargs):
+        time.sleep(self.latencia)
+        with self.lock:
+            self.disparos += 1
+
+
+async def preparar_usuario(r):
+    await r.flushall()
+
+    def mutador(_):
+        return UserState(
+            user_key=USER_KEY,
+            etapa="aguardando_resposta_3",
+            perguntas=["P1", "P2", "P3"],
+            respostas=["R1", "R2"],
+        ), None
+
+    estado, _ = await atualizar_estado_async(r, USER_KEY, mutador)
+    return estado.version
+
+
+async def reenviar(client, replays, message_sid):
+    dados = {"From": USER_KEY, "Body": "Minha última resposta."}
+    if message_sid:
+        dados["MessageSid"] = message_sid
+    respostas = await asyncio.gather(*[client.post("/webhook/twilio", data=dados) for _ in range(replays)])
+    for resposta in respostas:
+        resposta.raise_for_status()
+    return [resposta.text for resposta in respostas]
+
+
+async def cenario(client, r, tarefa, replays, message_sid):
+    versao_inicial = await preparar_usuario(r)
+    tarefa.disparos = 0
+    inicio = time.perf_counter()
+    corpos = await reenviar(client, replays, message_sid)
+    duracao = time.perf_counter() - inicio
+    estado = await carregar_estado_async(r, USER_KEY)
+    return {
+        "transicoes": estado.version - versao_inicial,
+        "respostas": len(estado.respostas),
+        "disparos": tarefa.disparos,
+        "twimls_distintos": len(set(corpos)),
+        "duracao": duracao,
+    }
+
+
+def relatorio(nome, resultado):
+    print(f"\n{nome}")
+    print(f"   🔁 Transições de estado: {resultado['transicoes']} | 📝 Respostas gravadas: {resultado['respostas']}")
+    print(f"   🚀 Disparos da task de feedback: {resultado['disparos']}")
+    print(f"   📄 TwiMLs distintos devolvidos: {resultado['twimls_distintos']}")
+    print(f"   ⏱️  Tempo total: {resultado['duracao'] * 1000:.0f} ms")
+
+
+async def executar(args):
+    logging.disable(logging.CRITICAL)
+    r = FakeAsyncRedis(decode_responses=True)
+    tarefa = TarefaStub(args.latencia_disparo)
+    state_machine.tarefa_gerar_feedback = tarefa
+    app.dependency_overrides[get_async_redis_client] = lambda: r
+    app.dependency_overrides[get_twilio_client] = lambda: object()
+
+    print("📊 IDEMPOTÊNCIA DO WEBHOOK")
+    print("=" * 50)
+    print(f"🔁 {args.replays} entregas simultâneas da mesma mensagem (última resposta da entrevista)")
+
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://teste") as client:
+        antigo = await cenario(client, r, tarefa, args.replays, None)
+        relatorio("🐢 Sem MessageSid (sem deduplicação)", antigo)
+        novo = await cenario(client, r, tarefa, args.replays, "SM" + "0" * 32)
+        relatorio("✅ Com MessageSid (SET NX)", novo)
+
+    ok = novo["transicoes"] == 1 and novo["respostas"] == 3 and novo["disparos"] == 1 and novo["twimls_distintos"] == 1
+    print(f"\n{'✅ Exatamente uma transição e um disparo' if ok else '❌ Entregas duplicadas foram processadas'}")
+    return ok
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Reenvia a mesma entrega do webhook em paralelo e verifica a deduplicação.")
+    parser.add_argument("--replays", type=int, default=50)
+    parser.add_argument("--latencia-disparo", type=float, default=0.2)
+    sys.exit(0 if asyncio.run(executar(parser.parse_args())) else 1)